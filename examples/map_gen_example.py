@@ -47,7 +47,7 @@ if __name__ == "__main__":
     )
 
     # destroy the saved map info created for this example
-    shutil.rmtree(map_info_path)
+    os.remove(map_info_path)
     if len(os.listdir(map_info_root)) == 0:
         shutil.rmtree(map_info_root)
 
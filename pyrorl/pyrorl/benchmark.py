@@ -0,0 +1,371 @@
+"""
+Benchmarks of map generation, resets, steps, rollouts and rendering over a
+matrix of map settings
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import numpy as np
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+import torch
+import tracemalloc
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+from pyrorl.map_helpers.create_map_info import generate_map_info
+
+# Version of the results file layout
+RESULTS_VERSION = 1
+
+# Whether a larger value of each metric is better (True) or worse (False)
+METRICS = {
+    "map_generation_seconds": False,
+    "reset_seconds": False,
+    "steps_per_second": True,
+    "rollout_steps_per_second": True,
+    "memory_bytes": False,
+    "render_seconds": False,
+    "gif_seconds": False,
+}
+
+# Default matrix of settings
+GRID_SIZES = [10, 50, 200]
+POPULATED_AREAS = [5, 20]
+PATHS = [1, 3]
+WINDS = ["none", "10:0.785"]
+BATCH_SIZES = [1, 16]
+
+
+class BenchmarkCase(NamedTuple):
+    """
+    The settings of a single benchmark.
+    - grid_size is the number of rows and columns of the map
+    - num_populated_areas and num_paths_mean are passed to generate_map_info
+    - wind is "none" or "speed:angle", with the angle in radians
+    - batch_size is the number of copies simulated at once by a rollout
+    """
+
+    grid_size: int
+    num_populated_areas: int
+    num_paths_mean: int
+    wind: str
+    batch_size: int
+
+
+def parse_wind(wind: str) -> Dict[str, Optional[float]]:
+    """
+    Turn a wind setting into the wind_speed and wind_angle of an environment.
+    """
+    if wind == "none":
+        return {"wind_speed": None, "wind_angle": None}
+    try:
+        speed, angle = wind.split(":")
+        return {"wind_speed": float(speed), "wind_angle": float(angle)}
+    except ValueError:
+        raise ValueError("Wind must be 'none' or 'speed:angle'!")
+
+
+def benchmark_cases(
+    grid_sizes: Sequence[int] = GRID_SIZES,
+    populated_areas: Sequence[int] = POPULATED_AREAS,
+    paths: Sequence[int] = PATHS,
+    winds: Sequence[str] = WINDS,
+    batch_sizes: Sequence[int] = BATCH_SIZES,
+) -> List[BenchmarkCase]:
+    """
+    Get every combination of the settings, leaving out maps with more
+    populated areas than cells away from the border.
+    """
+    for wind in winds:
+        parse_wind(wind)
+    return [
+        BenchmarkCase(*case)
+        for case in itertools.product(
+            grid_sizes, populated_areas, paths, winds, batch_sizes
+        )
+        if case[1] <= (case[0] - 2) ** 2
+    ]
+
+
+def time_calls(function: Callable[[], object], repeats: int) -> float:
+    """
+    Get the median time (in seconds) of calling a function repeats times.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+@contextlib.contextmanager
+def _scratch_directory() -> Iterator[str]:
+    """
+    Run in a temporary working directory, since environments write their
+    screenshots and GIFs to the working directory.
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(cwd)
+
+
+def run_case(
+    case: BenchmarkCase,
+    num_steps: int = 20,
+    repeats: int = 3,
+    render: bool = False,
+    seed: int = 0,
+) -> Dict[str, float]:
+    """
+    Measure a single case. Every environment is built from the same seed, so
+    runs are comparable. Rendering (and GIF generation) is only measured if
+    render is set, with Pygame drawing off screen.
+    """
+    # Imported here so that Pygame is only loaded when benchmarking
+    from pyrorl.envs import WildfireEvacuationEnv
+
+    def seed_everything():
+        random.seed(seed)
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+
+    seed_everything()
+    map_info = generate_map_info(
+        case.grid_size,
+        case.grid_size,
+        case.num_populated_areas,
+        save_map=False,
+        num_paths_mean=case.num_paths_mean,
+        seed=seed,
+    )
+    metrics = {
+        "map_generation_seconds": time_calls(
+            lambda: generate_map_info(
+                case.grid_size,
+                case.grid_size,
+                case.num_populated_areas,
+                save_map=False,
+                num_paths_mean=case.num_paths_mean,
+                seed=seed,
+            ),
+            repeats,
+        )
+    }
+
+    def make_env() -> WildfireEvacuationEnv:
+        return WildfireEvacuationEnv(
+            case.grid_size,
+            case.grid_size,
+            *map_info,
+            skip=True,
+            **parse_wind(case.wind),
+        )
+
+    # Memory kept alive by a single environment after a reset
+    seed_everything()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    env = make_env()
+    env.reset()
+    metrics["memory_bytes"] = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    seed_everything()
+    metrics["reset_seconds"] = time_calls(env.reset, repeats)
+
+    # Steps cycle through the actions, so evacuations are part of the cost
+    num_actions = env.action_space.n
+
+    def run_steps():
+        env.reset()
+        for step in range(num_steps):
+            env.step(step % num_actions)
+
+    seed_everything()
+    metrics["steps_per_second"] = num_steps / time_calls(run_steps, repeats)
+
+    seed_everything()
+    env.reset()
+    world = env.fire_env
+    metrics["rollout_steps_per_second"] = (
+        case.batch_size
+        * num_steps
+        / time_calls(lambda: world.rollout(None, num_steps, n=case.batch_size), repeats)
+    )
+
+    if render:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        seed_everything()
+        env.reset()
+
+        render_times = []
+        for _ in range(num_steps):
+            env.step(num_actions - 1)
+            render_times.append(time_calls(env.render, 1))
+        metrics["render_seconds"] = statistics.median(render_times)
+        metrics["gif_seconds"] = time_calls(env.generate_gif, 1)
+        env.close()
+    return metrics
+
+
+def run_benchmarks(
+    cases: Sequence[BenchmarkCase],
+    num_steps: int = 20,
+    repeats: int = 3,
+    render: bool = False,
+    seed: int = 0,
+    log: Optional[Callable[[str], None]] = None,
+) -> dict:
+    """
+    Measure every case and collect the results, along with the settings and
+    the versions they were measured with.
+    """
+    results = []
+    with _scratch_directory():
+        for case in cases:
+            metrics = run_case(case, num_steps, repeats, render, seed)
+            results.append({"case": case._asdict(), "metrics": metrics})
+            if log is not None:
+                log(format_result(results[-1]))
+    return {
+        "version": RESULTS_VERSION,
+        "settings": {
+            "num_steps": num_steps,
+            "repeats": repeats,
+            "render": render,
+            "seed": seed,
+        },
+        "platform": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "numpy": np.__version__,
+            "torch": torch.__version__,
+        },
+        "results": results,
+    }
+
+
+def format_result(result: dict) -> str:
+    """
+    Describe the result of a single case in one line.
+    """
+    case = ", ".join(key + "=" + str(value) for key, value in result["case"].items())
+    metrics = ", ".join(
+        key + "=" + format(value, ".4g") for key, value in result["metrics"].items()
+    )
+    return case + ": " + metrics
+
+
+def compare_results(results: dict, baseline: dict, threshold: float = 0.2) -> List[str]:
+    """
+    Find the metrics of every case in results that are more than threshold
+    (as a fraction) worse than the same case in the baseline. Cases or metrics
+    that the baseline does not have are skipped.
+    """
+    if threshold < 0:
+        raise ValueError("Regression threshold cannot be negative!")
+    if baseline.get("version") != RESULTS_VERSION:
+        raise ValueError("Baseline was saved by another version of the benchmarks!")
+
+    baseline_metrics = {
+        tuple(sorted(result["case"].items())): result["metrics"]
+        for result in baseline["results"]
+    }
+    regressions = []
+    for result in results["results"]:
+        expected = baseline_metrics.get(tuple(sorted(result["case"].items())))
+        if expected is None:
+            continue
+        for metric, value in result["metrics"].items():
+            if metric not in expected or expected[metric] <= 0:
+                continue
+            if METRICS[metric]:
+                change = 1 - value / expected[metric]
+            else:
+                change = value / expected[metric] - 1
+            if change > threshold:
+                regressions.append(
+                    format_result({"case": result["case"], "metrics": {}})
+                    + metric
+                    + " is "
+                    + format(change, ".0%")
+                    + " worse ("
+                    + format(value, ".4g")
+                    + " vs "
+                    + format(expected[metric], ".4g")
+                    + ")"
+                )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point for running the benchmarks. Returns 1 if a
+    metric regressed against the baseline.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark PyroRL environments.")
+    parser.add_argument("--output", help="where to save the results as JSON")
+    parser.add_argument("--baseline", help="results to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="fraction by which a metric may be worse than the baseline",
+    )
+    parser.add_argument("--grid-sizes", type=int, nargs="+", default=GRID_SIZES)
+    parser.add_argument(
+        "--populated-areas", type=int, nargs="+", default=POPULATED_AREAS
+    )
+    parser.add_argument("--paths", type=int, nargs="+", default=PATHS)
+    parser.add_argument(
+        "--winds", nargs="+", default=WINDS, help="'none' or 'speed:angle'"
+    )
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--render", action="store_true", help="also time rendering")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.steps < 1 or args.repeats < 1:
+        parser.error("steps and repeats must be positive")
+
+    # Load the baseline first, so a bad baseline fails before the long run
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    cases = benchmark_cases(
+        args.grid_sizes, args.populated_areas, args.paths, args.winds, args.batch_sizes
+    )
+    results = run_benchmarks(
+        cases, args.steps, args.repeats, args.render, args.seed, log=print
+    )
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Saved results to " + args.output)
+
+    if baseline is not None:
+        regressions = compare_results(results, baseline, args.threshold)
+        for regression in regressions:
+            print("Regression: " + regression)
+        if len(regressions) > 0:
+            return 1
+        print("No regressions against " + args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
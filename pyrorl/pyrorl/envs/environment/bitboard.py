@@ -0,0 +1,153 @@
+"""
+Bit-packed fire propagation for fire masks shared by every cell.
+"""
+
+import numpy as np
+import torch
+from typing import List, Tuple
+
+# Number of cells packed into a word
+WORD_BITS = 64
+
+
+def pack_fire(fire: np.ndarray) -> np.ndarray:
+    """
+    Pack the rows of a (..., n, m) fire layer into (..., n, words) uint64 words,
+    with column c in bit c % 64 of word c // 64. Bits past the last column are 0.
+    """
+    burning = fire == 1
+    num_words = -(-burning.shape[-1] // WORD_BITS)
+    packed = np.packbits(burning, axis=-1, bitorder="little")
+    padding = [(0, 0)] * (packed.ndim - 1) + [(0, num_words * 8 - packed.shape[-1])]
+    return np.ascontiguousarray(np.pad(packed, padding)).view("<u8")
+
+
+def shift_board(board: np.ndarray, row_offset: int, col_offset: int) -> np.ndarray:
+    """
+    Shift a packed board so that each cell holds the bit of the cell row_offset
+    rows and col_offset columns away from it, with zeros beyond the grid.
+    """
+    shifted = np.zeros_like(board)
+    num_rows = board.shape[-2]
+    if abs(row_offset) >= num_rows:
+        return shifted
+    if row_offset >= 0:
+        shifted[..., : num_rows - row_offset, :] = board[..., row_offset:, :]
+    else:
+        shifted[..., -row_offset:, :] = board[..., : num_rows + row_offset, :]
+
+    # Shift bits across word boundaries, carrying from the neighboring word
+    if col_offset > 0:
+        carry = np.zeros_like(shifted)
+        carry[..., :-1] = shifted[..., 1:] << np.uint64(WORD_BITS - col_offset)
+        shifted = (shifted >> np.uint64(col_offset)) | carry
+    elif col_offset < 0:
+        carry = np.zeros_like(shifted)
+        carry[..., 1:] = shifted[..., :-1] >> np.uint64(WORD_BITS + col_offset)
+        shifted = (shifted << np.uint64(-col_offset)) | carry
+    return shifted
+
+
+class BitboardPropagator:
+    """
+    Samples fire spread from a (k * k, 1) fire mask using bit-packed fire
+    layers. Neighbors with the same probability of spreading (without wind,
+    those at the same distance) form a group, so a cell's chance of igniting
+    only depends on how many burning neighbors it has in each group. These
+    counts are added up with bitwise adders 64 cells at a time, and random
+    numbers are only drawn for cells next to the fire.
+    """
+
+    def __init__(self, fire_mask: torch.Tensor):
+        """
+        Group the neighbors of the mask by their probability of not spreading.
+        """
+        if fire_mask.shape[1] != 1:
+            raise ValueError("Bitboard propagation needs a shared fire mask!")
+        mask = fire_mask.numpy().astype(np.float64).reshape(-1)
+        self.kernel_size = int(round(np.sqrt(len(mask))))
+        radius = self.kernel_size // 2
+        offsets = [
+            (row - radius, col - radius)
+            for row in range(self.kernel_size)
+            for col in range(self.kernel_size)
+        ]
+
+        # Neighbors that never spread fire are left out
+        spreading = np.flatnonzero(mask < 1)
+        values, groups = np.unique(mask[spreading], return_inverse=True)
+        self.groups: List[List[Tuple[int, int]]] = [
+            [offsets[i] for i in spreading[groups == g]] for g in range(len(values))
+        ]
+
+        # Probability of no group member spreading, by number burning
+        self.survival_tables = [
+            values[g] ** np.arange(len(group) + 1)
+            for g, group in enumerate(self.groups)
+        ]
+
+    def count_planes(self, board: np.ndarray) -> List[List[np.ndarray]]:
+        """
+        Count the burning neighbors of every cell in each group, as bit planes:
+        bit i of a cell's count is held in the i-th plane of its group.
+        """
+        counts = []
+        for group in self.groups:
+            planes: List[np.ndarray] = []
+            for row_offset, col_offset in group:
+                carry = shift_board(board, row_offset, col_offset)
+                # Ripple-carry addition of one bit to every cell at once
+                for i in range(len(planes)):
+                    planes[i], carry = planes[i] ^ carry, planes[i] & carry
+                planes.append(carry)
+            counts.append(planes)
+        return counts
+
+    def survival(self, counts: List[List[np.ndarray]], cells: tuple) -> np.ndarray:
+        """
+        Look up the probability that none of the burning neighbors of each of the
+        given cells (an index into the unpacked grid) spreads to it.
+        """
+        words = cells[:-1] + (cells[-1] // WORD_BITS,)
+        bits = (cells[-1] % WORD_BITS).astype(np.uint64)
+        survival = np.ones(len(cells[-1]))
+        for planes, table in zip(counts, self.survival_tables):
+            count = np.zeros(len(cells[-1]), dtype=np.int64)
+            for i, plane in enumerate(planes):
+                count |= ((plane[words] >> bits) & np.uint64(1)).astype(np.int64) << i
+            survival *= table[count]
+        return survival
+
+    def ignition_probability(self, fire: np.ndarray) -> np.ndarray:
+        """
+        Compute the probability of every cell igniting, like ignition_probability
+        does for the dense mask.
+        """
+        counts = self.count_planes(pack_fire(fire))
+        cells = np.nonzero(np.ones(fire.shape, dtype=bool))
+        return (1 - self.survival(counts, cells)).reshape(fire.shape)
+
+    def ignite(self, fire: np.ndarray):
+        """
+        Sample which cells are ignited by their burning neighbors and set them
+        on fire, in place, for a single (n, m) fire layer or a (batch, n, m)
+        stack of them.
+        """
+        board = pack_fire(fire)
+        counts = self.count_planes(board)
+
+        # Only cells with a burning neighbor can ignite
+        exposed = np.zeros_like(board)
+        for planes in counts:
+            for plane in planes:
+                exposed |= plane
+        exposed &= ~board
+        if not exposed.any():
+            return
+        exposed = np.unpackbits(exposed.view(np.uint8), axis=-1, bitorder="little")
+        cells = np.nonzero(exposed[..., : fire.shape[-1]])
+
+        probability = 1 - self.survival(counts, cells)
+        ignites = torch.rand(len(probability), dtype=torch.float64).numpy()
+        ignites = ignites < probability
+        fire[tuple(index[ignites] for index in cells)] = 1
@@ -2,13 +2,45 @@
 Environment for Wildfire Spread
 """
 
+import copy
 import numpy as np
 import random
 import torch
-from typing import Optional, Any, Tuple, Dict, List
+from typing import (
+    Optional,
+    Any,
+    Callable,
+    Tuple,
+    Dict,
+    List,
+    NamedTuple,
+    Sequence,
+    Union,
+)
 
 # For wind bias
-from .environment_constant import set_fire_mask, linear_wind_transform
+from .environment_constant import (
+    DEFAULT_KERNEL_SIZE,
+    check_kernel_size,
+    set_fire_mask,
+    linear_wind_transform,
+    slope_fire_mask,
+    wind_scaling,
+    kernel_class_kernels,
+    fuel_type_fire_mask,
+    fuel_type_log_weights,
+)
+from .propagation import (
+    ignition_probability,
+    class_ignition_probability,
+    expected_ignition_probability,
+)
+from .spotting import SpottingModel, check_spotting_model, sample_embers
+from .bitboard import BitboardPropagator
+from .incremental import IncrementalPropagator
+from .strategy import AutoPropagator
+from .instrumentation import StepStats, time_phase
+from pyrorl.map_helpers.raster import RasterSource, Window
 
 """
 Indices corresponding to each layer of state
@@ -19,6 +51,48 @@ POPULATED_INDEX = 2
 EVACUATING_INDEX = 3
 PATHS_INDEX = 4
 
+# Number of timesteps after which the simulation terminates
+EPISODE_LENGTH = 100
+
+# Size of the tiles fuel is loaded in when it comes from a raster without tiles
+FUEL_TILE_SIZE = 64
+
+# Summaries that can be requested from FireWorld.rollout
+ROLLOUT_SUMMARIES = ("returns", "burned_populations", "evacuated", "final_state")
+
+# Engines that can sample ignitions, and the propagators behind all but "dense"
+PROPAGATION_ENGINES = ("dense", "bitboard", "incremental", "auto")
+Propagator = Union[BitboardPropagator, IncrementalPropagator, AutoPropagator]
+
+
+class FuelType(NamedTuple):
+    """
+    How cells of one fuel type burn: the rate used in the fire mask when fire
+    spreads into them, and the distribution of their fuel (how many steps they
+    burn for).
+    """
+
+    propagation_rate: float = 0.094
+    fuel_mean: float = 8.5
+    fuel_stdev: float = 3
+
+
+class FireWorldSnapshot(NamedTuple):
+    """
+    The mutable part of a FireWorld at a point in time. Static map data (path
+    masks, fire mask, action mappings) is not included, since it never changes.
+    """
+
+    state_space: np.ndarray
+    path_alive: np.ndarray
+    evacuating_paths: Dict[int, list]
+    evacuating_timestamps: np.ndarray
+    finished_evacuating_cells: list
+    reward: float
+    time_step: int
+    rng_state: Optional[torch.Tensor]
+    fuel_loaded: Optional[np.ndarray] = None
+
 
 class FireWorld:
     """
@@ -42,11 +116,50 @@ class FireWorld:
         fuel_mean: float = 8.5,
         fuel_stdev: float = 3,
         fire_propagation_rate: float = 0.094,
+        fuel_map: Optional[Union[np.ndarray, RasterSource]] = None,
+        elevation: Optional[Union[np.ndarray, RasterSource]] = None,
+        cell_size: float = 30,
+        fuel_types: Optional[np.ndarray] = None,
+        fuel_type_params: Optional[Sequence[FuelType]] = None,
+        kernel_size: int = DEFAULT_KERNEL_SIZE,
+        spotting: Optional[SpottingModel] = None,
+        max_timesteps: int = EPISODE_LENGTH,
+        fast_forward: bool = False,
+        propagation_engine: str = "dense",
+        instrument: bool = False,
     ):
         """
         The constructor defines the state and action space, initializes the fires,
         and sets the paths and populated areas.
         - wind angle is in radians
+        - fuel_map optionally gives the initial fuel of every cell (for example
+          resampled from a raster), instead of drawing it from fuel_mean and
+          fuel_stdev; if it is a RasterSource, fuel is only read a tile at a time
+          once fire reaches the tile, and the fuel layer is 0 in tiles that have
+          not been read yet
+        - elevation optionally gives the height of every cell, in the same unit
+          as cell_size (the width of a cell), so that fire spreads faster uphill
+        - fuel_types optionally gives every cell an index into fuel_type_params,
+          whose propagation rate and fuel distribution are used for that cell
+          instead of fire_propagation_rate, fuel_mean and fuel_stdev
+        - kernel_size is the (odd) width of the square of neighbors that a
+          burning cell can ignite; wider kernels model faster spread on coarse
+          grids
+        - spotting optionally lets burning cells throw embers that ignite cells
+          beyond the kernel, as described by a SpottingModel
+        - max_timesteps is the number of steps after which an episode ends
+        - fast_forward jumps to the end of the episode once no cell is burning
+          (see skip_to_horizon)
+        - propagation_engine selects how ignitions are sampled: "dense" evaluates
+          the fire mask at every cell, "bitboard" uses a BitboardPropagator,
+          which needs a fire mask shared by every cell (no slope or fuel
+          types), "incremental" uses an IncrementalPropagator, and "auto"
+          switches between these as the fraction of burning cells changes (see
+          AutoPropagator); the last two follow the fire from the cells each
+          step changes, so a fire layer edited between steps should be set
+          through restore
+        - instrument records the wall time of every phase of a step and counts
+          the work it did (see get_step_stats and get_aggregate_stats)
         """
         # Assert that number of rows, columns, and fire cells are both positive
         if num_rows < 1:
@@ -55,6 +168,10 @@ class FireWorld:
             raise ValueError("Number of rows should be positive!")
         if num_fire_cells < 1:
             raise ValueError("Number of fire cells should be positive!")
+        if max_timesteps < 1:
+            raise ValueError("Maximum number of timesteps should be positive!")
+        self.max_timesteps = max_timesteps
+        self.fast_forward = fast_forward
 
         # Check that populated areas are within the grid
         valid_populated_areas = (
@@ -151,12 +268,65 @@ class FireWorld:
                     random.randint(0, num_cols - 1),
                 ] = 1
 
+        # Check that fuel types are valid
+        self.fuel_types: Optional[np.ndarray] = None
+        if fuel_types is not None:
+            if fuel_type_params is None or len(fuel_type_params) == 0:
+                raise ValueError("Fuel types need fuel type parameters!")
+            if np.shape(fuel_types) != (num_rows, num_cols):
+                raise ValueError("Fuel types do not match the grid dimensions!")
+            self.fuel_types = np.asarray(fuel_types).astype(int)
+            if np.any(self.fuel_types != fuel_types) or np.any(
+                (self.fuel_types < 0) | (self.fuel_types >= len(fuel_type_params))
+            ):
+                raise ValueError("Fuel types must index the fuel type parameters!")
+            self.fuel_type_params = [FuelType(*params) for params in fuel_type_params]
+            propagation_rates = np.array(
+                [params.propagation_rate for params in self.fuel_type_params]
+            )
+            if np.any((propagation_rates < 0) | (propagation_rates >= 1)):
+                raise ValueError("Propagation rates must be in [0, 1)!")
+
         # Initialize fuel levels
         # Note: make the fire spread parameters to constants?
-        num_values = num_rows * num_cols
-        self.state_space[FUEL_INDEX] = np.random.normal(
-            fuel_mean, fuel_stdev, num_values
-        ).reshape((num_rows, num_cols))
+        self.fuel_source: Optional[RasterSource] = None
+        self.fuel_loaded: Optional[np.ndarray] = None
+        if isinstance(fuel_map, RasterSource):
+            if tuple(fuel_map.shape) != (num_rows, num_cols):
+                raise ValueError("Fuel map does not match the grid dimensions!")
+            self.fuel_source = fuel_map
+            self.fuel_tile_size = getattr(fuel_map, "tile_size", FUEL_TILE_SIZE)
+            self.fuel_loaded = np.zeros(
+                (
+                    -(-num_rows // self.fuel_tile_size),
+                    -(-num_cols // self.fuel_tile_size),
+                ),
+                dtype=bool,
+            )
+            self.load_fuel(
+                self.state_space[FIRE_INDEX],
+                self.state_space[FUEL_INDEX],
+                self.fuel_loaded,
+            )
+        elif fuel_map is not None:
+            if np.shape(fuel_map) != (num_rows, num_cols):
+                raise ValueError("Fuel map does not match the grid dimensions!")
+            self.state_space[FUEL_INDEX] = fuel_map
+        elif self.fuel_types is not None:
+            fuel_means = np.array(
+                [params.fuel_mean for params in self.fuel_type_params]
+            )
+            fuel_stdevs = np.array(
+                [params.fuel_stdev for params in self.fuel_type_params]
+            )
+            self.state_space[FUEL_INDEX] = np.random.normal(
+                fuel_means[self.fuel_types], fuel_stdevs[self.fuel_types]
+            )
+        else:
+            num_values = num_rows * num_cols
+            self.state_space[FUEL_INDEX] = np.random.normal(
+                fuel_mean, fuel_stdev, num_values
+            ).reshape((num_rows, num_cols))
 
         # Initialize populated areas
         pop_rows, pop_cols = populated_areas[:, 0], populated_areas[:, 1]
@@ -180,7 +350,8 @@ class FireWorld:
         self.time_step = 0
 
         # set fire mask
-        self.fire_mask = set_fire_mask(fire_propagation_rate)
+        self.kernel_size = check_kernel_size(kernel_size)
+        self.fire_mask = set_fire_mask(fire_propagation_rate, self.kernel_size)
 
         # Factor in wind speeds
         if wind_speed is not None or wind_angle is not None:
@@ -193,44 +364,218 @@ class FireWorld:
         else:
             self.fire_mask = torch.from_numpy(self.fire_mask)
 
+        # Embers travel with the wind
+        self.spotting: Optional[SpottingModel] = None
+        if spotting is not None:
+            self.spotting = check_spotting_model(spotting)
+        self.wind_angle = wind_angle
+
+        # Give every cell the mask of its fuel type
+        self.class_weights: Optional[torch.Tensor] = None
+        if self.fuel_types is not None:
+            if wind_speed is None and elevation is None:
+                # The mask of every cell only depends on the distance class of
+                # each neighbor, so a few weights per cell replace the full mask
+                self.class_kernels = kernel_class_kernels(self.kernel_size)
+                self.class_weights = torch.from_numpy(
+                    fuel_type_log_weights(propagation_rates, self.kernel_size)[
+                        :, self.fuel_types
+                    ]
+                )
+            else:
+                fire_mask = fuel_type_fire_mask(propagation_rates, self.kernel_size)[
+                    :, self.fuel_types.reshape(-1)
+                ]
+                if wind_speed is not None:
+                    scaling = wind_scaling(wind_speed, wind_angle, self.kernel_size)
+                    fire_mask = np.clip(scaling * fire_mask, 0, 1)
+                self.fire_mask = torch.from_numpy(fire_mask)
+
+        # Factor in slopes, giving every cell its own mask
+        self.elevation: Optional[np.ndarray] = None
+        if elevation is not None:
+            if isinstance(elevation, RasterSource):
+                elevation = elevation.read()
+            if np.shape(elevation) != (num_rows, num_cols):
+                raise ValueError("Elevation does not match the grid dimensions!")
+            if cell_size <= 0:
+                raise ValueError("Cell size should be positive!")
+            self.elevation = np.array(elevation, dtype=np.float64)
+            self.fire_mask = slope_fire_mask(self.fire_mask, self.elevation, cell_size)
+
+        # Set up the propagation engine
+        if propagation_engine not in PROPAGATION_ENGINES:
+            raise ValueError(
+                "Propagation engine must be one of " + ", ".join(PROPAGATION_ENGINES)
+            )
+        if propagation_engine == "bitboard" and (
+            self.class_weights is not None or self.fire_mask.shape[1] != 1
+        ):
+            raise ValueError(
+                "The bitboard engine needs a fire mask shared by every cell!"
+            )
+        self.propagation_engine = propagation_engine
+        self.propagator = self._make_propagator()
+        self.propagation_strategy: Optional[str] = None
+
+        # Batched simulations get a propagator of their own when first run
+        self._batch_propagator: Optional[Propagator] = None
+
+        # Whether the propagator sampled the previous step of the fire layer, so
+        # it can follow the cells that change instead of the whole layer
+        self._propagator_continues = False
+
+        # Step instrumentation is only kept if it was asked for
+        self.stats: Optional[StepStats] = StepStats() if instrument else None
+
         # Record which population cells have finished evacuating
         self.finished_evacuating_cells = []
 
+        # Lookup tables for rollouts are only built if rollouts are used
+        self._rollout_tables: Optional[Dict[str, np.ndarray]] = None
+
+    def _make_propagator(self) -> Optional[Propagator]:
+        """
+        Build a new propagator for the propagation engine (None for "dense").
+        """
+        if self.propagation_engine == "bitboard":
+            return BitboardPropagator(self.fire_mask)
+        _, num_rows, num_cols = self.state_space.shape
+        if self.propagation_engine == "incremental":
+            return IncrementalPropagator(self.get_neighbor_mask(), num_rows, num_cols)
+        if self.propagation_engine == "auto":
+            return AutoPropagator(
+                self.get_neighbor_mask(),
+                self.get_ignition_probability,
+                num_rows,
+                num_cols,
+            )
+        return None
+
     def sample_fire_propogation(self):
         """
         Sample the next state of the wildfire model.
         """
+        self.propagate_fire(
+            self.state_space[FIRE_INDEX],
+            self.state_space[FUEL_INDEX],
+            self.fuel_loaded,
+            continued=self._propagator_continues,
+        )
+        self._propagator_continues = True
+
+    def propagate_fire(
+        self,
+        fire: np.ndarray,
+        fuel: np.ndarray,
+        fuel_loaded: Optional[np.ndarray] = None,
+        batch: bool = False,
+        continued: bool = False,
+    ):
+        """
+        Advance fire and fuel layers by one timestep in place. Works on a single
+        (n, m) grid or on a (batch, n, m) stack of independent grids.
+        - fuel_loaded marks the tiles of a fuel raster that have already been
+          read into the fuel layers, and is updated in place; it is required
+          when fuel comes from a RasterSource
+        - batch propagates with a separate propagator and leaves the one of
+          this world's own steps (and the strategy it reports) untouched
+        - continued says that the layers are the ones the previous call (for
+          this world's steps or for the batch) left, so the incremental and
+          auto engines only look at the cells that changed since
+        """
         # Drops fuel level of enflamed cells
-        self.state_space[FUEL_INDEX, self.state_space[FIRE_INDEX] == 1] -= 1
-        self.state_space[FUEL_INDEX, self.state_space[FUEL_INDEX] < 0] = 0
+        burning = fire == 1
+        fuel[burning] -= 1
+        fuel[fuel < 0] = 0
 
         # Extinguishes cells that have run out of fuel
-        self.state_space[FIRE_INDEX, self.state_space[FUEL_INDEX, :] <= 0] = 0
-
-        # Runs kernel of neighborhing cells where each row
-        # corresponds to the neighborhood of a cell
-        torch_rep = torch.tensor(self.state_space[FIRE_INDEX]).unsqueeze(0)
-        y = torch.nn.Unfold((5, 5), dilation=1, padding=2)
-        z = y(torch_rep)
-
-        # The relative importance of each neighboring cell is weighted
-        z = z * self.fire_mask
-
-        # Unenflamed cells are set to 1 to eliminate their role to the
-        # fire spread equation
-        z[z == 0] = 1
-        z = z.prod(dim=0)
-        z = 1 - z.reshape(self.state_space[FIRE_INDEX].shape)
-
-        # From the probability of an ignition in z, new fire locations are
-        # randomly generated
-        prob_mask = torch.rand_like(z)
-        new_fire = (z > prob_mask).float()
-
-        # These new fire locations are added to the state
-        self.state_space[FIRE_INDEX] = np.maximum(
-            np.array(new_fire), self.state_space[FIRE_INDEX]
-        )
+        burned_out = burning & (fuel <= 0)
+        fire[burned_out] = 0
+
+        # Embers are thrown by the cells burning at the start of the step
+        if self.spotting is not None:
+            spotted = sample_embers(fire, self.spotting, self.wind_angle)
+
+        propagator = self.propagator
+        if batch:
+            if self._batch_propagator is None:
+                self._batch_propagator = self._make_propagator()
+            propagator = self._batch_propagator
+        follows = isinstance(propagator, (IncrementalPropagator, AutoPropagator))
+        if follows:
+            stopped = np.nonzero(burned_out) if continued else None
+            propagator.ignite(fire, stopped)
+        elif propagator is not None:
+            propagator.ignite(fire)
+        else:
+            # Probability of each cell being ignited by its burning neighbors
+            z = self.get_ignition_probability(torch.from_numpy(fire))
+
+            # From the probability of an ignition in z, new fire locations are
+            # randomly generated, and then added to the state
+            prob_mask = torch.rand_like(z)
+            fire[(z > prob_mask).numpy()] = 1
+
+        # Record which strategy sampled the ignitions of this world's step
+        if not batch:
+            if isinstance(propagator, AutoPropagator):
+                self.propagation_strategy = propagator.last_strategy
+            else:
+                self.propagation_strategy = self.propagation_engine
+
+        if self.spotting is not None:
+            fire[spotted] = 1
+            if follows:
+                propagator.follow(spotted)
+
+        # Newly burning cells need their fuel before the next step
+        if self.fuel_source is not None:
+            self.load_fuel(fire, fuel, fuel_loaded)
+
+    def load_fuel(self, fire: np.ndarray, fuel: np.ndarray, fuel_loaded: np.ndarray):
+        """
+        Read the fuel of every tile that has a burning cell (in any of the grids)
+        and is not marked in fuel_loaded yet, into the given fuel layers only.
+        Batch queries pass copies of this world's fuel layer and fuel_loaded, so
+        the world itself is left untouched.
+        """
+        burning = fire.reshape((-1,) + fire.shape[-2:]).any(axis=0)
+        rows, cols = np.nonzero(burning)
+        size, tile_cols = self.fuel_tile_size, fuel_loaded.shape[1]
+        tiles = np.unique((rows // size) * tile_cols + cols // size)
+        tiles = tiles[~fuel_loaded.reshape(-1)[tiles]]
+
+        num_rows, num_cols = burning.shape
+        for tile in tiles.tolist():
+            tile_row, tile_col = divmod(tile, tile_cols)
+            row, col = tile_row * size, tile_col * size
+            height, width = min(size, num_rows - row), min(size, num_cols - col)
+            values = self.fuel_source.read(Window(row, col, height, width))
+            fuel[..., row : row + height, col : col + width] = values
+            fuel_loaded[tile_row, tile_col] = True
+
+    def get_ignition_probability(self, fire: torch.Tensor) -> torch.Tensor:
+        """
+        Get the probability of each cell igniting given the cells on fire, for a
+        single (n, m) fire layer or a (batch, n, m) stack of them.
+        """
+        if self.class_weights is not None:
+            return class_ignition_probability(
+                fire, self.class_kernels, self.class_weights
+            )
+        return ignition_probability(fire, self.fire_mask)
+
+    def get_neighbor_mask(self) -> torch.Tensor:
+        """
+        Get the fire mask as a (k * k, 1) or (k * k, n * m) tensor, building the
+        per-cell mask of fuel types from their distance class weights.
+        """
+        if self.class_weights is None:
+            return self.fire_mask
+        kernels = self.class_kernels.reshape((len(self.class_kernels), -1))
+        weights = self.class_weights.reshape((len(self.class_weights), -1))
+        return torch.exp(kernels.T @ weights)
 
     def update_paths_and_evactuations(self):
         """
@@ -332,10 +677,61 @@ class FireWorld:
         2. Update paths and evacuation
         3. Accumulate reward and document enflamed areas
         """
-        self.sample_fire_propogation()
-        self.update_paths_and_evactuations()
-        self.accumulate_reward()
+        stats = self.stats
+        if stats is not None:
+            stats.start_step()
+        with time_phase(stats, "propagation"):
+            self.sample_fire_propogation()
+        if stats is not None:
+            stats.add("burning_cells", np.count_nonzero(self.state_space[FIRE_INDEX]))
+            # Counts the steps sampled by each strategy
+            stats.add("strategy_" + self.propagation_strategy, 1)
+            # Every path still standing is checked for fire
+            stats.add("paths_checked", sum(1 for path in self.paths if path[1]))
+            stats.add(
+                "evacuations_processed",
+                sum(len(pops) for pops in self.evacuating_paths.values()),
+            )
+        with time_phase(stats, "paths"):
+            self.update_paths_and_evactuations()
+        with time_phase(stats, "reward"):
+            self.accumulate_reward()
         self.time_step += 1
+        if self.fast_forward and not self.state_space[FIRE_INDEX].any():
+            with time_phase(stats, "fast_forward"):
+                self.skip_to_horizon()
+
+    def skip_to_horizon(self):
+        """
+        Jump to the last timestep of a world with no burning cells. Without fire
+        nothing can ignite again, so the remaining steps only finish ongoing
+        evacuations and reward every idle populated cell, which is added up in
+        closed form. No new evacuations are assumed to start, since without fire
+        they could only lose reward.
+        """
+        remaining = self.max_timesteps - self.time_step
+        if remaining <= 0 or self.state_space[FIRE_INDEX].any():
+            return
+
+        idle = (self.state_space[POPULATED_INDEX] == 1) & (
+            self.state_space[EVACUATING_INDEX] == 0
+        )
+        self.reward += remaining * np.count_nonzero(idle)
+
+        # Evacuations whose timer runs out in time are finished
+        for path_index in list(self.evacuating_paths):
+            for pop in list(self.evacuating_paths[path_index]):
+                row, col = pop[0], pop[1]
+                self.evacuating_timestamps[row, col] -= remaining
+                if self.evacuating_timestamps[row, col] <= 0:
+                    self.state_space[EVACUATING_INDEX, row, col] = 0
+                    self.state_space[POPULATED_INDEX, row, col] = 0
+                    self.evacuating_timestamps[row, col] = np.inf
+                    self.finished_evacuating_cells.append([row, col])
+                    self.evacuating_paths[path_index].remove(pop)
+            if len(self.evacuating_paths[path_index]) == 0:
+                del self.evacuating_paths[path_index]
+        self.time_step = self.max_timesteps
 
     def set_action(self, action: int):
         """
@@ -383,6 +779,33 @@ class FireWorld:
         """
         return self.actions
 
+    def get_propagation_strategy(self) -> Optional[str]:
+        """
+        Get the strategy that sampled the latest ignitions: the propagation
+        engine, or whichever strategy the "auto" engine picked (None before the
+        first step).
+        """
+        return self.propagation_strategy
+
+    def get_step_stats(self) -> Optional[Dict[str, float]]:
+        """
+        Get the phase times and counters of the latest step, or None if the
+        world is not instrumented.
+        """
+        if self.stats is None:
+            return None
+        return dict(self.stats.last)
+
+    def get_aggregate_stats(self) -> Optional[Dict[str, Dict[str, float]]]:
+        """
+        Get the phase times and counters added up over every step ("totals",
+        along with the number of steps) and per step ("means"), or None if the
+        world is not instrumented.
+        """
+        if self.stats is None:
+            return None
+        return self.stats.summary()
+
     def get_timestep(self) -> int:
         """
         Get current timestep of simulation
@@ -401,10 +824,463 @@ class FireWorld:
         """
         Get the status of the simulation.
         """
-        return self.time_step >= 100
+        return self.time_step >= self.max_timesteps
 
     def get_finished_evacuating(self) -> list:
         """
         Get the populated areas that are finished evacuating.
         """
         return self.finished_evacuating_cells
+
+    def snapshot(self, include_rng: bool = True) -> FireWorldSnapshot:
+        """
+        Capture the mutable state of the simulation so it can be restored later.
+        - include_rng also captures the random number generator state used for
+          fire propagation, so a restored world replays the same fire
+        """
+        return FireWorldSnapshot(
+            state_space=self.state_space.copy(),
+            path_alive=np.array([path[1] for path in self.paths], dtype=bool),
+            evacuating_paths={
+                path: list(pops) for path, pops in self.evacuating_paths.items()
+            },
+            evacuating_timestamps=self.evacuating_timestamps.copy(),
+            finished_evacuating_cells=list(self.finished_evacuating_cells),
+            reward=self.reward,
+            time_step=self.time_step,
+            rng_state=torch.get_rng_state() if include_rng else None,
+            fuel_loaded=None if self.fuel_loaded is None else self.fuel_loaded.copy(),
+        )
+
+    def restore(self, snapshot: FireWorldSnapshot):
+        """
+        Return the simulation to a previously captured snapshot. The snapshot is
+        left untouched, so it can be restored any number of times.
+        """
+        self._load_snapshot(snapshot, copy_arrays=True)
+        if snapshot.rng_state is not None:
+            torch.set_rng_state(snapshot.rng_state)
+
+    def clone(self) -> "FireWorld":
+        """
+        Create an independent copy of the simulation. Static map data is shared
+        with this world rather than copied.
+        """
+        world = copy.copy(self)
+        if self.stats is not None:
+            world.stats = StepStats()
+
+        # Propagators that keep track of the fire get their own copy, while the
+        # bitboard keeps no state between steps and is shared
+        if isinstance(self.propagator, IncrementalPropagator):
+            world.propagator = self.propagator.copy()
+        elif isinstance(self.propagator, AutoPropagator):
+            world.propagator = self.propagator.copy(world.get_ignition_probability)
+        world._batch_propagator = None
+        world._load_snapshot(self.snapshot(include_rng=False), copy_arrays=False)
+        return world
+
+    def _load_snapshot(self, snapshot: FireWorldSnapshot, copy_arrays: bool):
+        """
+        Replace the mutable containers of this world with those of the snapshot.
+        """
+        if copy_arrays:
+            self.state_space = snapshot.state_space.copy()
+            self.evacuating_timestamps = snapshot.evacuating_timestamps.copy()
+            self.evacuating_paths = {
+                path: list(pops) for path, pops in snapshot.evacuating_paths.items()
+            }
+            self.finished_evacuating_cells = list(snapshot.finished_evacuating_cells)
+        else:
+            self.state_space = snapshot.state_space
+            self.evacuating_timestamps = snapshot.evacuating_timestamps
+            self.evacuating_paths = snapshot.evacuating_paths
+            self.finished_evacuating_cells = snapshot.finished_evacuating_cells
+
+        # Path masks are shared, only whether each path is still alive is restored
+        self.paths = [
+            [path[0], bool(alive)]
+            for path, alive in zip(self.paths, snapshot.path_alive)
+        ]
+        self.reward = snapshot.reward
+        self.time_step = snapshot.time_step
+
+        # The propagator has to compare the whole restored fire layer
+        self._propagator_continues = False
+
+        # Tiles of fuel read after the snapshot was taken are unread again
+        if snapshot.fuel_loaded is not None:
+            self.fuel_loaded = snapshot.fuel_loaded.copy()
+
+    def rollout(
+        self,
+        policy: Optional[Callable[[np.ndarray, int], Any]],
+        horizon: int,
+        n: int = 1,
+        summaries: Sequence[str] = ("returns", "burned_populations"),
+    ) -> Dict[str, np.ndarray]:
+        """
+        Simulate n independent copies of the current world for up to horizon steps
+        (or until the episode terminates) without modifying this world.
+        - policy is called as policy(states, timestep) with a read-only
+          (n, 5, rows, cols) array laid out like state_space and must return n
+          actions; None always takes the "do nothing" action
+        - summaries selects what is returned: "returns" (summed rewards),
+          "burned_populations" (populated cells burned), "evacuated" (populated
+          cells that finished evacuating) and "final_state" (the final states)
+        """
+        unknown = set(summaries) - set(ROLLOUT_SUMMARIES)
+        if unknown:
+            raise ValueError("Unknown rollout summaries: " + ", ".join(unknown))
+        if n < 1:
+            raise ValueError("Number of rollouts should be positive!")
+
+        # Every copy starts from the current state; flat views share its memory
+        states = np.repeat(self.state_space[np.newaxis], n, axis=0)
+        flat = states.reshape((n, 5, -1))
+        fire, fuel = states[:, FIRE_INDEX], states[:, FUEL_INDEX]
+        fuel_loaded = None if self.fuel_loaded is None else self.fuel_loaded.copy()
+        view = states.view()
+        view.flags.writeable = False
+
+        # Static lookup tables, built once per map
+        tables = self._get_rollout_tables()
+        pop_cells, path_cells, path_starts = (
+            tables["pop_cells"],
+            tables["path_cells"],
+            tables["path_starts"],
+        )
+        copies = np.arange(n)[:, np.newaxis]
+
+        # Evacuation bookkeeping per copy and populated cell
+        path_alive = np.repeat(
+            np.array([[path[1] for path in self.paths]], dtype=bool), n, axis=0
+        )
+        evac_path = np.full((n, len(pop_cells)), -1)
+        timers = np.repeat(
+            self.evacuating_timestamps.reshape(-1)[pop_cells][np.newaxis], n, axis=0
+        )
+        for path_index, pops in self.evacuating_paths.items():
+            for pop in pops:
+                evac_path[:, tables["pop_lookup"][pop[0], pop[1]]] = path_index
+
+        returns = np.zeros(n)
+        burned = np.zeros(n, dtype=int)
+        evacuated = np.zeros(n, dtype=int)
+        end = min(self.time_step + horizon, self.max_timesteps)
+        for time_step in range(self.time_step, end):
+            # Once every copy's fire is out, the rest follows in closed form
+            if (policy is None or self.fast_forward) and not fire.any():
+                remaining = end - time_step
+                populated = flat[:, POPULATED_INDEX, pop_cells] == 1
+                idle = flat[:, EVACUATING_INDEX, pop_cells] == 0
+                returns += remaining * (populated & idle).sum(axis=1)
+                evacuating = evac_path >= 0
+                timers[evacuating] -= remaining
+                done = evacuating & (timers <= 0)
+                done_copy, done_pop = np.nonzero(done)
+                flat[done_copy, EVACUATING_INDEX, pop_cells[done_pop]] = 0
+                flat[done_copy, POPULATED_INDEX, pop_cells[done_pop]] = 0
+                evacuated += done.sum(axis=1)
+                break
+
+            # 1. Take the actions that are valid in each copy
+            if policy is not None:
+                actions = np.asarray(policy(view, time_step), dtype=int).reshape(n)
+                in_range = (actions >= 0) & (actions < len(tables["action_pop"]))
+                take = np.flatnonzero(in_range)
+                pop = tables["action_pop"][actions[take]]
+                path = tables["action_path"][actions[take]]
+
+                # The "do nothing" action maps to no populated cell
+                take, pop, path = take[pop >= 0], pop[pop >= 0], path[pop >= 0]
+                valid = (
+                    path_alive[take, path]
+                    & (flat[take, POPULATED_INDEX, pop_cells[pop]] == 1)
+                    & (timers[take, pop] == np.inf)
+                )
+                take, pop, path = take[valid], pop[valid], path[valid]
+                flat[take, EVACUATING_INDEX, pop_cells[pop]] = 1
+                timers[take, pop] = 10
+                evac_path[take, pop] = path
+
+            # 2. Advance the fire in every copy at once
+            self.propagate_fire(
+                fire,
+                fuel,
+                fuel_loaded,
+                batch=True,
+                continued=time_step > self.time_step,
+            )
+
+            # 3. Burn down paths and update evacuations along them
+            burning = np.zeros(path_alive.shape, dtype=bool)
+            if len(path_cells) > 0:
+                on_path = flat[:, FIRE_INDEX, path_cells] == 1
+                burning = np.logical_or.reduceat(on_path, path_starts, axis=1)
+                burning &= path_alive
+            if burning.any():
+                path_alive &= ~burning
+                for k, i in zip(*np.nonzero(burning)):
+                    flat[k, PATHS_INDEX] -= tables["path_masks"][i]
+            evacuating = evac_path >= 0
+            stopped = evacuating & burning[copies, evac_path]
+            stopped_copy, stopped_pop = np.nonzero(stopped)
+            flat[stopped_copy, EVACUATING_INDEX, pop_cells[stopped_pop]] = 0
+            timers[stopped] = np.inf
+            evac_path[stopped] = -1
+
+            evacuating &= ~stopped
+            timers[evacuating] -= 1
+            done = evacuating & (timers == 0)
+            done_copy, done_pop = np.nonzero(done)
+            flat[done_copy, EVACUATING_INDEX, pop_cells[done_pop]] = 0
+            flat[done_copy, POPULATED_INDEX, pop_cells[done_pop]] = 0
+            timers[done] = np.inf
+            evac_path[done] = -1
+            evacuated += done.sum(axis=1)
+
+            # 4. Accumulate reward and depopulate enflamed areas
+            populated = flat[:, POPULATED_INDEX, pop_cells] == 1
+            on_fire = flat[:, FIRE_INDEX, pop_cells] == 1
+            idle = flat[:, EVACUATING_INDEX, pop_cells] == 0
+            enflamed = populated & on_fire
+            returns -= 100 * enflamed.sum(axis=1)
+            returns += (populated & ~on_fire & idle).sum(axis=1)
+            burned += enflamed.sum(axis=1)
+            enflamed_copy, enflamed_pop = np.nonzero(enflamed)
+            flat[enflamed_copy, POPULATED_INDEX, pop_cells[enflamed_pop]] = 0
+            flat[enflamed_copy, EVACUATING_INDEX, pop_cells[enflamed_pop]] = 0
+
+        results = {
+            "returns": returns,
+            "burned_populations": burned,
+            "evacuated": evacuated,
+            "final_state": states,
+        }
+        return {name: results[name] for name in summaries}
+
+    def _get_rollout_tables(self) -> Dict[str, np.ndarray]:
+        """
+        Build (once) the flat lookup tables that rollouts use in place of the
+        per-path masks and action dictionary.
+        """
+        if self._rollout_tables is not None:
+            return self._rollout_tables
+        num_cols = self.state_space.shape[2]
+
+        # Every cell that is or could become populated or evacuating
+        cells = set(np.flatnonzero(self.state_space[POPULATED_INDEX] == 1).tolist())
+        for action_val in self.action_to_pop_and_path.values():
+            if action_val is not None:
+                cells.add(int(action_val[0][0]) * num_cols + int(action_val[0][1]))
+        for pops in self.evacuating_paths.values():
+            for pop in pops:
+                cells.add(int(pop[0]) * num_cols + int(pop[1]))
+        pop_cells = np.array(sorted(cells), dtype=int)
+        pop_lookup = np.full(self.state_space.shape[1:], -1)
+        pop_lookup.reshape(-1)[pop_cells] = np.arange(len(pop_cells))
+
+        # Action index to populated cell index and path index
+        action_pop = np.full(len(self.actions), -1)
+        action_path = np.full(len(self.actions), -1)
+        for action, action_val in self.action_to_pop_and_path.items():
+            if action_val is not None:
+                pop, path = action_val
+                action_pop[action] = pop_lookup[pop[0], pop[1]]
+                action_path[action] = path
+
+        # Flattened cells of each path, with the offset each path starts at
+        path_masks = np.array([path[0].reshape(-1) for path in self.paths])
+        path_cells = [np.flatnonzero(mask) for mask in path_masks]
+        path_starts = np.cumsum([0] + [len(c) for c in path_cells[:-1]])
+        self._rollout_tables = {
+            "pop_cells": pop_cells,
+            "pop_lookup": pop_lookup,
+            "action_pop": action_pop,
+            "action_path": action_path,
+            "path_masks": path_masks,
+            "path_cells": np.concatenate(path_cells) if path_cells else pop_cells[:0],
+            "path_starts": path_starts.astype(int),
+        }
+        return self._rollout_tables
+
+    def burn_probability(
+        self, horizon: int, num_samples: int = 100, batch_size: int = 64
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Estimate, from num_samples sampled fire futures, the probability that each
+        cell is burning within horizon steps and the expected step at which it
+        starts burning given that it does (0 for cells already on fire, inf for
+        cells that never burned). Only the fire is simulated, so evacuations and
+        rewards are skipped and this world is not modified.
+        - batch_size caps how many futures are propagated at once
+        """
+        if horizon < 0:
+            raise ValueError("Horizon should not be negative!")
+        if num_samples < 1:
+            raise ValueError("Number of samples should be positive!")
+
+        num_burned = np.zeros(self.state_space.shape[1:], dtype=int)
+        arrival_sum = np.zeros(self.state_space.shape[1:])
+        for start in range(0, num_samples, batch_size):
+            n = min(batch_size, num_samples - start)
+            fire = np.repeat(self.state_space[np.newaxis, FIRE_INDEX], n, axis=0)
+            fuel = np.repeat(self.state_space[np.newaxis, FUEL_INDEX], n, axis=0)
+
+            fuel_loaded = None if self.fuel_loaded is None else self.fuel_loaded.copy()
+
+            # Record the first step at which each cell of each future burns
+            arrival = np.where(fire == 1, 0.0, np.inf)
+            for step in range(1, horizon + 1):
+                # Nothing can burn once every fire is out
+                if not fire.any():
+                    break
+                self.propagate_fire(
+                    fire, fuel, fuel_loaded, batch=True, continued=step > 1
+                )
+                arrival[(fire == 1) & (arrival == np.inf)] = step
+
+            burned = arrival != np.inf
+            num_burned += burned.sum(axis=0)
+            arrival_sum += np.where(burned, arrival, 0).sum(axis=0)
+
+        probability = num_burned / num_samples
+        expected_arrival = np.full(probability.shape, np.inf)
+        np.divide(arrival_sum, num_burned, out=expected_arrival, where=num_burned > 0)
+        return probability, expected_arrival
+
+    def expected_rollout(
+        self, horizon: int, actions: Optional[Sequence[int]] = None
+    ) -> Dict[str, Any]:
+        """
+        Propagate the probability that each cell is burning for up to horizon
+        steps without any sampling, as a fast deterministic stand-in for
+        averaging many rollouts. Cells are treated as independent of each other
+        (a mean-field approximation), while a cell's own history is followed
+        exactly: once ignited it burns for as many steps as it has fuel, after
+        which it can only flicker back on for a step at a time.
+        - actions optionally gives the action to take at each step (an open-loop
+          plan); an evacuation starts with the probability that its populated
+          cell and path are both still there
+        Returns the probability of each cell burning after each step ("burning",
+        with shape (steps, n, m)), of each cell having burned ("burned"), of each
+        path still being intact ("path_survival"), the expected fuel of each cell
+        ("fuel"), and the expected "returns", "burned_populations" and
+        "evacuated". Ember spotting is not included, and this world is not
+        modified.
+        """
+        if horizon < 0:
+            raise ValueError("Horizon should not be negative!")
+        num_steps = max(0, min(horizon, self.max_timesteps - self.time_step))
+        num_rows, num_cols = self.state_space.shape[1:]
+        fire = self.state_space[FIRE_INDEX] == 1
+        fuel = self.state_space[FUEL_INDEX].copy()
+        if self.fuel_source is not None:
+            # Every cell might burn, so tiles that have not been read are needed
+            size = self.fuel_tile_size
+            unread = np.repeat(np.repeat(~self.fuel_loaded, size, 0), size, 1)
+            unread = unread[:num_rows, :num_cols]
+            fuel[unread] = self.fuel_source.read()[unread]
+
+        # A cell burns for this many steps after it is first ignited
+        duration = np.maximum(np.ceil(fuel), 1).astype(int)
+
+        # Probability of each cell not having been ignited yet, before the first
+        # step and after each step (burning cells count as ignited on step 0)
+        not_ignited = np.ones((num_steps + 2, num_rows, num_cols))
+        not_ignited[1] = ~fire
+        burning_history = np.zeros((num_steps, num_rows, num_cols))
+        fire_mask = self.get_neighbor_mask()
+
+        # Populated cells are split into idle, evacuating and gone (burned or
+        # evacuated), with the evacuation timer and path of each cell
+        tables = self._get_rollout_tables()
+        pop_cells, path_cells, path_starts = (
+            tables["pop_cells"],
+            tables["path_cells"],
+            tables["path_starts"],
+        )
+        populated = self.state_space[POPULATED_INDEX].reshape(-1)[pop_cells] == 1
+        evacuating = self.state_space[EVACUATING_INDEX].reshape(-1)[pop_cells] == 1
+        idle = (populated & ~evacuating).astype(float)
+        evacuating = (populated & evacuating).astype(float)
+        timers = self.evacuating_timestamps.reshape(-1)[pop_cells].copy()
+        evac_path = np.full(len(pop_cells), -1)
+        for path_index, pops in self.evacuating_paths.items():
+            for pop in pops:
+                evac_path[tables["pop_lookup"][pop[0], pop[1]]] = path_index
+        path_alive = np.array([path[1] for path in self.paths], dtype=float)
+
+        returns, burned_populations, evacuated = 0.0, 0.0, 0.0
+        for step in range(1, num_steps + 1):
+            # 1. Start the planned evacuation
+            action = None
+            if actions is not None and step - 1 < len(actions):
+                action = actions[step - 1]
+            if action is not None and 0 <= action < len(tables["action_pop"]):
+                pop, path = tables["action_pop"][action], tables["action_path"][action]
+                if pop >= 0 and timers[pop] == np.inf:
+                    started = idle[pop] * path_alive[path]
+                    if started > 0:
+                        idle[pop] -= started
+                        evacuating[pop] += started
+                        timers[pop] = 10
+                        evac_path[pop] = path
+
+            # 2. Cells ignited within their burn duration are still burning once
+            # burned out cells are extinguished
+            window = np.take_along_axis(
+                not_ignited, np.maximum(step + 1 - duration, 0)[np.newaxis], 0
+            )[0]
+            sources = window - not_ignited[step]
+            ignition = expected_ignition_probability(
+                torch.from_numpy(sources), fire_mask
+            ).numpy()
+            not_ignited[step + 1] = not_ignited[step] * (1 - ignition)
+            burning = window - not_ignited[step + 1] + (1 - window) * ignition
+            burning_history[step - 1] = burning
+
+            # 3. Burn down paths and stop the evacuations along them
+            path_burning = np.zeros(len(path_alive))
+            if len(path_cells) > 0:
+                path_burning = 1 - np.multiply.reduceat(
+                    1 - burning.reshape(-1)[path_cells], path_starts
+                )
+            path_alive *= 1 - path_burning
+            moving = evac_path >= 0
+            stopped = np.zeros(len(pop_cells))
+            stopped[moving] = evacuating[moving] * path_burning[evac_path[moving]]
+            evacuating -= stopped
+            idle += stopped
+            timers[moving] -= 1
+            done = moving & (timers == 0)
+            evacuated += evacuating[done].sum()
+            evacuating[done] = 0
+            timers[done] = np.inf
+            evac_path[done] = -1
+
+            # 4. Accumulate reward and depopulate enflamed areas
+            on_fire = burning.reshape(-1)[pop_cells]
+            enflamed = (idle + evacuating) * on_fire
+            returns += (idle * (1 - on_fire)).sum() - 100 * enflamed.sum()
+            burned_populations += enflamed.sum()
+            idle *= 1 - on_fire
+            evacuating *= 1 - on_fire
+
+        # A cell first ignited k steps before the end has burned k units of fuel
+        ignited = not_ignited[:-1] - not_ignited[1:]
+        steps_burned = num_steps - np.arange(num_steps + 1)[:, np.newaxis, np.newaxis]
+        expected_fuel = not_ignited[-1] * fuel + (
+            ignited * np.maximum(fuel[np.newaxis] - steps_burned, 0)
+        ).sum(axis=0)
+
+        return {
+            "burning": burning_history,
+            "burned": 1 - not_ignited[-1],
+            "fuel": expected_fuel,
+            "path_survival": path_alive,
+            "returns": returns,
+            "burned_populations": burned_populations,
+            "evacuated": evacuated,
+        }
@@ -7,13 +7,35 @@ import torch
 
 base_fire_mask = None
 
+# Side length of the square neighborhood that a burning cell can ignite
+DEFAULT_KERNEL_SIZE = 5
 
-def set_fire_mask(distance_to_probability_of_enflaming_ratio=0.094):
+
+def check_kernel_size(kernel_size: int) -> int:
+    """
+    Make sure a kernel has a center cell and at least one ring of neighbors.
+    """
+    if kernel_size < 3 or kernel_size % 2 == 0:
+        raise ValueError("Kernel size must be an odd number of at least 3!")
+    return int(kernel_size)
+
+
+def mask_kernel_size(fire_mask) -> int:
+    """
+    The side length of the kernel of a (kernel_size ** 2, ...) fire mask.
+    """
+    return int(round(np.sqrt(fire_mask.shape[0])))
+
+
+def set_fire_mask(
+    distance_to_probability_of_enflaming_ratio=0.094, kernel_size=DEFAULT_KERNEL_SIZE
+):
     # Mask used for calculating the probability a cell alighting following
     # the same propagation formula from existing research.
     # Distance along axis from origin. Origin is referring to the cell we are
     # presently trying to determine if becomes enflamed in the next timestep.
-    distance_matrix = torch.tensor([[2, 1, 0, 1, 2] for _ in range(5)])
+    radius = check_kernel_size(kernel_size) // 2
+    distance_matrix = torch.arange(-radius, radius + 1).abs().repeat(kernel_size, 1)
 
     # Squaring of values for later calculating square of L2 norm
     temp = distance_matrix**2
@@ -26,29 +48,55 @@ def set_fire_mask(distance_to_probability_of_enflaming_ratio=0.094):
 
     # As there is zero distance between the origin and itself, we set this
     # value to 1, so the contribution of the origin is ignored in the product
-    distance_matrix[2, 2] = 1
+    distance_matrix[radius, radius] = 1
 
     # Flatten probably mask so it can be efficiently used as a kernel
     global base_fire_mask
-    base_fire_mask = distance_matrix.reshape((25, 1))
+    base_fire_mask = distance_matrix.reshape((kernel_size**2, 1))
     return np.copy(base_fire_mask)
 
 
+def kernel_axis_distance(kernel_size: int = DEFAULT_KERNEL_SIZE) -> np.ndarray:
+    """
+    A kernel_size x kernel_size matrix of how many rows above the center cell
+    each neighboring cell is.
+    """
+    radius = check_kernel_size(kernel_size) // 2
+    return np.repeat(-np.arange(-radius, radius + 1)[:, np.newaxis], kernel_size, 1)
+
+
+def kernel_neighbor_vectors(kernel_size: int = DEFAULT_KERNEL_SIZE) -> np.ndarray:
+    """
+    The unit vector pointing from the center cell to each neighboring cell, as a
+    (kernel_size ** 2, 2) array, with a zero vector for the center cell.
+    """
+    axis_distance = kernel_axis_distance(kernel_size)
+    center = kernel_size**2 // 2
+    vectors = np.stack((-axis_distance.T, axis_distance), axis=2).reshape((-1, 2))
+    vectors[center, :] = 1
+    # Normalizes these vectors to unit vectors
+    vectors = vectors / np.linalg.norm(vectors, axis=1).reshape((-1, 1))
+    vectors[center, :] = 0
+    return vectors
+
+
+def kernel_squared_distances(kernel_size: int = DEFAULT_KERNEL_SIZE) -> np.ndarray:
+    """
+    The squared distance (in cells) from the center cell to each neighboring
+    cell, flattened in the same order as the fire mask.
+    """
+    axis_distance = kernel_axis_distance(kernel_size)
+    return (axis_distance**2 + axis_distance.T**2).reshape(-1)
+
+
 # Wind components
 # The rate with which speed of wind converts to a percent change in
 # the chance of a neighbor cell igniting the center cell
 speed_to_percent_ratio = 0.004
-axis_distance = np.array([5 * [-i] for i in range(-2, 3)])
+axis_distance = kernel_axis_distance()
 # a 5x5 matrix where each element represents a vector pointing in the
 # direction of the corresponding neihboring cell
-neighbor_vectors = np.stack((-axis_distance.T, axis_distance), axis=2).reshape((-1, 2))
-neighbor_vectors[12, :] = 1
-# Normalizes these vectors to unit vectors
-normalizer = np.linalg.norm(neighbor_vectors, axis=1).reshape(
-    (neighbor_vectors.shape[0], 1)
-)
-neighbor_vectors = neighbor_vectors / normalizer.reshape((normalizer.size, 1))
-neighbor_vectors[12, :] = 0
+neighbor_vectors = kernel_neighbor_vectors()
 
 
 def linear_wind_transform(wind_speed: float, wind_angle: float) -> np.ndarray:
@@ -62,8 +110,121 @@ def linear_wind_transform(wind_speed: float, wind_angle: float) -> np.ndarray:
         return RuntimeError(
             "wind transform is set over fire propogation without having yet initialized fire mask"
         )
-    wind_vector = np.array([[np.cos(wind_angle)], [np.sin(wind_angle)]])
-    scaling_term = (
-        neighbor_vectors @ wind_vector
-    ) * speed_to_percent_ratio * wind_speed + 1
+    scaling_term = wind_scaling(
+        wind_speed, wind_angle, mask_kernel_size(base_fire_mask)
+    )
     return np.clip(torch.from_numpy(scaling_term) * base_fire_mask, a_min=0, a_max=1)
+
+
+def wind_scaling(
+    wind_speed: float, wind_angle: float, kernel_size: int = DEFAULT_KERNEL_SIZE
+) -> np.ndarray:
+    """
+    The (kernel_size ** 2, 1) factors that linear_wind_transform scales the fire
+    mask by.
+    """
+    vectors = (
+        neighbor_vectors
+        if kernel_size == DEFAULT_KERNEL_SIZE
+        else kernel_neighbor_vectors(kernel_size)
+    )
+    wind_vector = np.array([[np.cos(wind_angle)], [np.sin(wind_angle)]])
+    return (vectors @ wind_vector) * speed_to_percent_ratio * wind_speed + 1
+
+
+# Slope components
+# Fire spreads faster uphill: the chance of a neighbor igniting the center cell
+# is multiplied by exp(slope_coefficient * slope), with the slope from the
+# neighbor up to the center cell in degrees
+slope_coefficient = 0.078
+
+
+def slope_fire_mask(
+    fire_mask: torch.Tensor, elevation: np.ndarray, cell_size: float
+) -> torch.Tensor:
+    """
+    Fuses a slope factor for every cell and neighbor into the fire mask, giving
+    a (kernel_size ** 2, n * m) mask with one column per cell of an n by m grid.
+    Computed once per map, so propagation stays a single kernel evaluation.
+    - elevation is in the same unit as cell_size, the width of a cell
+    - Probabilities are clamped just below 1, as a survival probability of 0
+      would be read as a cell that is not burning
+    """
+    num_rows, num_cols = elevation.shape
+    kernel_size = mask_kernel_size(fire_mask)
+    padded = np.pad(elevation, kernel_size // 2, mode="edge")
+
+    # Elevation of each neighbor, in the same (kernel_size ** 2, n * m) layout as
+    # the kernel
+    neighbors = np.stack(
+        [
+            padded[i : i + num_rows, j : j + num_cols].reshape(-1)
+            for i in range(kernel_size)
+            for j in range(kernel_size)
+        ]
+    )
+    rise = elevation.reshape((1, -1)) - neighbors
+    distances = np.sqrt(kernel_squared_distances(kernel_size))
+    run = np.maximum(distances, 1).reshape((-1, 1)) * cell_size
+    slope = np.degrees(np.arctan(rise / run))
+    slope_factor = np.exp(slope_coefficient * slope)
+
+    probability = (1 - fire_mask.numpy().astype(np.float64)) * slope_factor
+    probability = np.clip(probability, 0, 1 - 1e-9)
+    return torch.from_numpy((1 - probability).astype(np.float32))
+
+
+# Distance classes
+# Every neighbor at the same squared distance from the center cell ignites it
+# with the same probability, so the 5x5 mask only has five distinct entries
+
+
+def kernel_distance_classes(kernel_size: int = DEFAULT_KERNEL_SIZE) -> np.ndarray:
+    """
+    The distinct nonzero squared distances of the neighbors in a kernel.
+    """
+    squared_distances = kernel_squared_distances(kernel_size)
+    return np.unique(squared_distances[squared_distances > 0])
+
+
+def kernel_class_kernels(kernel_size: int = DEFAULT_KERNEL_SIZE) -> torch.Tensor:
+    """
+    One kernel per distance class, marking the neighbors in that class, as a
+    (classes, 1, kernel_size, kernel_size) tensor.
+    """
+    squared_distances = kernel_squared_distances(kernel_size).reshape(
+        (kernel_size, kernel_size)
+    )
+    return torch.from_numpy(
+        np.stack(
+            [squared_distances == d for d in kernel_distance_classes(kernel_size)]
+        ).astype(np.float64)
+    ).unsqueeze(1)
+
+
+def fuel_type_fire_mask(
+    propagation_rates: np.ndarray, kernel_size: int = DEFAULT_KERNEL_SIZE
+) -> np.ndarray:
+    """
+    The (kernel_size ** 2, number of types) fire mask of each fuel type,
+    following the same formula as set_fire_mask with the propagation rate of
+    that type.
+    """
+    squared_distances = kernel_squared_distances(kernel_size)
+    distances = np.where(squared_distances > 0, squared_distances, 1)
+    mask = 1 - np.asarray(propagation_rates)[np.newaxis, :] / distances[:, np.newaxis]
+    mask[squared_distances == 0] = 1
+    return mask
+
+
+def fuel_type_log_weights(
+    propagation_rates: np.ndarray, kernel_size: int = DEFAULT_KERNEL_SIZE
+) -> np.ndarray:
+    """
+    The log probability that a burning neighbor of each distance class does not
+    ignite a cell of each fuel type, as a (number of classes, number of types)
+    array.
+    """
+    rates = np.asarray(propagation_rates, dtype=np.float64)[np.newaxis, :]
+    distance_classes = kernel_distance_classes(kernel_size)
+    return np.log1p(-rates / distance_classes[:, np.newaxis])
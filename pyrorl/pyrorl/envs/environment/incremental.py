@@ -0,0 +1,218 @@
+"""
+Incremental fire propagation (see IncrementalPropagator).
+"""
+
+import copy
+import numpy as np
+import torch
+from typing import Optional
+
+
+class IncrementalPropagator:
+    """
+    Keeps a field of the log probability that no burning neighbor ignites each
+    cell. A cell that starts burning adds the log of the fire mask around it, and
+    a cell that stops burning subtracts it again, so a step costs one stamp per
+    changed cell rather than a kernel evaluation per cell, and only the unlit
+    cells with a burning neighbor are sampled. Callers that know which cells
+    changed pass them on (see ignite and follow). Otherwise the last fire
+    layer is compared with the next one, so the field stays correct for
+    restored or batched layers (a layer of another shape is rebuilt from
+    scratch).
+    """
+
+    def __init__(self, fire_mask: torch.Tensor, num_rows: int, num_cols: int):
+        """
+        Take the log of a (k * k, 1) or (k * k, n * m) fire mask.
+        """
+        mask = fire_mask.numpy().astype(np.float64)
+        self.kernel_size = int(round(np.sqrt(mask.shape[0])))
+        self.radius = radius = self.kernel_size // 2
+        offsets = [
+            (row - radius, col - radius)
+            for row in range(self.kernel_size)
+            for col in range(self.kernel_size)
+        ]
+
+        # Certain ignition has no log, so it is clamped to nearly certain
+        log_mask = np.log(np.clip(mask, 1e-12, 1))
+        if log_mask.shape[1] == 1:
+            log_mask = np.broadcast_to(
+                log_mask.reshape((-1, 1, 1)), (len(offsets), num_rows, num_cols)
+            )
+        else:
+            log_mask = log_mask.reshape((len(offsets), num_rows, num_cols))
+
+        # Neighbors that never spread fire are left out. Weights are padded like
+        # the fields, so stamps that fall off the grid need no bounds checks.
+        spreading = [i for i in range(len(offsets)) if np.any(log_mask[i] < 0)]
+        self.offsets = [offsets[i] for i in spreading]
+        self.log_mask = np.pad(
+            log_mask[spreading], ((0, 0), (radius,) * 2, (radius,) * 2)
+        )
+
+        # The fields are padded like the weights, and candidates holds the flat
+        # indices of the unlit cells that have a burning neighbor, in order
+        self.burning: Optional[np.ndarray] = None
+        self.log_survival: Optional[np.ndarray] = None
+        self.exposure: Optional[np.ndarray] = None
+        self.candidates: Optional[np.ndarray] = None
+        self.num_burning = 0
+
+    def copy(self) -> "IncrementalPropagator":
+        """
+        Copy the fields, sharing the fire mask weights with this propagator.
+        """
+        propagator = copy.copy(self)
+        if self.burning is not None:
+            propagator.burning = self.burning.copy()
+            propagator.log_survival = self.log_survival.copy()
+            propagator.exposure = self.exposure.copy()
+        return propagator
+
+    def padded_shape(self, shape: tuple) -> tuple:
+        """
+        Get the shape of the fields for a fire layer of the given shape.
+        """
+        return shape[:-2] + tuple(size + 2 * self.radius for size in shape[-2:])
+
+    def fits(self, shape: tuple) -> bool:
+        """
+        Check whether the fields are set up for a fire layer of the given shape.
+        """
+        return self.burning is not None and self.burning.shape == (
+            self.padded_shape(shape)
+        )
+
+    def flat_index(self, cells: tuple) -> np.ndarray:
+        """
+        Turn the indices of grid cells into flat indices of the padded fields.
+        """
+        padded = cells[:-2] + (cells[-2] + self.radius, cells[-1] + self.radius)
+        return np.ravel_multi_index(padded, self.burning.shape)
+
+    def grid_index(self, flat: np.ndarray) -> tuple:
+        """
+        Turn flat indices of the padded fields into the indices of grid cells.
+        """
+        cells = np.unravel_index(flat, self.burning.shape)
+        return cells[:-2] + (cells[-2] - self.radius, cells[-1] - self.radius)
+
+    def stamp(self, cells: tuple, sign: int) -> np.ndarray:
+        """
+        Add (sign 1) or remove (sign -1) the contribution of the given burning
+        cells to the fields of their neighbors, and return the flat indices of
+        the neighbors.
+        """
+        if len(cells[-1]) == 0:
+            return np.zeros(0, dtype=np.intp)
+        batch, rows, cols = cells[:-2], cells[-2], cells[-1]
+        targets = []
+        for i, (row_offset, col_offset) in enumerate(self.offsets):
+            # The cell is the (row_offset, col_offset) neighbor of this target
+            target_rows = rows + self.radius - row_offset
+            target_cols = cols + self.radius - col_offset
+            target = batch + (target_rows, target_cols)
+            self.log_survival[target] += (
+                sign * self.log_mask[i, target_rows, target_cols]
+            )
+            self.exposure[target] += sign
+            targets.append(np.ravel_multi_index(target, self.exposure.shape))
+        return np.concatenate(targets)
+
+    def follow(self, started: Optional[tuple] = None, stopped: Optional[tuple] = None):
+        """
+        Bring the fields up to date with grid cells that started or stopped
+        burning, given as indices like np.nonzero returns. Cells that were
+        already in that state are skipped, and only the changed cells and their
+        neighbors are looked at.
+        """
+        changed = []
+        burning = self.burning.reshape(-1)
+        for cells, sign in [(started, 1), (stopped, -1)]:
+            if cells is None or len(cells[-1]) == 0:
+                continue
+            flat = np.unique(self.flat_index(cells))
+            flat = flat[burning[flat] != (sign == 1)]
+            burning[flat] = sign == 1
+            self.num_burning += sign * len(flat)
+            changed += [flat, self.stamp(self.grid_index(flat), sign)]
+        if len(changed) == 0:
+            return
+
+        # Only changed cells and their neighbors can join or leave the candidates
+        touched = np.union1d(self.candidates, np.concatenate(changed))
+        exposed = self.exposure.reshape(-1)[touched] > 0
+        self.candidates = touched[exposed & ~burning[touched]]
+
+    def rebuild(self, burning: np.ndarray):
+        """
+        Set up the fields from scratch for a layer of burning cells.
+        """
+        padded_shape = self.padded_shape(burning.shape)
+        # Cells off the grid count as burning, so they are never candidates
+        self.burning = np.ones(padded_shape, dtype=bool)
+        self.interior(self.burning)[...] = False
+        self.log_survival = np.zeros(padded_shape)
+        self.exposure = np.zeros(padded_shape, dtype=np.int32)
+        self.candidates = np.zeros(0, dtype=np.intp)
+        self.num_burning = 0
+        self.follow(np.nonzero(burning))
+
+    def update(self, fire: np.ndarray) -> np.ndarray:
+        """
+        Bring the fields up to date with a fire layer by comparing it with the
+        last one (or rebuild them for a layer of another shape), and return
+        which of its cells are burning.
+        """
+        burning = fire == 1
+        if not self.fits(burning.shape):
+            self.rebuild(burning)
+        else:
+            known = self.interior(self.burning)
+            changed = burning != known
+            if changed.any():
+                self.follow(np.nonzero(changed & burning), np.nonzero(changed & known))
+        return burning
+
+    def interior(self, field: np.ndarray) -> np.ndarray:
+        """
+        View the part of a padded field that lies on the grid.
+        """
+        num_rows, num_cols = (size - 2 * self.radius for size in field.shape[-2:])
+        return field[
+            ...,
+            self.radius : self.radius + num_rows,
+            self.radius : self.radius + num_cols,
+        ]
+
+    def ignition_probability(self, fire: np.ndarray) -> np.ndarray:
+        """
+        Compute the probability of every cell igniting, like ignition_probability
+        does for the dense mask.
+        """
+        self.update(fire)
+        probability = 1 - np.exp(self.interior(self.log_survival))
+        return np.where(self.interior(self.exposure) > 0, probability, 0)
+
+    def ignite(self, fire: np.ndarray, stopped: Optional[tuple] = None):
+        """
+        Sample which cells are ignited by their burning neighbors and set them
+        on fire, in place, for a single (n, m) fire layer or a (batch, n, m)
+        stack of them. Only cells next to the fire are sampled.
+        - stopped holds the cells that stopped burning since the last call
+          (indexed like np.nonzero returns), for a layer that is otherwise the
+          one that call left, along with any cells passed to follow since.
+          The fields then only follow the changed cells. Without it, the
+          whole layer is compared with the last one.
+        """
+        if stopped is None or not self.fits(fire.shape):
+            self.update(fire)
+        else:
+            self.follow(stopped=stopped)
+        candidates = self.candidates
+        probability = 1 - np.exp(self.log_survival.reshape(-1)[candidates])
+        ignites = torch.rand(len(probability), dtype=torch.float64).numpy()
+        started = self.grid_index(candidates[ignites < probability])
+        fire[started] = 1
+        self.follow(started)
@@ -0,0 +1,73 @@
+"""
+Per-step timing and work counters for finding out where a step spends its time
+"""
+
+import contextlib
+import time
+from typing import ContextManager, Dict, Iterator, Optional
+
+
+class StepStats:
+    """
+    Records wall time (as "<phase>_seconds") and counters for the latest step
+    and adds them up over every step since the stats were last reset.
+    """
+
+    def __init__(self):
+        """
+        Start without any recorded steps.
+        """
+        self.reset()
+
+    def reset(self):
+        """
+        Forget every recorded step.
+        """
+        self.last: Dict[str, float] = {}
+        self.totals: Dict[str, float] = {}
+        self.num_steps = 0
+
+    def start_step(self):
+        """
+        Start recording a new step.
+        """
+        self.last = {}
+        self.num_steps += 1
+
+    def add(self, key: str, value: float):
+        """
+        Add to a counter of the current step.
+        """
+        self.last[key] = self.last.get(key, 0) + value
+        self.totals[key] = self.totals.get(key, 0) + value
+
+    @contextlib.contextmanager
+    def time(self, phase: str) -> Iterator[None]:
+        """
+        Add the wall time spent in the block to the phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase + "_seconds", time.perf_counter() - start)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Get the totals of every counter and their means per step.
+        """
+        return {
+            "totals": dict(self.totals, steps=self.num_steps),
+            "means": {
+                key: value / self.num_steps for key, value in self.totals.items()
+            },
+        }
+
+
+def time_phase(stats: Optional[StepStats], phase: str) -> ContextManager:
+    """
+    Time a phase of a step into stats, or do nothing if there are no stats.
+    """
+    if stats is None:
+        return contextlib.nullcontext()
+    return stats.time(phase)
@@ -0,0 +1,129 @@
+"""
+Fire propagation kernels shared by the single and batched simulations.
+"""
+
+import numpy as np
+import torch
+
+# Shared masks at least this wide are applied with an FFT convolution, whose
+# cost does not grow with the size of the kernel
+FFT_KERNEL_SIZE = 7
+
+
+def ignition_probability(fire: torch.Tensor, fire_mask: torch.Tensor) -> torch.Tensor:
+    """
+    Compute the probability that each cell is ignited by its burning neighbors.
+    - fire is an (n, m) grid or a (batch, n, m) stack of grids of 0s and 1s
+    - fire_mask holds, for each of the k * k neighbors in a k x k kernel, the
+      probability that it does not ignite the center cell, either as a (k * k, 1)
+      mask shared by every cell or as a (k * k, n * m) mask with one column per
+      cell
+    The returned tensor has the same shape as fire.
+    """
+    kernel_size = int(round(np.sqrt(fire_mask.shape[0])))
+    if fire_mask.shape[1] == 1 and kernel_size >= FFT_KERNEL_SIZE:
+        return fft_ignition_probability(fire, fire_mask)
+
+    # Runs kernel of neighborhing cells where each row
+    # corresponds to the neighborhood of a cell
+    shape = fire.shape
+    batch = fire.reshape((-1, 1) + tuple(shape[-2:]))
+    z = torch.nn.functional.unfold(
+        batch, (kernel_size, kernel_size), dilation=1, padding=kernel_size // 2
+    )
+
+    # The relative importance of each neighboring cell is weighted
+    z = z * fire_mask
+
+    # Unenflamed cells are set to 1 to eliminate their role to the
+    # fire spread equation
+    z[z == 0] = 1
+    z = z.prod(dim=1)
+    return 1 - z.reshape(shape)
+
+
+def fft_ignition_probability(
+    fire: torch.Tensor, fire_mask: torch.Tensor
+) -> torch.Tensor:
+    """
+    Compute the same probabilities as ignition_probability for a shared
+    (k * k, 1) mask, by summing the log of the mask over the burning neighbors
+    of each cell with an FFT convolution. Unfolding the neighborhoods needs
+    k * k values per cell, while this needs a few per cell whatever k is.
+    """
+    shape = fire.shape
+    num_rows, num_cols = shape[-2:]
+    kernel_size = int(round(np.sqrt(fire_mask.shape[0])))
+    batch = fire.reshape((-1, num_rows, num_cols)).to(torch.float64)
+
+    # Certain ignition has no log, so it is clamped to nearly certain
+    log_mask = torch.log(fire_mask.to(torch.float64).clamp(min=1e-12))
+    # The mask weighs neighbors rather than offsets, so it is flipped into a
+    # convolution kernel
+    kernel = log_mask.reshape((kernel_size, kernel_size)).flip((0, 1))
+
+    # Pad both to the full linear convolution so nothing wraps around
+    fft_shape = (num_rows + kernel_size - 1, num_cols + kernel_size - 1)
+    log_survival = torch.fft.irfft2(
+        torch.fft.rfft2(batch, fft_shape) * torch.fft.rfft2(kernel, fft_shape),
+        fft_shape,
+    )
+    radius = kernel_size // 2
+    log_survival = log_survival[
+        :, radius : radius + num_rows, radius : radius + num_cols
+    ]
+
+    # Round off the error of the transform, so cells without burning neighbors
+    # cannot ignite
+    log_survival = torch.where(
+        log_survival > -1e-9, torch.zeros_like(log_survival), log_survival
+    )
+    return (1 - torch.exp(log_survival)).reshape(shape)
+
+
+def expected_ignition_probability(
+    burning: torch.Tensor, fire_mask: torch.Tensor
+) -> torch.Tensor:
+    """
+    Compute the probability that each cell is ignited when each neighbor is
+    burning with some probability, treating neighbors as independent.
+    - burning is an (n, m) grid or a (batch, n, m) stack of grids of burning
+      probabilities
+    - fire_mask is a (k * k, 1) or (k * k, n * m) mask, as in ignition_probability
+    For grids of 0s and 1s this gives the same result as ignition_probability.
+    """
+    kernel_size = int(round(np.sqrt(fire_mask.shape[0])))
+    shape = burning.shape
+    batch = burning.reshape((-1, 1) + tuple(shape[-2:])).to(torch.float64)
+    z = torch.nn.functional.unfold(
+        batch, (kernel_size, kernel_size), dilation=1, padding=kernel_size // 2
+    )
+
+    # A neighbor fails to ignite the cell if it is not burning, or if it is
+    # burning and does not spread
+    z = 1 - z * (1 - fire_mask.to(torch.float64))
+    z = z.prod(dim=1)
+    return 1 - z.reshape(shape)
+
+
+def class_ignition_probability(
+    fire: torch.Tensor, class_kernels: torch.Tensor, class_weights: torch.Tensor
+) -> torch.Tensor:
+    """
+    Compute the probability that each cell is ignited, when the chance of a
+    neighbor not igniting a cell only depends on the neighbor's distance class
+    and on the cell.
+    - class_kernels is a (classes, 1, k, k) stack of kernels marking the
+      neighbors in each class
+    - class_weights is a (classes, n, m) stack of the log probability that a
+      burning neighbor of each class does not ignite each cell
+    Counting the burning neighbors of each class is a single convolution, so
+    this costs about as much as a grid with one shared mask.
+    """
+    shape = fire.shape
+    batch = fire.reshape((-1, 1) + tuple(shape[-2:])).to(class_kernels.dtype)
+    counts = torch.nn.functional.conv2d(
+        batch, class_kernels, padding=class_kernels.shape[-1] // 2
+    )
+    log_survival = (counts * class_weights).sum(dim=1)
+    return (1 - torch.exp(log_survival)).reshape(shape)
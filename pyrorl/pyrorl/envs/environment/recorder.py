@@ -0,0 +1,337 @@
+"""
+Delta-encoded recording and replay of FireWorld episodes
+"""
+
+import json
+import numpy as np
+import struct
+from typing import Dict, NamedTuple, Optional
+
+from .environment import (
+    FireWorld,
+    FIRE_INDEX,
+    FUEL_INDEX,
+    POPULATED_INDEX,
+    EVACUATING_INDEX,
+    PATHS_INDEX,
+)
+
+"""
+Layout of a recording file:
+- magic bytes, format version and the length of a JSON header
+- the full initial state, followed by the cells of every path
+- one record per step: a fixed size header followed by the step's deltas
+"""
+EPISODE_MAGIC = b"PYRORLEP"
+EPISODE_VERSION = 1
+PREAMBLE = struct.Struct("<8sII")
+
+# Timestep, action, reward, then the number of entries in each delta group
+RECORD_HEADER = struct.Struct("<qqd8q")
+DELTA_GROUPS = (
+    "ignitions",
+    "extinguished",
+    "destroyed_paths",
+    "evacuations_started",
+    "evacuations_finished",
+    "evacuations_stopped",
+    "depopulated",
+    "fuel_cells",
+)
+
+
+def _padded(num_bytes: int) -> int:
+    """
+    Round a number of bytes up so the next array starts 8-byte aligned.
+    """
+    return (num_bytes + 7) // 8 * 8
+
+
+class StepRecord(NamedTuple):
+    """
+    Everything that changed during a single step. Cells are flat indices into
+    the grid (row * num_cols + col).
+    """
+
+    timestep: int
+    action: int
+    reward: float
+    ignitions: np.ndarray
+    extinguished: np.ndarray
+    destroyed_paths: np.ndarray
+    evacuations_started: np.ndarray
+    evacuations_finished: np.ndarray
+    evacuations_stopped: np.ndarray
+    depopulated: np.ndarray
+    fuel_cells: np.ndarray
+    fuel_values: np.ndarray
+
+
+class EpisodeRecorder:
+    """
+    Records an episode of a FireWorld to an append-only binary file. The initial
+    state is stored once and every call to `record` appends the changes made since
+    the previous call.
+    """
+
+    def __init__(self, world: FireWorld, file_path: str):
+        """
+        Write the file preamble with the world's current state.
+        """
+        self.world = world
+        self.file_path = file_path
+        state = world.state_space
+        _, num_rows, num_cols = state.shape
+
+        # Flat indices of the cells covered by each path, so replay can remove
+        # destroyed paths from the paths layer
+        path_cells = [np.flatnonzero(path[0]) for path in world.paths]
+        path_offsets = np.cumsum([0] + [len(cells) for cells in path_cells])
+        if len(path_cells) > 0:
+            path_cells = np.concatenate(path_cells)
+        else:
+            path_cells = np.zeros(0)
+
+        header = {
+            "num_rows": num_rows,
+            "num_cols": num_cols,
+            "num_layers": state.shape[0],
+            "num_paths": len(world.paths),
+            "num_path_cells": len(path_cells),
+            "timestep": world.get_timestep(),
+        }
+        header_bytes = json.dumps(header).encode("utf-8")
+        header_bytes += b" " * (_padded(len(header_bytes)) - len(header_bytes))
+
+        self.file = open(file_path, "wb")
+        self.file.write(
+            PREAMBLE.pack(EPISODE_MAGIC, EPISODE_VERSION, len(header_bytes))
+        )
+        self.file.write(header_bytes)
+        self.file.write(np.ascontiguousarray(state, dtype="<f8").tobytes())
+        self.file.write(path_cells.astype("<i8").tobytes())
+        self.file.write(path_offsets.astype("<i8").tobytes())
+        self.file.flush()
+
+        # Remember the state so we can diff against it on the next step
+        self._remember()
+
+    def _remember(self):
+        """
+        Keep copies of the parts of the world that records are diffed against.
+        """
+        state = self.world.state_space
+        self.fire = state[FIRE_INDEX].ravel() == 1
+        self.fuel = state[FUEL_INDEX].ravel().copy()
+        self.populated = state[POPULATED_INDEX].ravel() == 1
+        self.evacuating = state[EVACUATING_INDEX].ravel() > 0
+        self.path_alive = np.array([path[1] for path in self.world.paths], dtype=bool)
+        self.num_finished = len(self.world.get_finished_evacuating())
+
+    def record(self, action: int, reward: float = 0):
+        """
+        Append the changes since the previous record, along with the action that
+        was taken and the reward that was received.
+        """
+        state = self.world.state_space
+        num_cols = state.shape[2]
+        fire = state[FIRE_INDEX].ravel() == 1
+        populated = state[POPULATED_INDEX].ravel() == 1
+        evacuating = state[EVACUATING_INDEX].ravel() > 0
+        path_alive = np.array([path[1] for path in self.world.paths], dtype=bool)
+
+        # Cells that finished evacuating are split out of the other stopped ones
+        finished = self.world.get_finished_evacuating()[self.num_finished :]
+        finished = np.array(
+            [row * num_cols + col for row, col in finished], dtype=np.int64
+        )
+        stopped = np.flatnonzero(self.evacuating & ~evacuating)
+        stopped = np.setdiff1d(stopped, finished)
+
+        # Fuel normally follows from the fire layer; anything else is stored
+        fuel = state[FUEL_INDEX].ravel()
+        fuel_cells = np.flatnonzero(fuel != predict_fuel(self.fuel, self.fire))
+
+        groups = [
+            np.flatnonzero(fire & ~self.fire),
+            np.flatnonzero(self.fire & ~fire),
+            np.flatnonzero(self.path_alive & ~path_alive),
+            np.flatnonzero(evacuating & ~self.evacuating),
+            finished,
+            stopped,
+            np.flatnonzero(self.populated & ~populated),
+            fuel_cells,
+        ]
+        self.file.write(
+            RECORD_HEADER.pack(
+                self.world.get_timestep(),
+                int(action),
+                float(reward),
+                *[len(group) for group in groups]
+            )
+        )
+        payload = np.concatenate(groups).astype("<i4").tobytes()
+        payload += b"\0" * (_padded(len(payload)) - len(payload))
+        self.file.write(payload)
+        self.file.write(fuel[fuel_cells].astype("<f8").tobytes())
+        self.file.flush()
+        self._remember()
+
+    def close(self):
+        """
+        Close the underlying file.
+        """
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def predict_fuel(fuel: np.ndarray, fire: np.ndarray) -> np.ndarray:
+    """
+    Fuel after one step, given the fuel and fire before it.
+    """
+    fuel = fuel.copy()
+    fuel[fire] -= 1
+    fuel[fuel < 0] = 0
+    return fuel
+
+
+class EpisodeReplay:
+    """
+    Memory-maps a recording made by EpisodeRecorder. Records are only decoded
+    when they are accessed, and the state at any timestep can be rebuilt from the
+    nearest cached checkpoint.
+    """
+
+    def __init__(self, file_path: str, checkpoint_interval: int = 64):
+        """
+        Map the file and parse its preamble.
+        """
+        self.data = np.memmap(file_path, dtype=np.uint8, mode="r")
+        magic, version, header_len = PREAMBLE.unpack_from(self.data, 0)
+        if magic != EPISODE_MAGIC:
+            raise ValueError("File is not a PyroRL episode recording!")
+        if version != EPISODE_VERSION:
+            raise ValueError("Unsupported episode recording version!")
+        offset = PREAMBLE.size
+        header = json.loads(bytes(self.data[offset : offset + header_len]))
+        offset += header_len
+
+        self.num_rows = header["num_rows"]
+        self.num_cols = header["num_cols"]
+        self.start_timestep = header["timestep"]
+        state_shape = (header["num_layers"], self.num_rows, self.num_cols)
+        num_values = int(np.prod(state_shape))
+        self._initial_state = self._view(offset, "<f8", num_values).reshape(state_shape)
+        offset += 8 * num_values
+        self.path_cells = self._view(offset, "<i8", header["num_path_cells"])
+        offset += 8 * header["num_path_cells"]
+        self.path_offsets = self._view(offset, "<i8", header["num_paths"] + 1)
+        offset += 8 * (header["num_paths"] + 1)
+
+        # Offsets of each record, found by hopping from header to header
+        self._record_offsets = []
+        self._scan_offset = offset
+        self.checkpoint_interval = checkpoint_interval
+        self._checkpoints: Dict[int, np.ndarray] = {}
+
+    def _view(self, offset: int, dtype: str, count: int) -> np.ndarray:
+        """
+        View part of the mapped file as an array without copying it.
+        """
+        return np.frombuffer(self.data, dtype=dtype, count=count, offset=offset)
+
+    def _scan(self, until: Optional[int] = None):
+        """
+        Index record offsets, stopping once `until` records are known. A partially
+        written record at the end of the file is ignored.
+        """
+        while until is None or len(self._record_offsets) < until:
+            offset = self._scan_offset
+            if offset + RECORD_HEADER.size > len(self.data):
+                break
+            counts = RECORD_HEADER.unpack_from(self.data, offset)[3:]
+            size = RECORD_HEADER.size + _padded(4 * sum(counts)) + 8 * counts[-1]
+            if offset + size > len(self.data):
+                break
+            self._record_offsets.append(offset)
+            self._scan_offset = offset + size
+
+    def __len__(self) -> int:
+        """
+        Number of recorded steps.
+        """
+        self._scan()
+        return len(self._record_offsets)
+
+    def __getitem__(self, index: int) -> StepRecord:
+        """
+        Decode the record of a single step.
+        """
+        if index < 0:
+            index += len(self)
+        self._scan(index + 1)
+        if index < 0 or index >= len(self._record_offsets):
+            raise IndexError("Record index out of range!")
+
+        offset = self._record_offsets[index]
+        fields = RECORD_HEADER.unpack_from(self.data, offset)
+        timestep, action, reward, counts = fields[0], fields[1], fields[2], fields[3:]
+        offset += RECORD_HEADER.size
+
+        # Slice each delta group out of the shared payload
+        num_ints = sum(counts)
+        payload = self._view(offset, "<i4", num_ints)
+        bounds = np.cumsum((0,) + counts)
+        groups = [payload[bounds[i] : bounds[i + 1]] for i in range(len(counts))]
+        fuel_values = self._view(offset + _padded(4 * num_ints), "<f8", counts[-1])
+        return StepRecord(timestep, action, reward, *groups, fuel_values)
+
+    def initial_state(self) -> np.ndarray:
+        """
+        Get a copy of the state the recording started from.
+        """
+        return np.array(self._initial_state)
+
+    def state_at(self, index: int) -> np.ndarray:
+        """
+        Get the state after `index` recorded steps (0 is the initial state).
+        """
+        if index < 0 or index > len(self):
+            raise IndexError("Step index out of range!")
+
+        # Start from the closest checkpoint at or before the requested step
+        start = max([i for i in self._checkpoints if i <= index], default=0)
+        state = self._checkpoints[start].copy() if start else self.initial_state()
+        for i in range(start, index):
+            self.apply(state, self[i])
+            if (i + 1) % self.checkpoint_interval == 0:
+                self._checkpoints.setdefault(i + 1, state.copy())
+        return state
+
+    def apply(self, state: np.ndarray, record: StepRecord):
+        """
+        Apply a record's deltas to a state in place.
+        """
+        fire = state[FIRE_INDEX].reshape(-1)
+        fuel = state[FUEL_INDEX].reshape(-1)
+        fuel[:] = predict_fuel(fuel, fire == 1)
+        fuel[record.fuel_cells] = record.fuel_values
+
+        fire[record.ignitions] = 1
+        fire[record.extinguished] = 0
+
+        paths = state[PATHS_INDEX].reshape(-1)
+        for path in record.destroyed_paths:
+            start, end = self.path_offsets[path], self.path_offsets[path + 1]
+            paths[self.path_cells[start:end]] -= 1
+
+        evacuating = state[EVACUATING_INDEX].reshape(-1)
+        evacuating[record.evacuations_started] = 1
+        evacuating[record.evacuations_finished] = 0
+        evacuating[record.evacuations_stopped] = 0
+        state[POPULATED_INDEX].reshape(-1)[record.depopulated] = 0
@@ -0,0 +1,92 @@
+"""
+Ember spotting: burning cells throwing embers that ignite cells far ahead of
+the fire front.
+"""
+
+import numpy as np
+import torch
+from typing import NamedTuple, Optional, Tuple
+
+
+class SpottingModel(NamedTuple):
+    """
+    How embers are thrown from burning cells.
+    - ember_rate is the mean number of embers a burning cell throws per step
+    - mean_distance is the mean distance (in cells) that an ember travels, in the
+      direction the wind blows (or in a random direction without wind)
+    - scatter is the standard deviation (in cells) of where embers land around
+      that point
+    - ignition_probability is the chance that an ember ignites the cell it lands
+      on
+    """
+
+    ember_rate: float = 0.02
+    mean_distance: float = 8
+    scatter: float = 1.5
+    ignition_probability: float = 0.5
+
+
+def check_spotting_model(model: SpottingModel) -> SpottingModel:
+    """
+    Make sure the parameters of a spotting model are valid.
+    """
+    model = SpottingModel(*model)
+    if model.ember_rate < 0 or model.scatter < 0:
+        raise ValueError("Ember rate and scatter cannot be negative!")
+    if model.mean_distance <= 0:
+        raise ValueError("Mean ember distance should be positive!")
+    if not 0 <= model.ignition_probability <= 1:
+        raise ValueError("Ember ignition probability must be in [0, 1]!")
+    return model
+
+
+def sample_embers(
+    fire: np.ndarray, model: SpottingModel, wind_angle: Optional[float] = None
+) -> Tuple[np.ndarray, ...]:
+    """
+    Sample the cells ignited by embers from the burning cells of a single (n, m)
+    fire layer or a (batch, n, m) stack of them, returned as an index into fire.
+    Only burning cells are visited and only the embers they throw are drawn, so
+    the cost grows with the number of burning cells and not with how far embers
+    can travel. The wind angle follows the same convention as the fire mask.
+    """
+    burning = np.argwhere(fire == 1)
+    num_embers = (
+        torch.poisson(torch.full((len(burning),), float(model.ember_rate)))
+        .long()
+        .numpy()
+    )
+    sources = np.repeat(burning, num_embers, axis=0)
+    total = len(sources)
+    if total == 0:
+        return tuple(np.zeros((fire.ndim, 0), dtype=int))
+
+    # Travel along the wind, then scatter around the landing point
+    distance = torch.empty(total, dtype=torch.float64).exponential_(
+        1 / model.mean_distance
+    )
+    if wind_angle is None:
+        angle = torch.rand(total, dtype=torch.float64) * 2 * np.pi
+    else:
+        angle = torch.full((total,), float(wind_angle), dtype=torch.float64)
+    scatter = torch.randn((total, 2), dtype=torch.float64) * model.scatter
+    # Angles point up the grid, towards lower row numbers
+    row_offsets = -distance * torch.sin(angle) + scatter[:, 0]
+    col_offsets = distance * torch.cos(angle) + scatter[:, 1]
+    rows = sources[:, -2] + torch.round(row_offsets).long().numpy()
+    cols = sources[:, -1] + torch.round(col_offsets).long().numpy()
+
+    # Embers that leave the grid are lost
+    num_rows, num_cols = fire.shape[-2:]
+    ignites = torch.rand(total, dtype=torch.float64).numpy()
+    ignites = (
+        (ignites < model.ignition_probability)
+        & (rows >= 0)
+        & (rows < num_rows)
+        & (cols >= 0)
+        & (cols < num_cols)
+    )
+    targets = sources[ignites]
+    targets[:, -2] = rows[ignites]
+    targets[:, -1] = cols[ignites]
+    return tuple(targets.T)
@@ -0,0 +1,174 @@
+"""
+Switching between fire propagation engines as the fire grows and shrinks.
+"""
+
+import copy
+import numpy as np
+import torch
+from typing import Callable, Dict, Optional
+
+from .bitboard import BitboardPropagator
+from .incremental import IncrementalPropagator
+from .propagation import fft_ignition_probability
+
+STRATEGIES = ("frontier", "bitboard", "dense")
+
+# Fractions of burning cells at which the next strategy becomes the cheapest
+SPARSE_FRACTION = 0.02
+DENSE_FRACTION = 0.15
+# A strategy is only left once the fraction is this factor past its bounds
+HYSTERESIS = 1.25
+# Grids with fewer cells are always propagated densely
+MIN_SPARSE_CELLS = 64 * 64
+
+
+class AutoPropagator:
+    """
+    Samples fire spread with whichever strategy is cheapest for the current
+    fraction of burning cells:
+    - "frontier" (an IncrementalPropagator), best while few cells burn or
+      change
+    - "bitboard" (a BitboardPropagator), best for medium-sized fires (only
+      available for masks shared by every cell)
+    - "dense" (ignition_probability), best once the fire is widespread or the
+      grid is small
+    Every strategy ignites each cell independently with the same probability,
+    so switching never changes the distribution of fire spread. To avoid
+    switching back and forth around a bound, a strategy is only left once the
+    fraction is HYSTERESIS times past it. last_strategy, strategy_steps and
+    num_switches record which strategies ran.
+    """
+
+    def __init__(
+        self,
+        fire_mask: torch.Tensor,
+        ignition: Callable[[torch.Tensor], torch.Tensor],
+        num_rows: int,
+        num_cols: int,
+        sparse_fraction: float = SPARSE_FRACTION,
+        dense_fraction: float = DENSE_FRACTION,
+        hysteresis: float = HYSTERESIS,
+    ):
+        """
+        Set up the strategies that the fire mask allows. ignition computes the
+        dense ignition probability of a fire layer.
+        """
+        if not 0 <= sparse_fraction <= dense_fraction <= 1:
+            raise ValueError("Strategy fractions must be increasing and in [0, 1]!")
+        if hysteresis < 1:
+            raise ValueError("Hysteresis should be at least 1!")
+        self.fire_mask = fire_mask
+        self.ignition = ignition
+        self.shared_mask = fire_mask.shape[1] == 1
+        self.frontier = IncrementalPropagator(fire_mask, num_rows, num_cols)
+        self.bitboard = BitboardPropagator(fire_mask) if self.shared_mask else None
+        self.hysteresis = hysteresis
+
+        # Strategies in order of the fire size they suit, with the fraction of
+        # burning cells above which each one hands over to the next
+        if num_rows * num_cols < MIN_SPARSE_CELLS:
+            self.strategies, self.bounds = ["dense"], []
+        elif self.bitboard is None:
+            self.strategies, self.bounds = ["frontier", "dense"], [dense_fraction]
+        else:
+            self.strategies = list(STRATEGIES)
+            self.bounds = [sparse_fraction, dense_fraction]
+        self.current = 0
+
+        self.last_strategy: Optional[str] = None
+        self.strategy_steps: Dict[str, int] = {name: 0 for name in self.strategies}
+        self.num_switches = 0
+
+    def copy(
+        self, ignition: Optional[Callable[[torch.Tensor], torch.Tensor]] = None
+    ) -> "AutoPropagator":
+        """
+        Copy the frontier field and the strategy state, sharing the fire mask
+        and the bitboard (which keeps no state between steps). ignition
+        replaces the dense ignition probability of the copy, if given.
+        """
+        propagator = copy.copy(self)
+        propagator.frontier = self.frontier.copy()
+        propagator.strategy_steps = dict(self.strategy_steps)
+        if ignition is not None:
+            propagator.ignition = ignition
+        return propagator
+
+    def choose(self, fraction: float) -> str:
+        """
+        Pick the strategy for a fraction of burning cells, moving away from the
+        current one only when the fraction is clearly past its bounds.
+        """
+        current = self.current
+        while (
+            current < len(self.bounds)
+            and fraction > self.bounds[current] * self.hysteresis
+        ):
+            current += 1
+        while current > 0 and fraction < self.bounds[current - 1] / self.hysteresis:
+            current -= 1
+        if current != self.current and self.last_strategy is not None:
+            self.num_switches += 1
+        self.current = current
+        return self.strategies[current]
+
+    def dense_probability(self, fire: np.ndarray) -> torch.Tensor:
+        """
+        Evaluate the kernel at every cell, with an FFT convolution for shared
+        masks.
+        """
+        fire_tensor = torch.from_numpy(fire)
+        if self.shared_mask:
+            return fft_ignition_probability(fire_tensor, self.fire_mask)
+        return self.ignition(fire_tensor)
+
+    def ignition_probability(self, fire: np.ndarray) -> np.ndarray:
+        """
+        Compute the probability of every cell igniting with the strategy chosen
+        for the fire, like ignition_probability does for the dense mask.
+        """
+        strategy = self.choose(np.count_nonzero(fire == 1) / fire.size)
+        if strategy == "frontier":
+            return self.frontier.ignition_probability(fire)
+        if strategy == "bitboard":
+            return self.bitboard.ignition_probability(fire)
+        return self.dense_probability(fire).numpy()
+
+    def follow(self, started: Optional[tuple] = None, stopped: Optional[tuple] = None):
+        """
+        Pass cells that started or stopped burning outside of ignite on to the
+        frontier, if it sampled the last step (otherwise it compares the whole
+        layer when it is next used).
+        """
+        if self.last_strategy == "frontier":
+            self.frontier.follow(started, stopped)
+
+    def ignite(self, fire: np.ndarray, stopped: Optional[tuple] = None):
+        """
+        Sample which cells are ignited by their burning neighbors and set them
+        on fire, in place, for a single (n, m) fire layer or a (batch, n, m)
+        stack of them.
+        - stopped holds the cells that stopped burning since the last call, as
+          for IncrementalPropagator.ignite
+        """
+        # After a frontier step, the fire size follows from the changes alone
+        following = (
+            stopped is not None
+            and self.last_strategy == "frontier"
+            and self.frontier.fits(fire.shape)
+        )
+        if following:
+            num_burning = self.frontier.num_burning - len(stopped[-1])
+        else:
+            num_burning = np.count_nonzero(fire == 1)
+        strategy = self.choose(num_burning / fire.size)
+        if strategy == "frontier":
+            self.frontier.ignite(fire, stopped if following else None)
+        elif strategy == "bitboard":
+            self.bitboard.ignite(fire)
+        else:
+            z = self.dense_probability(fire)
+            prob_mask = torch.rand_like(z)
+            fire[(z > prob_mask).numpy()] = 1
+        self.last_strategy = strategy
+        self.strategy_steps[strategy] += 1
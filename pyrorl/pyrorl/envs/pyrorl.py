@@ -2,7 +2,11 @@
 OpenAI Gym Environment Wrapper Class
 """
 
-from pyrorl.envs.environment.environment import FireWorld
+from pyrorl.envs.environment.environment import FireWorld, FuelType
+from pyrorl.envs.environment.instrumentation import time_phase
+from pyrorl.envs.environment.spotting import SpottingModel
+from pyrorl.map_helpers.map_pool import MapPool
+from pyrorl.map_helpers.raster import RasterSource
 import gymnasium as gym
 from gymnasium import spaces
 import imageio.v2 as imageio
@@ -11,16 +15,11 @@ import os
 import pygame
 import shutil
 import sys
-from typing import Optional, Any
+from typing import Optional, Any, Sequence, Union
+from pyrorl.envs.viewer import GridViewer, draw_header, VIEWER_FPS
 
 # Constants for visualization
 IMG_DIRECTORY = "grid_screenshots/"
-FIRE_COLOR = pygame.Color("#ef476f")
-POPULATED_COLOR = pygame.Color("#073b4c")
-EVACUATING_COLOR = pygame.Color("#118ab2")
-PATH_COLOR = pygame.Color("#ffd166")
-GRASS_COLOR = pygame.Color("#06d6a0")
-FINISHED_COLOR = pygame.Color("#BF9ACA")
 
 
 class WildfireEvacuationEnv(gym.Env):
@@ -38,10 +37,34 @@ class WildfireEvacuationEnv(gym.Env):
         fuel_stdev: float = 3,
         fire_propagation_rate: float = 0.094,
         skip: bool = False,
+        map_pool: Optional[MapPool] = None,
+        fuel_map: Optional[Union[np.ndarray, RasterSource]] = None,
+        elevation: Optional[Union[np.ndarray, RasterSource]] = None,
+        cell_size: float = 30,
+        fuel_types: Optional[np.ndarray] = None,
+        fuel_type_params: Optional[Sequence[FuelType]] = None,
+        kernel_size: int = 5,
+        spotting: Optional[SpottingModel] = None,
+        max_timesteps: int = 100,
+        fast_forward: bool = False,
+        propagation_engine: str = "dense",
+        instrument: bool = False,
     ):
         """
-        Set up the basic environment and its parameters.
+        Set up the basic environment and its parameters. If a map_pool is given,
+        every reset replaces the map with the next map from the pool. If
+        instrument is set, the info of every step holds the time spent in each
+        phase of the step and the work it did (see FireWorld.get_step_stats).
         """
+        # Pool maps can have any size, so per-cell grids would not fit them
+        if map_pool is not None and any(
+            grid is not None for grid in [fuel_map, elevation, fuel_types]
+        ):
+            raise ValueError(
+                "A map pool cannot be combined with a fuel map, elevation or "
+                "fuel types!"
+            )
+
         # Save parameters and set up environment
         self.num_rows = num_rows
         self.num_cols = num_cols
@@ -55,6 +78,18 @@ class WildfireEvacuationEnv(gym.Env):
         self.fuel_stdev = fuel_stdev
         self.fire_propagation_rate = fire_propagation_rate
         self.skip = skip
+        self.map_pool = map_pool
+        self.fuel_map = fuel_map
+        self.elevation = elevation
+        self.cell_size = cell_size
+        self.fuel_types = fuel_types
+        self.fuel_type_params = fuel_type_params
+        self.kernel_size = kernel_size
+        self.spotting = spotting
+        self.max_timesteps = max_timesteps
+        self.fast_forward = fast_forward
+        self.propagation_engine = propagation_engine
+        self.instrument = instrument
         self.fire_env = FireWorld(
             num_rows,
             num_cols,
@@ -67,8 +102,32 @@ class WildfireEvacuationEnv(gym.Env):
             fuel_mean=fuel_mean,
             fuel_stdev=fuel_stdev,
             fire_propagation_rate=fire_propagation_rate,
+            fuel_map=fuel_map,
+            elevation=elevation,
+            cell_size=cell_size,
+            fuel_types=fuel_types,
+            fuel_type_params=fuel_type_params,
+            kernel_size=kernel_size,
+            spotting=spotting,
+            max_timesteps=max_timesteps,
+            fast_forward=fast_forward,
+            propagation_engine=propagation_engine,
+            instrument=instrument,
         )
 
+        self._set_spaces()
+
+        # The visualization window is created lazily on the first render
+        self.viewer: Optional[GridViewer] = None
+
+        # Create directory to store screenshots
+        if os.path.exists(IMG_DIRECTORY) is False:
+            os.mkdir(IMG_DIRECTORY)
+
+    def _set_spaces(self):
+        """
+        Set up the action and observation spaces for the current map.
+        """
         # Set up action space
         actions = self.fire_env.get_actions()
         self.action_space = spaces.Discrete(len(actions))
@@ -79,16 +138,30 @@ class WildfireEvacuationEnv(gym.Env):
             low=0, high=200, shape=observations.shape, dtype=np.float64
         )
 
-        # Create directory to store screenshots
-        if os.path.exists(IMG_DIRECTORY) is False:
-            os.mkdir(IMG_DIRECTORY)
-
     def reset(
         self, seed: Optional[int] = None, options: Optional[dict[str, Any]] = None
     ) -> tuple[np.ndarray, dict[str, Any]]:
         """
-        Reset the environment to its initial state.
+        Reset the environment to its initial state, on a new map if there is a
+        map pool.
         """
+        if self.map_pool is not None:
+            (
+                self.num_rows,
+                self.num_cols,
+                self.populated_areas,
+                self.paths,
+                self.paths_to_pops,
+                _,
+            ) = self.map_pool.get()
+
+            # A different grid size needs a new window
+            if self.viewer is not None and (
+                self.viewer.num_rows != self.num_rows
+                or self.viewer.num_cols != self.num_cols
+            ):
+                self.close()
+
         self.fire_env = FireWorld(
             self.num_rows,
             self.num_cols,
@@ -100,7 +173,20 @@ class WildfireEvacuationEnv(gym.Env):
             fuel_mean=self.fuel_mean,
             fuel_stdev=self.fuel_stdev,
             fire_propagation_rate=self.fire_propagation_rate,
+            fuel_map=self.fuel_map,
+            elevation=self.elevation,
+            cell_size=self.cell_size,
+            fuel_types=self.fuel_types,
+            fuel_type_params=self.fuel_type_params,
+            kernel_size=self.kernel_size,
+            spotting=self.spotting,
+            max_timesteps=self.max_timesteps,
+            fast_forward=self.fast_forward,
+            propagation_engine=self.propagation_engine,
+            instrument=self.instrument,
         )
+        if self.map_pool is not None:
+            self._set_spaces()
 
         state_space = self.fire_env.get_state()
         return state_space, {"": ""}
@@ -114,10 +200,22 @@ class WildfireEvacuationEnv(gym.Env):
         self.fire_env.advance_to_next_timestep()
 
         # Gather observations and rewards
-        observations = self.fire_env.get_state()
+        stats = self.fire_env.stats
+        with time_phase(stats, "observation"):
+            observations = self.fire_env.get_state()
+        if stats is not None:
+            stats.add("observation_bytes", observations.nbytes)
         rewards = self.fire_env.get_state_utility()
         terminated = self.fire_env.get_terminated()
-        return observations, rewards, terminated, False, {"": ""}
+        info = {"": ""} if stats is None else {"stats": dict(stats.last)}
+        return observations, rewards, terminated, False, info
+
+    def get_aggregate_stats(self) -> Optional[dict]:
+        """
+        Get the step times and counters of the current episode, added up and per
+        step, or None if the environment is not instrumented.
+        """
+        return self.fire_env.get_aggregate_stats()
 
     def render_hf(
         self, screen: pygame.Surface, font: pygame.font.Font
@@ -125,48 +223,7 @@ class WildfireEvacuationEnv(gym.Env):
         """
         Set up header and footer
         """
-        # Get width and height of the screen
-        surface_width = screen.get_width()
-        surface_height = screen.get_height()
-
-        # Starting locations and timestep
-        x_offset, y_offset = 0.05, 0.05
-        timestep = self.fire_env.get_timestep()
-
-        # Set title of the screen
-        text = font.render("Timestep #: " + str(timestep), True, (0, 0, 0))
-        screen.blit(text, (surface_width * x_offset, surface_height * y_offset))
-
-        # Set initial grid squares and offsets
-        grid_squares = [
-            (GRASS_COLOR, "Grass"),
-            (FIRE_COLOR, "Fire"),
-            (POPULATED_COLOR, "Populated"),
-            (EVACUATING_COLOR, "Evacuating"),
-            (PATH_COLOR, "Path"),
-            (FINISHED_COLOR, "Finished"),
-        ]
-        x_offset, y_offset = 0.2, 0.045
-
-        # Iterate through, create the grid squares
-        for i in range(len(grid_squares)):
-
-            # Get the color and name, set in the screen
-            (color, name) = grid_squares[i]
-            pygame.draw.rect(
-                screen,
-                color,
-                (surface_width * x_offset, surface_height * y_offset, 25, 25),
-            )
-            text = font.render(name, True, (0, 0, 0))
-            screen.blit(
-                text, (surface_width * x_offset + 35, surface_height * y_offset + 5)
-            )
-
-            # Adjust appropriate offset
-            x_offset += 0.125
-
-        return screen
+        return draw_header(screen, font, self.fire_env.get_timestep())
 
     def render(self):
         """
@@ -175,85 +232,42 @@ class WildfireEvacuationEnv(gym.Env):
         # Set up the state space
         state_space = self.fire_env.get_state()
         finished_evacuating = self.fire_env.get_finished_evacuating()
-        (_, rows, cols) = state_space.shape
-
-        # Get dimensions of the screen
-        pygame.init()
-        screen_info = pygame.display.Info()
-        screen_width = screen_info.current_w
-        screen_height = screen_info.current_h
-
-        # Set up screen and font
-        surface_width = screen_width * 0.8
-        surface_height = screen_height * 0.8
-        screen = pygame.display.set_mode([surface_width, surface_height])
-        font = pygame.font.Font(None, 25)
-
-        # Set screen details
-        screen.fill((255, 255, 255))
-        pygame.display.set_caption("PyroRL")
-        screen = self.render_hf(screen, font)
-
-        # Calculation for square
-        total_width = 0.85 * surface_width - 2 * (cols - 1)
-        total_height = 0.85 * surface_height - 2 * (rows - 1)
-        square_dim = min(int(total_width / cols), int(total_height / rows))
+        timestep = self.fire_env.get_timestep()
 
-        # Calculate start x, start y
-        start_x = surface_width - 2 * (cols - 1) - square_dim * cols
-        start_y = (
-            surface_height - 2 * (rows - 1) - square_dim * rows + 0.05 * surface_height
-        )
-        start_x /= 2
-        start_y /= 2
+        # The viewer keeps its window between calls, so only the squares that
+        # changed since the last render get redrawn
+        if self.viewer is None:
+            self.viewer = GridViewer(self.num_rows, self.num_cols)
+        self.viewer.draw(state_space, finished_evacuating, timestep)
+        screen = self.viewer.screen
 
         # Running the loop!
+        clock = pygame.time.Clock()
         running = True
         while running:
             # Did the user click the window close button?
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    timestep = self.fire_env.get_timestep()
                     pygame.image.save(screen, IMG_DIRECTORY + str(timestep) + ".png")
+                    self.close()
                     running = False
-
-            # Iterate through all of the squares
-            # Note: try to vectorize?
-            for x in range(cols):
-                for y in range(rows):
-
-                    # Set color of the square
-                    color = GRASS_COLOR
-                    if state_space[4][y][x] > 0:
-                        color = PATH_COLOR
-                    if state_space[0][y][x] == 1:
-                        color = FIRE_COLOR
-                    if state_space[2][y][x] == 1:
-                        color = POPULATED_COLOR
-                    if state_space[3][y][x] > 0:
-                        color = EVACUATING_COLOR
-                    if [y, x] in finished_evacuating:
-                        color = FINISHED_COLOR
-
-                    # Draw the square
-                    # self.grid_dim = min(self.grid_width, self.grid_height)
-                    square_rect = pygame.Rect(
-                        start_x + x * (square_dim + 2),
-                        start_y + y * (square_dim + 2),
-                        square_dim,
-                        square_dim,
-                    )
-                    pygame.draw.rect(screen, color, square_rect)
-
-            # Render and then quit outside
-            pygame.display.flip()
+                    break
 
             # If we skip, then we basically just render the canvas and then quit outside
-            if self.skip:
-                timestep = self.fire_env.get_timestep()
+            if self.skip and running:
                 pygame.image.save(screen, IMG_DIRECTORY + str(timestep) + ".png")
                 running = False
-        pygame.quit()
+
+            # Nothing changes while we wait, so there is no need to spin
+            clock.tick(VIEWER_FPS)
+
+    def close(self):
+        """
+        Close the visualization window if one is open.
+        """
+        if self.viewer is not None:
+            self.viewer.close()
+            self.viewer = None
 
     def generate_gif(self):
         """
@@ -0,0 +1,293 @@
+"""
+Persistent Pygame viewer for the wildfire grid
+"""
+
+from pyrorl.envs.environment.environment import (
+    FIRE_INDEX,
+    POPULATED_INDEX,
+    EVACUATING_INDEX,
+    PATHS_INDEX,
+)
+import numpy as np
+import pygame
+from typing import List, Optional
+
+# Constants for visualization
+FIRE_COLOR = pygame.Color("#ef476f")
+POPULATED_COLOR = pygame.Color("#073b4c")
+EVACUATING_COLOR = pygame.Color("#118ab2")
+PATH_COLOR = pygame.Color("#ffd166")
+GRASS_COLOR = pygame.Color("#06d6a0")
+FINISHED_COLOR = pygame.Color("#BF9ACA")
+
+"""
+Indices into the color palette, ordered by drawing priority
+"""
+GRASS_CODE = 0
+PATH_CODE = 1
+FIRE_CODE = 2
+POPULATED_CODE = 3
+EVACUATING_CODE = 4
+FINISHED_CODE = 5
+PALETTE = [
+    GRASS_COLOR,
+    PATH_COLOR,
+    FIRE_COLOR,
+    POPULATED_COLOR,
+    EVACUATING_COLOR,
+    FINISHED_COLOR,
+]
+PALETTE_RGB = np.array([[c.r, c.g, c.b] for c in PALETTE], dtype=np.uint8)
+
+# Spacing (in pixels) between neighboring grid squares
+SQUARE_GAP = 2
+
+# Maximum number of frames per second the viewer loop polls events at
+VIEWER_FPS = 30
+
+
+def get_color_codes(state_space: np.ndarray, finished_evacuating: list) -> np.ndarray:
+    """
+    Map every cell of the state space to the index of its color in the palette.
+    Later assignments take priority, matching the order cells used to be colored in.
+    """
+    _, rows, cols = state_space.shape
+    codes = np.full((rows, cols), GRASS_CODE, dtype=np.uint8)
+    codes[state_space[PATHS_INDEX] > 0] = PATH_CODE
+    codes[state_space[FIRE_INDEX] == 1] = FIRE_CODE
+    codes[state_space[POPULATED_INDEX] == 1] = POPULATED_CODE
+    codes[state_space[EVACUATING_INDEX] > 0] = EVACUATING_CODE
+    if len(finished_evacuating) > 0:
+        finished = np.array(finished_evacuating, dtype=int).reshape((-1, 2))
+        codes[finished[:, 0], finished[:, 1]] = FINISHED_CODE
+    return codes
+
+
+def draw_header(
+    screen: pygame.Surface, font: pygame.font.Font, timestep: int
+) -> pygame.Surface:
+    """
+    Set up header (timestep) and footer (legend of grid squares)
+    """
+    draw_timestep(screen, font, timestep)
+    draw_legend(screen, font)
+    return screen
+
+
+def draw_timestep(
+    screen: pygame.Surface, font: pygame.font.Font, timestep: int
+) -> pygame.Rect:
+    """
+    Draw the timestep title and return the area of the screen it covers.
+    """
+    surface_width = screen.get_width()
+    surface_height = screen.get_height()
+    x_offset, y_offset = 0.05, 0.05
+
+    # Clear out the previous title before drawing the new one
+    title_rect = pygame.Rect(
+        int(surface_width * x_offset),
+        int(surface_height * y_offset),
+        int(surface_width * 0.15),
+        25,
+    )
+    screen.fill((255, 255, 255), title_rect)
+    text = font.render("Timestep #: " + str(timestep), True, (0, 0, 0))
+    screen.blit(text, (surface_width * x_offset, surface_height * y_offset))
+    return title_rect
+
+
+def draw_legend(screen: pygame.Surface, font: pygame.font.Font):
+    """
+    Draw the legend mapping each grid square color to its meaning.
+    """
+    surface_width = screen.get_width()
+    surface_height = screen.get_height()
+
+    # Set initial grid squares and offsets
+    grid_squares = [
+        (GRASS_COLOR, "Grass"),
+        (FIRE_COLOR, "Fire"),
+        (POPULATED_COLOR, "Populated"),
+        (EVACUATING_COLOR, "Evacuating"),
+        (PATH_COLOR, "Path"),
+        (FINISHED_COLOR, "Finished"),
+    ]
+    x_offset, y_offset = 0.2, 0.045
+
+    # Iterate through, create the grid squares
+    for i in range(len(grid_squares)):
+
+        # Get the color and name, set in the screen
+        color, name = grid_squares[i]
+        pygame.draw.rect(
+            screen,
+            color,
+            (surface_width * x_offset, surface_height * y_offset, 25, 25),
+        )
+        text = font.render(name, True, (0, 0, 0))
+        screen.blit(
+            text, (surface_width * x_offset + 35, surface_height * y_offset + 5)
+        )
+
+        # Adjust appropriate offset
+        x_offset += 0.125
+
+
+class GridViewer:
+    """
+    A viewer that keeps its Pygame surface alive across steps. Each call to
+    `draw` only repaints the grid squares whose color changed since the previous
+    frame and only pushes those rectangles to the display. When the grid is too
+    large for every cell to get its own pixel, the grid is downsampled and blitted
+    pixel by pixel instead.
+    """
+
+    def __init__(self, num_rows: int, num_cols: int):
+        """
+        Record the grid dimensions; the window is only opened on the first draw.
+        """
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.screen: Optional[pygame.Surface] = None
+        self.font: Optional[pygame.font.Font] = None
+        self.color_codes: Optional[np.ndarray] = None
+
+    def open(self):
+        """
+        Open the window and lay out the grid if it is not already open.
+        """
+        if self.screen is not None and pygame.display.get_init():
+            return
+
+        # Get dimensions of the screen
+        pygame.init()
+        screen_info = pygame.display.Info()
+        screen_width = screen_info.current_w
+        screen_height = screen_info.current_h
+
+        # Set up screen and font
+        surface_width = screen_width * 0.8
+        surface_height = screen_height * 0.8
+        self.screen = pygame.display.set_mode([surface_width, surface_height])
+        self.font = pygame.font.Font(None, 25)
+
+        # Set screen details
+        self.screen.fill((255, 255, 255))
+        pygame.display.set_caption("PyroRL")
+        draw_legend(self.screen, self.font)
+
+        # Calculation for square
+        rows, cols = self.num_rows, self.num_cols
+        total_width = 0.85 * surface_width - SQUARE_GAP * (cols - 1)
+        total_height = 0.85 * surface_height - SQUARE_GAP * (rows - 1)
+        self.square_dim = min(int(total_width / cols), int(total_height / rows))
+
+        # Calculate start x, start y
+        if self.square_dim >= 1:
+            grid_width = SQUARE_GAP * (cols - 1) + self.square_dim * cols
+            grid_height = SQUARE_GAP * (rows - 1) + self.square_dim * rows
+        else:
+            # Cells are smaller than a pixel, so we shrink the whole grid into
+            # a downsampled image that keeps the aspect ratio of the map
+            scale = min(0.85 * surface_width / cols, 0.85 * surface_height / rows)
+            grid_width = max(1, int(cols * scale))
+            grid_height = max(1, int(rows * scale))
+            self.pixel_rows = np.minimum(
+                (np.arange(grid_height) * rows) // grid_height, rows - 1
+            )
+            self.pixel_cols = np.minimum(
+                (np.arange(grid_width) * cols) // grid_width, cols - 1
+            )
+        self.start_x = int((surface_width - grid_width) / 2)
+        self.start_y = int((surface_height - grid_height + 0.05 * surface_height) / 2)
+        self.grid_width, self.grid_height = grid_width, grid_height
+
+        # Nothing has been drawn yet
+        self.color_codes = None
+
+    def close(self):
+        """
+        Close the window and release Pygame.
+        """
+        if self.screen is not None:
+            self.screen = None
+            self.color_codes = None
+            pygame.quit()
+
+    def draw(
+        self, state_space: np.ndarray, finished_evacuating: list, timestep: int
+    ) -> List[pygame.Rect]:
+        """
+        Draw a frame and return the rectangles of the screen that were updated.
+        """
+        self.open()
+        codes = get_color_codes(state_space, finished_evacuating)
+        first_frame = self.color_codes is None
+
+        # Only redraw the title and the grid squares that changed
+        dirty_rects = [draw_timestep(self.screen, self.font, timestep)]
+        if self.square_dim >= 1:
+            dirty_rects += self._draw_squares(codes, first_frame)
+        else:
+            dirty_rects += self._draw_pixels(codes, first_frame)
+        self.color_codes = codes
+
+        # Push the changes to the display
+        if first_frame:
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty_rects)
+        return dirty_rects
+
+    def _draw_squares(self, codes: np.ndarray, first_frame: bool) -> list:
+        """
+        Draw one rectangle per grid square whose color changed.
+        """
+        if first_frame:
+            changed_rows, changed_cols = np.indices(codes.shape).reshape((2, -1))
+        else:
+            changed_rows, changed_cols = np.nonzero(codes != self.color_codes)
+
+        rects = []
+        step = self.square_dim + SQUARE_GAP
+        for y, x in zip(changed_rows.tolist(), changed_cols.tolist()):
+            square_rect = pygame.Rect(
+                self.start_x + x * step,
+                self.start_y + y * step,
+                self.square_dim,
+                self.square_dim,
+            )
+            pygame.draw.rect(self.screen, PALETTE[codes[y, x]], square_rect)
+            rects.append(square_rect)
+        return rects
+
+    def _draw_pixels(self, codes: np.ndarray, first_frame: bool) -> list:
+        """
+        Blit a downsampled image of the grid, limited to the changed pixels.
+        """
+        sampled = codes[np.ix_(self.pixel_rows, self.pixel_cols)]
+        if first_frame:
+            changed = np.ones(sampled.shape, dtype=bool)
+        else:
+            previous = self.color_codes[np.ix_(self.pixel_rows, self.pixel_cols)]
+            changed = sampled != previous
+        if not changed.any():
+            return []
+
+        # Only blit the bounding box of the pixels that changed
+        changed_y, changed_x = np.nonzero(changed)
+        y_min, y_max = changed_y.min(), changed_y.max() + 1
+        x_min, x_max = changed_x.min(), changed_x.max() + 1
+
+        # Surfarray expects (width, height, 3), so we transpose the pixels
+        pixels = PALETTE_RGB[sampled[y_min:y_max, x_min:x_max]].transpose((1, 0, 2))
+        patch = pygame.surfarray.make_surface(pixels)
+        rect = pygame.Rect(
+            self.start_x + int(x_min),
+            self.start_y + int(y_min),
+            int(x_max - x_min),
+            int(y_max - y_min),
+        )
+        self.screen.blit(patch, rect.topleft)
+        return [rect]
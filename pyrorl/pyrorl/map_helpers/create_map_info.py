@@ -2,7 +2,11 @@ import random
 import numpy as np
 import pickle as pkl
 import os
+import tempfile
 from datetime import datetime
+from scipy import ndimage
+from typing import Optional, Union
+from .generate_routes import generate_routes
 
 DIRECTIONS = {0: "straight", 1: "right", 2: "left"}
 ORIENTATONS = {
@@ -29,27 +33,154 @@ ORIENTATONS = {
 }
 MAP_DIRECTORY = "pyrorl_map_info"
 
+"""
+Saved maps are a single little-endian int64 .npy array, so that np.load with
+mmap_mode="r" maps a map of any size without reading it. The array holds:
+- a header: magic number, format version, then the number of rows, columns,
+  populated areas, paths, path cells and paths_to_pops entries
+- the populated areas as (row, col) pairs
+- the offset of each path into the path cells (one more than the number of paths)
+- the cells of every path as (row, col) pairs
+- the paths_to_pops entries as (path, row, col) triples
+"""
+MAP_FILE_MAGIC = int.from_bytes(b"PYRORLMP", "little")
+MAP_FILE_VERSION = 1
+MAP_FILE_EXTENSION = ".npy"
+MAP_HEADER_LENGTH = 8
+PATH_METHODS = ("random_walk", "shortest_path")
+
+
+def get_rng(
+    seed: Optional[Union[int, np.random.Generator]] = None,
+) -> np.random.Generator:
+    """
+    Turn a seed (or an existing generator) into a numpy random Generator.
+    Without a seed, the generator is seeded from the global random and
+    numpy.random states, so random.seed and np.random.seed still make maps
+    reproducible.
+    """
+    if isinstance(seed, np.random.Generator):
+        return seed
+    if seed is None:
+        seed = [np.random.randint(2**32), random.getrandbits(32)]
+    return np.random.default_rng(seed)
+
+
+def clustered_density(
+    num_rows: int,
+    num_cols: int,
+    num_clusters: int,
+    cluster_radius: float,
+    seed: Optional[Union[int, np.random.Generator]] = None,
+) -> np.ndarray:
+    """
+    Create a density raster of randomly placed towns, where the density around
+    each town center falls off as a Gaussian with a standard deviation of
+    cluster_radius cells. Pass it to generate_pop_locations to cluster populated
+    areas.
+    """
+    if num_clusters < 1:
+        raise ValueError("Number of clusters must be a positive value!")
+    if cluster_radius <= 0:
+        raise ValueError("Cluster radius must be a positive value!")
+    rng = get_rng(seed)
+
+    # Drop a point mass at each town center and blur them all at once
+    density = np.zeros((num_rows, num_cols))
+    centers = rng.integers(0, num_rows * num_cols, size=num_clusters)
+    np.add.at(density.reshape(-1), centers, 1)
+    return ndimage.gaussian_filter(density, cluster_radius, mode="constant")
 
-def generate_pop_locations(num_rows: int, num_cols: int, num_populated_areas: int):
+
+def generate_pop_locations(
+    num_rows: int,
+    num_cols: int,
+    num_populated_areas: int,
+    seed: Optional[Union[int, np.random.Generator]] = None,
+    density: Optional[np.ndarray] = None,
+):
     """
     Randomly generate populated areas.
+    - Populated areas are distinct cells that are not on the edge of the map,
+      drawn all at once without replacement
+    - seed is an integer or a numpy Generator used for the draw
+    - density is an optional (num_rows, num_cols) raster of non-negative weights,
+      where cells are chosen with probability proportional to their weight
     """
-    populated_areas = set()
-    for _ in range(num_populated_areas):
-        # We don't generate populated cells on the edge of the
-        # map
-        pop_row = random.randint(1, num_rows - 2)
-        pop_col = random.randint(1, num_cols - 2)
-        # Continue generating populated areas until one that
-        # has not already been created is made
-        while (pop_row, pop_col) in populated_areas:
-            pop_row = random.randint(1, num_rows - 2)
-            pop_col = random.randint(1, num_cols - 2)
-        populated_areas.add((pop_row, pop_col))
-    populated_areas = np.array(list(populated_areas))
+    # We don't generate populated cells on the edge of the map
+    interior_rows, interior_cols = max(num_rows - 2, 0), max(num_cols - 2, 0)
+    num_interior = interior_rows * interior_cols
+    if num_populated_areas > num_interior:
+        raise ValueError("Cannot have more than 100 percent of the map be populated!")
+    rng = get_rng(seed)
+
+    if density is None:
+        flat_indices = rng.choice(num_interior, size=num_populated_areas, replace=False)
+    else:
+        if density.shape != (num_rows, num_cols):
+            raise ValueError("Density must have the same shape as the map!")
+        weights = np.asarray(density, dtype=float)[1:-1, 1:-1].reshape(-1)
+        if np.any(weights < 0) or not np.all(np.isfinite(weights)):
+            raise ValueError("Density must be finite and non-negative!")
+        if np.count_nonzero(weights) < num_populated_areas:
+            raise ValueError("Density has fewer non-zero cells than populated areas!")
+
+        # Weighted sampling without replacement: each cell gets the key
+        # log(u) / weight and the cells with the largest keys are kept
+        with np.errstate(divide="ignore"):
+            keys = np.log(rng.random(num_interior)) / weights
+        keys[weights == 0] = -np.inf
+        flat_indices = np.argpartition(-keys, num_populated_areas - 1)
+        flat_indices = flat_indices[:num_populated_areas]
+
+    pop_rows = flat_indices // max(interior_cols, 1) + 1
+    pop_cols = flat_indices % max(interior_cols, 1) + 1
+    populated_areas = np.stack([pop_rows, pop_cols], axis=1).astype(int)
     return populated_areas
 
 
+def encode_map_info(
+    num_rows: int,
+    num_cols: int,
+    num_populated_areas: int,
+    populated_areas: np.ndarray,
+    paths: np.ndarray,
+    paths_to_pops: dict,
+) -> np.ndarray:
+    """
+    This function packs a map into the int64 array that map files hold.
+    """
+    populated_areas = np.asarray(populated_areas, dtype=np.int64).reshape((-1, 2))
+    path_cells = [np.asarray(path, dtype=np.int64).reshape((-1, 2)) for path in paths]
+    path_offsets = np.cumsum([0] + [len(cells) for cells in path_cells])
+    links = [
+        [int(path), int(area[0]), int(area[1])]
+        for path in paths_to_pops
+        for area in paths_to_pops[path]
+    ]
+
+    header = [
+        MAP_FILE_MAGIC,
+        MAP_FILE_VERSION,
+        num_rows,
+        num_cols,
+        num_populated_areas,
+        len(path_cells),
+        int(path_offsets[-1]),
+        len(links),
+    ]
+    map_array = np.concatenate(
+        [
+            np.array(header, dtype=np.int64),
+            populated_areas.ravel(),
+            path_offsets.astype(np.int64),
+            np.concatenate(path_cells + [np.zeros((0, 2), dtype=np.int64)]).ravel(),
+            np.array(links, dtype=np.int64).ravel(),
+        ]
+    )
+    return map_array.astype("<i8")
+
+
 def save_map_info(
     num_rows: int,
     num_cols: int,
@@ -57,9 +188,49 @@ def save_map_info(
     populated_areas: np.ndarray,
     paths: np.ndarray,
     paths_to_pops: dict,
+    file_path: Optional[str] = None,
+) -> str:
+    """
+    This function saves the map to a single file (see the layout above) and
+    returns its path. Unless a file_path is given, the file is created in the
+    MAP_DIRECTORY of the user's current working directory with a unique name
+    that starts with the current timestamp. A file_path without the
+    MAP_FILE_EXTENSION gets it appended.
+    """
+    if file_path is None:
+        # the map information is saved in the user's current working directory
+        user_working_directory = os.getcwd()
+        maps_info_directory = os.path.join(user_working_directory, MAP_DIRECTORY)
+        os.makedirs(maps_info_directory, exist_ok=True)
+
+        # maps saved in the same second still get their own file
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        file_descriptor, file_path = tempfile.mkstemp(
+            prefix=timestamp + " ", suffix=MAP_FILE_EXTENSION, dir=maps_info_directory
+        )
+        os.close(file_descriptor)
+    elif not file_path.endswith(MAP_FILE_EXTENSION):
+        # np.save would add the extension itself, so return the real path
+        file_path += MAP_FILE_EXTENSION
+
+    map_array = encode_map_info(
+        num_rows, num_cols, num_populated_areas, populated_areas, paths, paths_to_pops
+    )
+    np.save(file_path, map_array)
+    return file_path
+
+
+def save_map_info_pickle(
+    num_rows: int,
+    num_cols: int,
+    num_populated_areas: int,
+    populated_areas: np.ndarray,
+    paths: np.ndarray,
+    paths_to_pops: dict,
+    map_directory_path: str,
 ):
     """
-    This function saves five files:
+    This function saves a map in the legacy layout, a directory with five files:
     - map_info.txt: lets the user easily see the number of rows,
     the number of columns, and the number of populated areas
     - populated_areas_array.pkl: saves the populated areas array
@@ -68,20 +239,11 @@ def save_map_info(
     - map_size_and_percent_populated_list.pkl: saves a list that contains
     the number of rows, number of columns, and number of populated areas
     """
-    # the map information is saved in the user's current working directory
-    user_working_directory = os.getcwd()
-    maps_info_directory = os.path.join(user_working_directory, MAP_DIRECTORY)
-    if not os.path.exists(maps_info_directory):
-        os.makedirs(maps_info_directory)
-
-    # make a new subdirectory for the current map's information
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    current_map_directory = os.path.join(maps_info_directory, timestamp)
-    os.makedirs(current_map_directory)
+    os.makedirs(map_directory_path)
 
     # put the number of rows, number of columns, and number of populated areas
     # in text file for user to reference data
-    map_info_filename = os.path.join(current_map_directory, "map_info.txt")
+    map_info_filename = os.path.join(map_directory_path, "map_info.txt")
     with open(map_info_filename, "w") as f:
         row_info = "num_rows: " + str(num_rows) + "\n"
         f.write(row_info)
@@ -91,29 +253,64 @@ def save_map_info(
         f.write(percent_pop_info)
 
     # saved the populated areas array, paths array, and paths_to_pops arrays
-    def save_array_to_pickle(current_map_directory, array, name):
-        array_filename = os.path.join(current_map_directory, name)
+    def save_array_to_pickle(array, name):
+        array_filename = os.path.join(map_directory_path, name)
         with open(array_filename, "wb") as f:
             pkl.dump(array, f)
 
+    save_array_to_pickle(populated_areas, "populated_areas_array.pkl")
+    save_array_to_pickle(paths, "paths_array.pkl")
+    save_array_to_pickle(paths_to_pops, "paths_to_pops_array.pkl")
+
+    # save the number of rows, number of columns, and number of populated areas
     save_array_to_pickle(
-        current_map_directory, populated_areas, "populated_areas_array.pkl"
-    )
-    save_array_to_pickle(current_map_directory, paths, "paths_array.pkl")
-    save_array_to_pickle(
-        current_map_directory, paths_to_pops, "paths_to_pops_array.pkl"
+        [num_rows, num_cols, num_populated_areas],
+        "map_size_and_percent_populated_list.pkl",
     )
 
-    # save the number of rows, number of columns, and number of populated areas
-    map_size_and_percent_populated_list = [num_rows, num_cols, num_populated_areas]
-    map_size_and_percent_populated_list_filename = os.path.join(
-        current_map_directory, "map_size_and_percent_populated_list.pkl"
+
+def decode_map_info(map_array: np.ndarray):
+    """
+    This function unpacks an array made by encode_map_info into the six
+    variables returned by load_map_info. The arrays are views of map_array.
+    """
+    header = [int(value) for value in map_array[:MAP_HEADER_LENGTH]]
+    if header[0] != MAP_FILE_MAGIC:
+        raise ValueError("File is not a PyroRL map!")
+    if header[1] != MAP_FILE_VERSION:
+        raise ValueError("Unsupported map file version!")
+    num_rows, num_cols, num_populated_areas = header[2:5]
+    num_paths, num_path_cells, num_links = header[5:8]
+
+    # slice each section out of the mapped array without copying it
+    offset = MAP_HEADER_LENGTH
+    populated_areas = map_array[offset : offset + 2 * num_populated_areas]
+    populated_areas = populated_areas.reshape((-1, 2))
+    offset += 2 * num_populated_areas
+    path_offsets = np.asarray(map_array[offset : offset + num_paths + 1])
+    offset += num_paths + 1
+    path_cells = map_array[offset : offset + 2 * num_path_cells].reshape((-1, 2))
+    offset += 2 * num_path_cells
+    links = np.asarray(map_array[offset : offset + 3 * num_links]).reshape((-1, 3))
+
+    # each path is a view of its cells
+    paths = np.empty(num_paths, dtype=object)
+    for i in range(num_paths):
+        paths[i] = path_cells[path_offsets[i] : path_offsets[i + 1]]
+    paths_to_pops = {}
+    for path, row, col in links.tolist():
+        paths_to_pops.setdefault(path, []).append([row, col])
+    return (
+        num_rows,
+        num_cols,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        num_populated_areas,
     )
-    with open(map_size_and_percent_populated_list_filename, "wb") as f:
-        pkl.dump(map_size_and_percent_populated_list, f)
 
 
-def load_map_info(map_directory_path: str):
+def load_map_info(map_path: str):
     """
     This function loads in six variables to initialize a wildfire environment:
     - number of rows
@@ -122,6 +319,19 @@ def load_map_info(map_directory_path: str):
     - paths array
     - paths to pops array
     - number of populated areas
+    The map can be a file saved by save_map_info, which is memory-mapped rather
+    than read, or a directory in the legacy pickle layout.
+    """
+    if os.path.isdir(map_path):
+        return load_map_info_pickle(map_path)
+
+    return decode_map_info(np.load(map_path, mmap_mode="r"))
+
+
+def load_map_info_pickle(map_directory_path: str):
+    """
+    This function loads a map saved in the legacy pickle layout, returning the
+    same six variables as load_map_info.
     """
 
     def load_pickle_file(name):
@@ -161,9 +371,18 @@ def generate_map_info(
     percent_go_straight: int = 50,
     num_paths_mean: int = 3,
     num_paths_stdev: int = 1,
+    seed: Optional[Union[int, np.random.Generator]] = None,
+    pop_density: Optional[np.ndarray] = None,
+    path_method: str = "random_walk",
 ):
     """
     This function generates the populated areas and paths for a map.
+    - seed makes the generated map reproducible
+    - pop_density optionally weights where populated areas are placed
+      (see generate_pop_locations)
+    - path_method is either "random_walk" or "shortest_path", which routes
+      each path along randomized shortest paths to the edge of the map (see
+      generate_routes) and ignores the step and direction parameters
     """
     if num_populated_areas > (num_rows * num_cols - (2 * num_rows + 2 * num_cols - 4)):
         raise ValueError("Cannot have more than 100 percent of the map be populated!")
@@ -178,26 +397,77 @@ def generate_map_info(
     if num_paths_mean < 1:
         raise ValueError("The mean for the number of paths cannot be less than 1!")
     if steps_lower_bound > steps_upper_bound:
-        raise ValueError(
-            """The lower bound for the number of steps cannot be
-            greater than the upper bound!"""
-        )
+        raise ValueError("""The lower bound for the number of steps cannot be
+            greater than the upper bound!""")
     if steps_lower_bound < 1 or steps_upper_bound < 1:
         raise ValueError("The bounds for the number of steps cannot be less than 1!")
+    if path_method not in PATH_METHODS:
+        raise ValueError("Path method must be one of " + ", ".join(PATH_METHODS))
 
-    paths_to_pops = {}
-    populated_areas = generate_pop_locations(num_rows, num_cols, num_populated_areas)
+    rng = get_rng(seed)
+    populated_areas = generate_pop_locations(
+        num_rows, num_cols, num_populated_areas, seed=rng, density=pop_density
+    )
 
     # the number of paths for each populated area is chosen from a normal distribution
-    num_paths_array = np.random.normal(
+    num_paths_array = rng.normal(
         num_paths_mean, num_paths_stdev, num_populated_areas
     ).astype(int)
     # each populated area must have at least one path
     num_paths_array[num_paths_array < 1] = 1
 
+    if path_method == "shortest_path":
+        paths, paths_to_pops = generate_routes(
+            num_rows, num_cols, populated_areas, num_paths_array, seed=rng
+        )
+    else:
+        paths, paths_to_pops = generate_random_walks(
+            num_rows,
+            num_cols,
+            populated_areas,
+            num_paths_array,
+            rng,
+            steps_lower_bound,
+            steps_upper_bound,
+            percent_go_straight,
+        )
+
+    if save_map:
+        save_map_info(
+            num_rows,
+            num_cols,
+            num_populated_areas,
+            populated_areas,
+            paths,
+            paths_to_pops,
+        )
+    return populated_areas, np.array(paths, dtype=object), paths_to_pops
+
+
+def generate_random_walks(
+    num_rows: int,
+    num_cols: int,
+    populated_areas: np.ndarray,
+    num_paths_array: np.ndarray,
+    rng: np.random.Generator,
+    steps_lower_bound: int,
+    steps_upper_bound: int,
+    percent_go_straight: int,
+):
+    """
+    Generate paths from each populated area to the edge of the map with random
+    walks that never cross themselves.
+    """
+    # the random walks draw from their own generator, seeded from the same source
+    walk_random = random.Random(int(rng.integers(2**63)))
+
     paths = []
+    paths_to_pops = {}
     path_num = 0
 
+    # paths already created, kept in a set so duplicates are found in O(1)
+    seen_paths = set()
+
     for i in range(len(populated_areas)):
         pop_row, pop_col = populated_areas[i]
         # for cases where a path couldn't be made
@@ -212,12 +482,12 @@ def generate_map_info(
             y_min, y_max = num_cols, -1
 
             # Which orientaion to span out from first
-            orientation = random.choice(["north", "south", "east", "west"])
+            orientation = walk_random.choice(["north", "south", "east", "west"])
 
             # We loop until we reach the edge of the map
             done = False
             while not done:
-                num_steps = random.randint(steps_lower_bound, steps_upper_bound)
+                num_steps = walk_random.randint(steps_lower_bound, steps_upper_bound)
 
                 # We want to make sure that the current
                 # path will not intersect with itself
@@ -227,9 +497,9 @@ def generate_map_info(
                     # on percent_go_straight -> if we don't go straight,
                     # we go left or right with equal probability
                     direction_index = 0
-                    percent_value = random.randint(0, 100)
+                    percent_value = walk_random.randint(0, 100)
                     if percent_value > percent_go_straight:
-                        direction_index = random.randint(1, 2)
+                        direction_index = walk_random.randint(1, 2)
                     direction = DIRECTIONS[direction_index]
 
                     if orientation == "north" and direction != "straight":
@@ -274,8 +544,10 @@ def generate_map_info(
                     ):
                         # we want unique paths
                         done = True
-                        if current_path in paths or [pop_row, pop_col] in current_path:
+                        path_key = tuple(map(tuple, current_path))
+                        if path_key in seen_paths or [pop_row, pop_col] in current_path:
                             break
+                        seen_paths.add(path_key)
                         paths.append(current_path)
                         paths_to_pops[path_num] = [[pop_row, pop_col]]
                         path_num += 1
@@ -284,13 +556,4 @@ def generate_map_info(
 
                 # update orientation
                 orientation = ORIENTATONS[orientation][direction][1]
-    if save_map:
-        save_map_info(
-            num_rows,
-            num_cols,
-            num_populated_areas,
-            populated_areas,
-            paths,
-            paths_to_pops,
-        )
-    return populated_areas, np.array(paths, dtype=object), paths_to_pops
+    return paths, paths_to_pops
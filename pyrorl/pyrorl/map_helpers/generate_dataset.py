@@ -0,0 +1,263 @@
+"""
+Bulk generation of sharded map datasets across a process pool
+"""
+
+import argparse
+import hashlib
+import json
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional
+
+from .create_map_info import (
+    PATH_METHODS,
+    decode_map_info,
+    encode_map_info,
+    generate_map_info,
+)
+
+"""
+Layout of a dataset directory:
+- dataset.json: the parameters, seed and shard size the dataset was made with
+- shard-XXXXX.npz: one uncompressed array per map, in the map file layout
+- shard-XXXXX.json: the index entries of a shard, written once the shard is done
+- index.json: the entries of every shard, written once all shards are done
+"""
+DATASET_FILENAME = "dataset.json"
+INDEX_FILENAME = "index.json"
+SHARD_PREFIX = "shard-"
+
+
+def map_rng(seed: int, index: int) -> np.random.Generator:
+    """
+    Get the generator for a single map. It only depends on the dataset seed and
+    the map index, so a map comes out the same no matter which worker makes it.
+    """
+    return np.random.default_rng(np.random.SeedSequence([seed, index]))
+
+
+def shard_name(shard: int) -> str:
+    """
+    Get the file name (without extension) of a shard.
+    """
+    return SHARD_PREFIX + str(shard).zfill(5)
+
+
+def _write_atomic(file_path: str, write):
+    """
+    Write a file through a temporary file so a partial file is never left behind.
+    """
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        write(f)
+    os.replace(temp_path, file_path)
+
+
+def generate_shard(
+    dataset_directory: str, shard: int, indices: List[int], params: dict, seed: int
+) -> List[dict]:
+    """
+    Generate the maps of one shard, write them to disk and return their index
+    entries. The shard's manifest is written last, marking the shard as done.
+    """
+    name = shard_name(shard)
+    arrays, entries = {}, []
+    for index in indices:
+        populated_areas, paths, paths_to_pops = generate_map_info(
+            **params, save_map=False, seed=map_rng(seed, index)
+        )
+        map_array = encode_map_info(
+            params["num_rows"],
+            params["num_cols"],
+            params["num_populated_areas"],
+            populated_areas,
+            paths,
+            paths_to_pops,
+        )
+        key = "map_" + str(index).zfill(8)
+        arrays[key] = map_array
+        entries.append(
+            {
+                "index": index,
+                "shard": name + ".npz",
+                "key": key,
+                "seed": [seed, index],
+                "params": params,
+                "num_paths": len(paths),
+                "size": map_array.nbytes,
+                "sha256": hashlib.sha256(map_array.tobytes()).hexdigest(),
+            }
+        )
+
+    shard_path = os.path.join(dataset_directory, name)
+    _write_atomic(shard_path + ".npz", lambda f: np.savez(f, **arrays))
+    _write_atomic(
+        shard_path + ".json", lambda f: f.write(json.dumps(entries).encode("utf-8"))
+    )
+    return entries
+
+
+def generate_dataset(
+    dataset_directory: str,
+    num_maps: int,
+    params: dict,
+    seed: int = 0,
+    maps_per_shard: int = 256,
+    workers: Optional[int] = None,
+) -> List[dict]:
+    """
+    Generate num_maps maps with the generate_map_info parameters in params and
+    return the dataset index. Shards are generated in parallel by a pool of
+    workers (run in this process if workers is 1). Shards that are already done
+    are skipped, so running this again after an interruption resumes the run.
+    """
+    if num_maps < 1:
+        raise ValueError("Number of maps must be a positive value!")
+    if maps_per_shard < 1:
+        raise ValueError("Number of maps per shard must be a positive value!")
+    if "seed" in params or "save_map" in params:
+        raise ValueError("Seeds and saving are handled by the dataset!")
+
+    # A dataset can only be resumed with the settings it was started with
+    os.makedirs(dataset_directory, exist_ok=True)
+    settings = {
+        "num_maps": num_maps,
+        "params": params,
+        "seed": seed,
+        "maps_per_shard": maps_per_shard,
+    }
+    settings_path = os.path.join(dataset_directory, DATASET_FILENAME)
+    if os.path.exists(settings_path):
+        with open(settings_path, "r") as f:
+            if json.load(f) != settings:
+                raise ValueError("Dataset directory was made with other settings!")
+    else:
+        _write_atomic(
+            settings_path, lambda f: f.write(json.dumps(settings).encode("utf-8"))
+        )
+
+    # Find the shards that still have to be generated
+    num_shards = (num_maps + maps_per_shard - 1) // maps_per_shard
+    pending = []
+    for shard in range(num_shards):
+        shard_path = os.path.join(dataset_directory, shard_name(shard))
+        if not (
+            os.path.exists(shard_path + ".json") and os.path.exists(shard_path + ".npz")
+        ):
+            indices = range(
+                shard * maps_per_shard, min((shard + 1) * maps_per_shard, num_maps)
+            )
+            pending.append((dataset_directory, shard, list(indices), params, seed))
+
+    if workers == 1:
+        for args in pending:
+            generate_shard(*args)
+    elif len(pending) > 0:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(generate_shard, *args) for args in pending]
+            for future in as_completed(futures):
+                future.result()
+
+    # Collect the shard manifests into the index
+    index = []
+    for shard in range(num_shards):
+        shard_path = os.path.join(dataset_directory, shard_name(shard))
+        with open(shard_path + ".json", "r") as f:
+            index += json.load(f)
+    _write_atomic(
+        os.path.join(dataset_directory, INDEX_FILENAME),
+        lambda f: f.write(json.dumps(index).encode("utf-8")),
+    )
+    return index
+
+
+class MapDataset:
+    """
+    Read access to a generated dataset. Shards are opened lazily and kept open,
+    and maps are returned in the same form as load_map_info.
+    """
+
+    def __init__(self, dataset_directory: str):
+        """
+        Read the dataset index.
+        """
+        self.dataset_directory = dataset_directory
+        with open(os.path.join(dataset_directory, INDEX_FILENAME), "r") as f:
+            self.index = json.load(f)
+        self._shards = {}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, index: int):
+        """
+        Load a single map, checking it against its checksum.
+        """
+        entry = self.index[index]
+        if entry["shard"] not in self._shards:
+            shard_path = os.path.join(self.dataset_directory, entry["shard"])
+            self._shards[entry["shard"]] = np.load(shard_path)
+        map_array = self._shards[entry["shard"]][entry["key"]]
+        if hashlib.sha256(map_array.tobytes()).hexdigest() != entry["sha256"]:
+            raise ValueError("Map " + str(index) + " does not match its checksum!")
+        return decode_map_info(map_array)
+
+    def close(self):
+        """
+        Close any open shards.
+        """
+        for shard in self._shards.values():
+            shard.close()
+        self._shards = {}
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Command line entry point for generating a map dataset.
+    """
+    parser = argparse.ArgumentParser(
+        description="Generate a sharded dataset of PyroRL maps."
+    )
+    parser.add_argument("dataset_directory", help="where to write the dataset")
+    parser.add_argument("--num-maps", type=int, required=True)
+    parser.add_argument("--num-rows", type=int, required=True)
+    parser.add_argument("--num-cols", type=int, required=True)
+    parser.add_argument("--num-populated-areas", type=int, required=True)
+    parser.add_argument("--steps-lower-bound", type=int, default=2)
+    parser.add_argument("--steps-upper-bound", type=int, default=4)
+    parser.add_argument("--percent-go-straight", type=int, default=50)
+    parser.add_argument("--num-paths-mean", type=int, default=3)
+    parser.add_argument("--num-paths-stdev", type=int, default=1)
+    parser.add_argument("--path-method", choices=PATH_METHODS, default=PATH_METHODS[0])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--maps-per-shard", type=int, default=256)
+    parser.add_argument(
+        "--workers", type=int, default=None, help="defaults to the number of CPUs"
+    )
+    args = parser.parse_args(argv)
+
+    params = {
+        "num_rows": args.num_rows,
+        "num_cols": args.num_cols,
+        "num_populated_areas": args.num_populated_areas,
+        "steps_lower_bound": args.steps_lower_bound,
+        "steps_upper_bound": args.steps_upper_bound,
+        "percent_go_straight": args.percent_go_straight,
+        "num_paths_mean": args.num_paths_mean,
+        "num_paths_stdev": args.num_paths_stdev,
+        "path_method": args.path_method,
+    }
+    index = generate_dataset(
+        args.dataset_directory,
+        args.num_maps,
+        params,
+        seed=args.seed,
+        maps_per_shard=args.maps_per_shard,
+        workers=args.workers,
+    )
+    print("Generated " + str(len(index)) + " maps in " + args.dataset_directory)
+
+
+if __name__ == "__main__":
+    main()
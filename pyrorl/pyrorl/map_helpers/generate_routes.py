@@ -0,0 +1,134 @@
+"""
+Evacuation route generation with shortest paths over a shared occupancy grid
+"""
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import dijkstra
+from typing import Optional, Union
+
+
+def grid_edges(num_rows: int, num_cols: int, obstacles: Optional[np.ndarray] = None):
+    """
+    Get the (source, target) cell indices of every edge between horizontally
+    or vertically adjacent cells, leaving out edges touching an obstacle.
+    """
+    cells = np.arange(num_rows * num_cols).reshape((num_rows, num_cols))
+    sources = np.concatenate([cells[:, :-1].ravel(), cells[:-1, :].ravel()])
+    targets = np.concatenate([cells[:, 1:].ravel(), cells[1:, :].ravel()])
+    if obstacles is not None:
+        blocked = np.asarray(obstacles, dtype=bool).ravel()
+        open_edges = ~(blocked[sources] | blocked[targets])
+        sources, targets = sources[open_edges], targets[open_edges]
+    return sources, targets
+
+
+def trace_routes(predecessors: np.ndarray, starts: np.ndarray) -> list:
+    """
+    Follow shortest path predecessors from every start cell at once until the
+    source (a boundary cell) is reached. Start cells themselves are not included.
+    """
+    routes = [[] for _ in starts]
+    current = np.asarray(starts)
+    active = np.arange(len(starts))
+    while len(active) > 0:
+        current = predecessors[current]
+        reached = current >= 0
+        active, current = active[reached], current[reached]
+        for route, cell in zip(active.tolist(), current.tolist()):
+            routes[route].append(cell)
+    return routes
+
+
+def generate_routes(
+    num_rows: int,
+    num_cols: int,
+    populated_areas: np.ndarray,
+    num_paths: Union[int, np.ndarray],
+    seed: Optional[Union[int, np.random.Generator]] = None,
+    cost_noise: float = 1.0,
+    overlap_penalty: float = 0.5,
+    obstacles: Optional[np.ndarray] = None,
+    max_rounds: Optional[int] = None,
+):
+    """
+    Generate distinct evacuation routes from each populated area to the edge of
+    the map. Each round draws random cell costs, runs one multi-source shortest
+    path search outward from every boundary cell, and traces a route for every
+    populated area that still needs one.
+    - num_paths is the number of routes wanted per populated area (an int or an
+      array with one entry per populated area)
+    - cost_noise scales the random part of the cell costs, which diversifies
+      routes between rounds
+    - overlap_penalty raises the cost of cells on the shared occupancy grid that
+      earlier routes already use
+    - obstacles is an optional (num_rows, num_cols) boolean grid of cells routes
+      cannot cross
+    Returns the paths and the paths_to_pops mapping, in the same format as
+    generate_map_info.
+    """
+    populated_areas = np.asarray(populated_areas, dtype=int).reshape((-1, 2))
+    num_paths = np.broadcast_to(np.asarray(num_paths, dtype=int), len(populated_areas))
+    if np.any(num_paths < 1):
+        raise ValueError("Each populated area needs at least one path!")
+    if cost_noise < 0 or overlap_penalty < 0:
+        raise ValueError("Route costs cannot be negative!")
+    rng = np.random.default_rng(seed)
+    if max_rounds is None:
+        max_rounds = 4 * int(num_paths.max(initial=1)) + 4
+
+    # Boundary cells are the sources of every search
+    num_cells = num_rows * num_cols
+    on_boundary = np.zeros((num_rows, num_cols), dtype=bool)
+    on_boundary[[0, -1], :] = True
+    on_boundary[:, [0, -1]] = True
+    if obstacles is not None:
+        on_boundary &= ~np.asarray(obstacles, dtype=bool)
+    boundary = np.flatnonzero(on_boundary)
+    sources, targets = grid_edges(num_rows, num_cols, obstacles)
+
+    pop_cells = populated_areas[:, 0] * num_cols + populated_areas[:, 1]
+    remaining = num_paths.copy()
+    occupancy = np.zeros(num_cells)
+    routes_per_pop = [[] for _ in pop_cells]
+    seen = set()
+    for _ in range(max_rounds):
+        needed = np.flatnonzero(remaining > 0)
+        if len(needed) == 0:
+            break
+
+        # Symmetric edge weights from this round's randomized cell costs
+        costs = 1 + cost_noise * rng.exponential(size=num_cells)
+        costs += overlap_penalty * occupancy
+        weights = (costs[sources] + costs[targets]) / 2
+        graph = sparse.csr_matrix((weights, (sources, targets)), (num_cells, num_cells))
+        _, predecessors, _ = dijkstra(
+            graph,
+            directed=False,
+            indices=boundary,
+            min_only=True,
+            return_predecessors=True,
+        )
+
+        # Keep each route the first time it is seen (hash-based dedup)
+        for i, route in zip(needed, trace_routes(predecessors, pop_cells[needed])):
+            route = np.array(route, dtype=np.int64)
+            key = route.tobytes()
+            if len(route) == 0 or key in seen:
+                continue
+            seen.add(key)
+            routes_per_pop[i].append(route)
+            occupancy[route] += 1
+            remaining[i] -= 1
+
+    if any(len(routes) == 0 for routes in routes_per_pop):
+        raise ValueError("A populated area cannot reach the edge of the map!")
+
+    # Convert flat cells back into [row, col] lists
+    paths, paths_to_pops = [], {}
+    for i, routes in enumerate(routes_per_pop):
+        for route in routes:
+            rows, cols = np.divmod(route, num_cols)
+            paths.append(np.stack([rows, cols], axis=1).tolist())
+            paths_to_pops[len(paths) - 1] = [populated_areas[i].tolist()]
+    return paths, paths_to_pops
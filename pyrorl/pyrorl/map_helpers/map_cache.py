@@ -0,0 +1,180 @@
+"""
+On-disk cache of generated maps, keyed by the generation parameters and seed
+"""
+
+import hashlib
+import inspect
+import json
+import numpy as np
+import os
+import tempfile
+from typing import Optional
+
+from .create_map_info import (
+    MAP_DIRECTORY,
+    MAP_FILE_EXTENSION,
+    MAP_FILE_VERSION,
+    decode_map_info,
+    encode_map_info,
+    generate_map_info,
+)
+
+CACHE_DIRECTORY = os.path.join(MAP_DIRECTORY, "cache")
+
+
+def map_cache_key(seed: int, params: dict) -> str:
+    """
+    Hash the seed and generate_map_info parameters of a map. Parameters that
+    are left out are filled in with their defaults, so leaving out a parameter
+    gives the same key as passing its default. Array parameters (like
+    pop_density) are hashed by their shape, type and contents.
+    """
+    arguments = inspect.signature(generate_map_info).bind_partial(**params)
+    arguments.apply_defaults()
+    key = {"version": MAP_FILE_VERSION, "seed": seed}
+    for name, value in sorted(arguments.arguments.items()):
+        if name in ("seed", "save_map"):
+            continue
+        if isinstance(value, np.ndarray):
+            digest = hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()
+            value = [list(value.shape), str(value.dtype), digest]
+        key[name] = value
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class MapCache:
+    """
+    A directory of map files named by the hash of how they were generated. A
+    map is generated and stored the first time it is asked for, and memory-mapped
+    from its file afterwards. When the files grow past max_bytes, the least
+    recently used ones are deleted.
+    """
+
+    def __init__(self, cache_directory: Optional[str] = None, max_bytes: int = 2**30):
+        """
+        Create the cache directory if needed. By default the cache lives in the
+        user's current working directory.
+        """
+        if max_bytes < 0:
+            raise ValueError("Cache size cannot be negative!")
+        if cache_directory is None:
+            cache_directory = os.path.join(os.getcwd(), CACHE_DIRECTORY)
+        os.makedirs(cache_directory, exist_ok=True)
+        self.cache_directory = cache_directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key: str) -> str:
+        """
+        Get the file path of a cache key.
+        """
+        return os.path.join(self.cache_directory, key + MAP_FILE_EXTENSION)
+
+    def get_map(
+        self,
+        num_rows: int,
+        num_cols: int,
+        num_populated_areas: int,
+        seed: int,
+        **params
+    ):
+        """
+        Get a map, returning the same values as generate_map_info. The remaining
+        keyword arguments are passed on to generate_map_info.
+        """
+        if not isinstance(seed, (int, np.integer)):
+            raise ValueError("Cached maps need an integer seed!")
+        if "save_map" in params:
+            raise ValueError("Cached maps are saved by the cache!")
+        params.update(
+            num_rows=num_rows,
+            num_cols=num_cols,
+            num_populated_areas=num_populated_areas,
+        )
+        file_path = self.path(map_cache_key(int(seed), params))
+
+        # On a hit, mark the file as recently used and map it
+        try:
+            map_array = np.load(file_path, mmap_mode="r")
+            os.utime(file_path)
+            self.hits += 1
+        except FileNotFoundError:
+            map_array = None
+        if map_array is not None:
+            _, _, populated_areas, paths, paths_to_pops, _ = decode_map_info(map_array)
+            return populated_areas, paths, paths_to_pops
+
+        # On a miss, generate the map and move it into place in one step, so other
+        # processes never see a partial file
+        self.misses += 1
+        populated_areas, paths, paths_to_pops = generate_map_info(
+            save_map=False, seed=int(seed), **params
+        )
+        map_array = encode_map_info(
+            num_rows,
+            num_cols,
+            num_populated_areas,
+            populated_areas,
+            paths,
+            paths_to_pops,
+        )
+        file_descriptor, temp_path = tempfile.mkstemp(
+            suffix=".tmp", dir=self.cache_directory
+        )
+        with os.fdopen(file_descriptor, "wb") as f:
+            np.save(f, map_array)
+        os.replace(temp_path, file_path)
+        self.evict(keep=file_path)
+        return populated_areas, paths, paths_to_pops
+
+    def size(self) -> int:
+        """
+        Total number of bytes of the cached maps.
+        """
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self) -> list:
+        """
+        List the (last use, path, size) of every cached map.
+        """
+        entries = []
+        for name in os.listdir(self.cache_directory):
+            if not name.endswith(MAP_FILE_EXTENSION):
+                continue
+            file_path = os.path.join(self.cache_directory, name)
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                # another process evicted it in the meantime
+                continue
+            entries.append((stat.st_mtime, file_path, stat.st_size))
+        return entries
+
+    def evict(self, keep: Optional[str] = None):
+        """
+        Delete the least recently used maps until the cache fits in max_bytes.
+        The map at keep is never deleted.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, file_path, size in entries:
+            if total <= self.max_bytes:
+                break
+            if file_path == keep:
+                continue
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        Delete every cached map.
+        """
+        for _, file_path, _ in self._entries():
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,170 @@
+"""
+Background generation of maps, so that environments never wait on a new map
+"""
+
+import numpy as np
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional, Tuple, Union
+
+from .create_map_info import generate_map_info
+
+
+def staged_curriculum(stages: List[Tuple[int, dict]]) -> Callable[[int], dict]:
+    """
+    Build a schedule from a list of (number of maps, generate_map_info parameters)
+    stages. The parameters of the last stage are used once all stages are done.
+    """
+    if len(stages) == 0:
+        raise ValueError("A curriculum needs at least one stage!")
+    bounds = np.cumsum([num_maps for num_maps, _ in stages])
+
+    def schedule(map_index: int) -> dict:
+        stage = min(
+            int(np.searchsorted(bounds, map_index, side="right")), len(stages) - 1
+        )
+        return stages[stage][1]
+
+    return schedule
+
+
+def generate_pool_map(params: dict, seed: int, map_index: int) -> tuple:
+    """
+    Generate a single pool map, returning the same values as load_map_info.
+    """
+    rng = np.random.default_rng(np.random.SeedSequence([seed, map_index]))
+    populated_areas, paths, paths_to_pops = generate_map_info(
+        **params, save_map=False, seed=rng
+    )
+    return (
+        params["num_rows"],
+        params["num_cols"],
+        populated_areas,
+        paths,
+        paths_to_pops,
+        params["num_populated_areas"],
+    )
+
+
+class MapPool:
+    """
+    A bounded queue of generated maps that a background thread keeps full. The
+    parameters of each map come from `schedule`, either a fixed dict of
+    generate_map_info parameters or a function from the map's index to such a
+    dict (see staged_curriculum). With processes > 0 the maps are generated in a
+    pool of processes instead of the background thread itself, so generation does
+    not compete with the training loop for the interpreter lock.
+    """
+
+    def __init__(
+        self,
+        schedule: Union[dict, Callable[[int], dict]],
+        capacity: int = 8,
+        seed: Optional[int] = None,
+        processes: int = 0,
+    ):
+        """
+        Start filling the pool.
+        """
+        if capacity < 1:
+            raise ValueError("Map pool capacity must be a positive value!")
+        if processes < 0:
+            raise ValueError("Number of processes cannot be negative!")
+        if isinstance(schedule, dict):
+            params = dict(schedule)
+            self.schedule = lambda map_index: params
+        else:
+            self.schedule = schedule
+        if seed is None:
+            seed = int(np.random.SeedSequence().entropy)
+        self.seed = seed
+        self.maps: queue.Queue = queue.Queue(capacity)
+        self.num_generated = 0
+        self.num_served = 0
+        self.error: Optional[BaseException] = None
+
+        self._executor = ProcessPoolExecutor(processes) if processes > 0 else None
+        self._in_flight = max(1, processes)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def _generate(self, map_index: int):
+        """
+        Generate a map here or hand it to the process pool.
+        """
+        params = self.schedule(map_index)
+        if self._executor is None:
+            return generate_pool_map(params, self.seed, map_index)
+        return self._executor.submit(generate_pool_map, params, self.seed, map_index)
+
+    def _fill(self):
+        """
+        Keep the queue full until the pool is closed. Maps are queued in order
+        of their index, so the maps served only depend on the seed.
+        """
+        pending = []
+        try:
+            while not self._stop.is_set():
+                # Keep every worker process busy
+                while len(pending) < self._in_flight:
+                    pending.append(self._generate(self.num_generated))
+                    self.num_generated += 1
+                next_map = pending.pop(0)
+                if self._executor is not None:
+                    next_map = next_map.result()
+
+                # Block while the queue is full, checking for close now and then
+                while not self._stop.is_set():
+                    try:
+                        self.maps.put(next_map, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+        except BaseException as error:
+            self.error = error
+        finally:
+            for future in pending:
+                if self._executor is not None:
+                    future.cancel()
+
+    def get(self, timeout: Optional[float] = None) -> tuple:
+        """
+        Take the next map from the pool, waiting for one if it is empty. Maps
+        are returned in the same form as load_map_info. Maps that were finished
+        before a failure in the background are still handed out, and the
+        failure is only raised once the pool is empty.
+        """
+        while True:
+            try:
+                next_map = self.maps.get_nowait()
+                break
+            except queue.Empty:
+                pass
+            if self.error is not None:
+                raise RuntimeError("Map generation failed!") from self.error
+            try:
+                next_map = self.maps.get(timeout=0.1 if timeout is None else timeout)
+                break
+            except queue.Empty:
+                if timeout is not None:
+                    raise
+        self.num_served += 1
+        return next_map
+
+    def close(self):
+        """
+        Stop the background generation.
+        """
+        self._stop.set()
+        self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
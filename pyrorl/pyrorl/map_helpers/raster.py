@@ -0,0 +1,287 @@
+"""
+Memory-mapped raster sources for real fuel and terrain grids
+"""
+
+import abc
+import numpy as np
+from typing import List, NamedTuple, Optional, Tuple
+
+RESAMPLING_METHODS = ("nearest", "mean")
+
+
+class Window(NamedTuple):
+    """
+    A rectangle of raster cells, starting at (row_off, col_off).
+    """
+
+    row_off: int
+    col_off: int
+    num_rows: int
+    num_cols: int
+
+
+class RasterSource(abc.ABC):
+    """
+    A 2D grid of values stored on disk. Subclasses only read the parts of the
+    file that a window needs, so scenarios over a small part of a huge raster
+    never load the whole raster into memory.
+    """
+
+    shape: Tuple[int, int]
+    nodata: Optional[float] = None
+
+    @abc.abstractmethod
+    def read_cells(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        Read the values at every pair of the given (sorted) rows and columns, as
+        a (len(rows), len(cols)) float64 array.
+        """
+
+    def check_window(self, window: Optional[Window]) -> Window:
+        """
+        Get the window covering the whole raster if window is None, and make sure
+        the window lies inside the raster.
+        """
+        if window is None:
+            return Window(0, 0, self.shape[0], self.shape[1])
+        window = Window(*[int(value) for value in window])
+        if window.num_rows < 1 or window.num_cols < 1:
+            raise ValueError("Raster windows must have a positive size!")
+        if (
+            window.row_off < 0
+            or window.col_off < 0
+            or window.row_off + window.num_rows > self.shape[0]
+            or window.col_off + window.num_cols > self.shape[1]
+        ):
+            raise ValueError("Raster window is not within the raster!")
+        return window
+
+    def read(
+        self, window: Optional[Window] = None, fill_value: Optional[float] = None
+    ) -> np.ndarray:
+        """
+        Read a window of the raster (the whole raster by default). Cells holding
+        the raster's nodata value are set to fill_value if one is given.
+        """
+        window = self.check_window(window)
+        rows = np.arange(window.row_off, window.row_off + window.num_rows)
+        cols = np.arange(window.col_off, window.col_off + window.num_cols)
+        return self._fill(self.read_cells(rows, cols), fill_value)
+
+    def resample(
+        self,
+        shape: Tuple[int, int],
+        window: Optional[Window] = None,
+        method: str = "nearest",
+        fill_value: Optional[float] = None,
+    ) -> np.ndarray:
+        """
+        Resample a window of the raster (the whole raster by default) to a grid of
+        the given shape, such as the simulation grid.
+        - "nearest" reads only the cell closest to the center of each grid cell
+        - "mean" averages every raster cell that falls in each grid cell, ignoring
+          nodata cells; grid cells that are larger than raster cells are needed
+        Cells without data are set to fill_value if one is given.
+        """
+        if method not in RESAMPLING_METHODS:
+            raise ValueError(
+                "Resampling method must be one of " + ", ".join(RESAMPLING_METHODS)
+            )
+        num_rows, num_cols = shape
+        if num_rows < 1 or num_cols < 1:
+            raise ValueError("Resampled shape must be positive!")
+        window = self.check_window(window)
+
+        if method == "nearest":
+            rows = window.row_off + _nearest(window.num_rows, num_rows)
+            cols = window.col_off + _nearest(window.num_cols, num_cols)
+            return self._fill(self.read_cells(rows, cols), fill_value)
+
+        if num_rows > window.num_rows or num_cols > window.num_cols:
+            raise ValueError("Mean resampling cannot increase the resolution!")
+        values = self.read(window)
+        valid = ~self._nodata_mask(values)
+        values = np.where(valid, values, 0)
+
+        # Sum the values and the number of valid cells in each block
+        row_starts = (np.arange(num_rows) * window.num_rows) // num_rows
+        col_starts = (np.arange(num_cols) * window.num_cols) // num_cols
+        sums = np.add.reduceat(np.add.reduceat(values, row_starts, 0), col_starts, 1)
+        counts = np.add.reduceat(
+            np.add.reduceat(valid.astype(np.int64), row_starts, 0), col_starts, 1
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+        if fill_value is not None:
+            means[counts == 0] = fill_value
+        elif self.nodata is not None:
+            means[counts == 0] = self.nodata
+        return means
+
+    def _nodata_mask(self, values: np.ndarray) -> np.ndarray:
+        """
+        Find the cells without data.
+        """
+        missing = np.isnan(values)
+        if self.nodata is not None:
+            missing |= values == self.nodata
+        return missing
+
+    def _fill(self, values: np.ndarray, fill_value: Optional[float]) -> np.ndarray:
+        """
+        Replace cells without data with fill_value, if one is given.
+        """
+        if fill_value is not None:
+            values[self._nodata_mask(values)] = fill_value
+        return values
+
+
+def _nearest(length: int, size: int) -> np.ndarray:
+    """
+    Get the index of the source cell closest to the center of each of the size
+    cells that length source cells are resampled to.
+    """
+    centers = (np.arange(size) + 0.5) * length / size
+    return np.minimum(centers.astype(np.int64), length - 1)
+
+
+class NpyRaster(RasterSource):
+    """
+    A raster stored as a 2D array in a .npy file.
+    """
+
+    def __init__(self, file_path: str, nodata: Optional[float] = None):
+        """
+        Memory-map the file.
+        """
+        self.data = np.load(file_path, mmap_mode="r")
+        if self.data.ndim != 2:
+            raise ValueError("Raster arrays must be two dimensional!")
+        self.shape = self.data.shape
+        self.nodata = nodata
+
+    def read_cells(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        Read the cells, slicing the mapped array when the rows and columns are
+        contiguous so only the window is touched.
+        """
+        rows, cols = np.asarray(rows), np.asarray(cols)
+        if _contiguous(rows) and _contiguous(cols):
+            values = self.data[rows[0] : rows[-1] + 1, cols[0] : cols[-1] + 1]
+        else:
+            values = self.data[np.ix_(rows, cols)]
+        return np.array(values, dtype=np.float64)
+
+
+def _contiguous(indices: np.ndarray) -> bool:
+    """
+    Check whether sorted indices form a single run.
+    """
+    return len(indices) > 0 and indices[-1] - indices[0] == len(indices) - 1
+
+
+class AsciiGridRaster(RasterSource):
+    """
+    A raster stored as an ESRI ASCII grid, with one row of the grid per line.
+    The file is memory-mapped, and the start of each line is only found once a
+    row at or after it is read, so reading the top of a huge grid is cheap.
+    """
+
+    # Number of bytes searched for line breaks at a time
+    INDEX_CHUNK = 1 << 20
+
+    def __init__(self, file_path: str):
+        """
+        Memory-map the file and parse its header.
+        """
+        self.data = np.memmap(file_path, dtype=np.uint8, mode="r")
+        header = {}
+        offset = 0
+        while True:
+            end = self._find_newline(offset)
+            line = bytes(self.data[offset:end]).split()
+            if len(line) != 2 or not line[0][:1].isalpha():
+                break
+            header[line[0].decode("ascii").lower()] = line[1].decode("ascii")
+            offset = end + 1
+
+        if "ncols" not in header or "nrows" not in header:
+            raise ValueError("File is not an ASCII grid!")
+        self.shape = (int(header["nrows"]), int(header["ncols"]))
+        self.header = header
+        self.nodata = (
+            float(header["nodata_value"]) if "nodata_value" in header else None
+        )
+
+        # Start of each row that has been found so far
+        self._line_starts: List[int] = [offset]
+
+    def _find_newline(self, offset: int) -> int:
+        """
+        Find the end of the line starting at offset.
+        """
+        while offset < len(self.data):
+            chunk = self.data[offset : offset + self.INDEX_CHUNK]
+            breaks = np.flatnonzero(chunk == ord("\n"))
+            if len(breaks) > 0:
+                return offset + int(breaks[0])
+            offset += len(chunk)
+        return len(self.data)
+
+    def _index_rows(self, num_rows: int):
+        """
+        Find the start of the first num_rows rows, scanning a chunk at a time.
+        """
+        while len(self._line_starts) <= num_rows:
+            offset = self._line_starts[-1]
+            if offset >= len(self.data):
+                raise ValueError("ASCII grid has fewer rows than its header says!")
+            chunk = self.data[offset : offset + self.INDEX_CHUNK]
+            breaks = np.flatnonzero(chunk == ord("\n"))
+            if len(breaks) == 0:
+                # The line is longer than a chunk, or is the last line and has
+                # no line break
+                self._line_starts.append(self._find_newline(offset) + 1)
+                continue
+            self._line_starts.extend((offset + breaks + 1).tolist())
+
+    def read_cells(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        Parse only the lines of the requested rows.
+        """
+        rows, cols = np.asarray(rows), np.asarray(cols)
+        self._index_rows(int(rows.max()) + 1)
+        values = np.empty((len(rows), len(cols)))
+        for i, row in enumerate(rows.tolist()):
+            start, end = self._line_starts[row], self._line_starts[row + 1] - 1
+            line = np.array(bytes(self.data[start:end]).split(), dtype=np.float64)
+            if len(line) != self.shape[1]:
+                raise ValueError("Row " + str(row) + " of the ASCII grid is malformed!")
+            values[i] = line[cols]
+        return values
+
+
+class WindowedRaster(RasterSource):
+    """
+    A window of another raster, read as if it were a raster of its own.
+    """
+
+    def __init__(self, source: RasterSource, window: Window):
+        """
+        Check that the window lies inside the source.
+        """
+        self.source = source
+        self.window = source.check_window(window)
+        self.shape = (self.window.num_rows, self.window.num_cols)
+        self.nodata = source.nodata
+        if hasattr(source, "tile_size"):
+            self.tile_size = source.tile_size
+
+    def read_cells(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        Read the cells from the source, offset by the window.
+        """
+        return self.source.read_cells(
+            np.asarray(rows) + self.window.row_off,
+            np.asarray(cols) + self.window.col_off,
+        )
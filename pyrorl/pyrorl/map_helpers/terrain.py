@@ -0,0 +1,169 @@
+"""
+Procedural fuel and terrain fields, generated a tile at a time
+"""
+
+import numpy as np
+from collections import OrderedDict
+from typing import Tuple
+
+from .raster import RasterSource
+
+# Odd 64-bit constants used to mix lattice coordinates into a hash
+HASH_ROW = np.uint64(0x9E3779B97F4A7C15)
+HASH_COL = np.uint64(0xC2B2AE3D27D4EB4F)
+HASH_OCTAVE = np.uint64(0x165667B19E3779F9)
+
+
+def lattice_values(
+    seed: int, octave: int, rows: np.ndarray, cols: np.ndarray
+) -> np.ndarray:
+    """
+    Hash every (row, col) lattice point of an octave to a value in [-1, 1). The
+    value only depends on the seed, octave and point, so neighboring tiles agree.
+    """
+    with np.errstate(over="ignore"):
+        h = (
+            rows.astype(np.uint64)[:, np.newaxis] * HASH_ROW
+            ^ cols.astype(np.uint64)[np.newaxis, :] * HASH_COL
+            ^ (np.uint64(seed) * HASH_OCTAVE + np.uint64(octave))
+        )
+
+        # SplitMix64 finalizer
+        h ^= h >> np.uint64(30)
+        h *= np.uint64(0xBF58476D1CE4E5B9)
+        h ^= h >> np.uint64(27)
+        h *= np.uint64(0x94D049BB133111EB)
+        h ^= h >> np.uint64(31)
+    return (h >> np.uint64(11)).astype(np.float64) * 2.0**-52 - 1
+
+
+def smoothstep(t: np.ndarray) -> np.ndarray:
+    """
+    Ease interpolation weights so the noise has no creases at lattice points.
+    """
+    return t * t * (3 - 2 * t)
+
+
+class ProceduralTerrain(RasterSource):
+    """
+    A spatially correlated field (such as fuel or elevation) made of several
+    octaves of value noise. Any cell can be generated from the seed alone, so the
+    field can be far larger than memory: it is generated in square tiles, on
+    demand, and the most recently used tiles are kept in a bounded cache.
+    - scale is the size (in cells) of the largest features
+    - octaves is the number of noise layers, each with features half the size and
+      persistence times the amplitude of the previous one
+    - the values have roughly the given mean and standard deviation
+    """
+
+    def __init__(
+        self,
+        shape: Tuple[int, int],
+        seed: int = 0,
+        mean: float = 8.5,
+        stdev: float = 3,
+        scale: float = 64,
+        octaves: int = 4,
+        persistence: float = 0.5,
+        tile_size: int = 128,
+        max_cached_tiles: int = 64,
+    ):
+        """
+        Set up the field; no tiles are generated until they are read.
+        """
+        if shape[0] < 1 or shape[1] < 1:
+            raise ValueError("Terrain shape must be positive!")
+        if scale < 1 or octaves < 1 or tile_size < 1 or max_cached_tiles < 1:
+            raise ValueError("Terrain parameters must be positive!")
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.seed = seed
+        self.mean = mean
+        self.stdev = stdev
+        self.tile_size = tile_size
+        self.max_cached_tiles = max_cached_tiles
+
+        # Octaves with features smaller than a cell add nothing
+        self.octave_scales = [scale / 2**i for i in range(octaves) if scale / 2**i >= 1]
+        amplitudes = persistence ** np.arange(len(self.octave_scales))
+
+        # Lattice values are uniform, with a variance of 1/3, and interpolating
+        # between them shrinks the variance by a constant factor in each direction
+        t = smoothstep((np.arange(1000) + 0.5) / 1000)
+        shrink = np.mean((1 - t) ** 2 + t**2) ** 2
+        self.amplitudes = amplitudes * np.sqrt(3 / shrink / np.sum(amplitudes**2))
+        self.tiles: OrderedDict = OrderedDict()
+        self.num_generated_tiles = 0
+
+    def noise(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        Evaluate the field at every pair of the given rows and columns.
+        """
+        rows, cols = np.asarray(rows), np.asarray(cols)
+        values = np.full((len(rows), len(cols)), float(self.mean))
+        for octave, (scale, amplitude) in enumerate(
+            zip(self.octave_scales, self.amplitudes)
+        ):
+            # Position of each cell center between the lattice points around it
+            row_pos, col_pos = (rows + 0.5) / scale, (cols + 0.5) / scale
+            row_cell, col_cell = np.floor(row_pos), np.floor(col_pos)
+            row_t = smoothstep(row_pos - row_cell)
+            col_t = smoothstep(col_pos - col_cell)
+
+            # Hash each lattice point once, then interpolate between them
+            row_min, col_min = int(row_cell.min()), int(col_cell.min())
+            lattice = lattice_values(
+                self.seed,
+                octave,
+                np.arange(row_min, int(row_cell.max()) + 2),
+                np.arange(col_min, int(col_cell.max()) + 2),
+            )
+            r = (row_cell - row_min).astype(int)[:, np.newaxis]
+            c = (col_cell - col_min).astype(int)[np.newaxis, :]
+            top = lattice[r, c] + (lattice[r, c + 1] - lattice[r, c]) * col_t
+            bottom = (
+                lattice[r + 1, c] + (lattice[r + 1, c + 1] - lattice[r + 1, c]) * col_t
+            )
+            noise = top + (bottom - top) * row_t[:, np.newaxis]
+            values += self.stdev * amplitude * noise
+        return values
+
+    def tile(self, tile_row: int, tile_col: int) -> np.ndarray:
+        """
+        Get a tile, generating it if it is not cached.
+        """
+        key = (tile_row, tile_col)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+
+        size = self.tile_size
+        tile = self.noise(
+            np.arange(tile_row * size, (tile_row + 1) * size),
+            np.arange(tile_col * size, (tile_col + 1) * size),
+        )
+        tile.flags.writeable = False
+        self.num_generated_tiles += 1
+        self.tiles[key] = tile
+        if len(self.tiles) > self.max_cached_tiles:
+            self.tiles.popitem(last=False)
+        return tile
+
+    def read_cells(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        Read the cells from the tiles that cover them.
+        """
+        rows, cols = np.asarray(rows), np.asarray(cols)
+        values = np.empty((len(rows), len(cols)))
+        size = self.tile_size
+        row_tiles, col_tiles = rows // size, cols // size
+        for tile_row in np.unique(row_tiles).tolist():
+            in_row = np.flatnonzero(row_tiles == tile_row)
+            for tile_col in np.unique(col_tiles).tolist():
+                in_col = np.flatnonzero(col_tiles == tile_col)
+                tile = self.tile(tile_row, tile_col)
+                values[np.ix_(in_row, in_col)] = tile[
+                    np.ix_(
+                        rows[in_row] - tile_row * size, cols[in_col] - tile_col * size
+                    )
+                ]
+        return values
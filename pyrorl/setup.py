@@ -20,4 +20,10 @@ setup(
     ],
     install_requires=["numpy", "scipy", "torch", "gymnasium", "pygame", "imageio"],
     python_requires=">=3.8",
+    entry_points={
+        "console_scripts": [
+            "pyrorl-generate-maps=pyrorl.map_helpers.generate_dataset:main",
+            "pyrorl-benchmark=pyrorl.benchmark:main",
+        ],
+    },
 )
@@ -0,0 +1,89 @@
+"""
+Unit tests for the benchmarks in benchmark.py
+"""
+
+import copy
+import json
+import os
+import pytest
+from pyrorl import benchmark
+
+
+def test_benchmark_cases():
+    """
+    Make sure that the matrix covers every combination of settings that fits.
+    """
+    cases = benchmark.benchmark_cases([5, 10], [5, 20], [1, 3], ["none"], [1, 4])
+    assert len(cases) == 12
+    assert benchmark.BenchmarkCase(5, 20, 1, "none", 1) not in cases
+    assert benchmark.parse_wind("10:0.5") == {"wind_speed": 10, "wind_angle": 0.5}
+    with pytest.raises(ValueError):
+        benchmark.benchmark_cases(winds=["windy"])
+
+
+def test_run_benchmarks(tmp_path, monkeypatch):
+    """
+    Make sure that every metric is measured and nothing is left in the working
+    directory.
+    """
+    monkeypatch.chdir(tmp_path)
+    cases = benchmark.benchmark_cases([8], [3], [2], ["none", "5:1"], [2])
+    results = benchmark.run_benchmarks(cases, num_steps=3, repeats=1, render=True)
+    assert len(results["results"]) == 2
+    for result in results["results"]:
+        assert set(result["metrics"]) == set(benchmark.METRICS)
+        assert all(value > 0 for value in result["metrics"].values())
+    assert os.listdir(tmp_path) == []
+
+
+def test_compare_results():
+    """
+    Make sure that only metrics worse than the threshold are regressions, in
+    the direction that is worse for each metric.
+    """
+    baseline = {
+        "version": benchmark.RESULTS_VERSION,
+        "results": [
+            {
+                "case": benchmark.BenchmarkCase(10, 3, 2, "none", 1)._asdict(),
+                "metrics": {"steps_per_second": 100.0, "reset_seconds": 1.0},
+            }
+        ],
+    }
+    results = copy.deepcopy(baseline)
+    metrics = results["results"][0]["metrics"]
+    assert benchmark.compare_results(results, baseline) == []
+
+    metrics["steps_per_second"], metrics["reset_seconds"] = 500.0, 1.1
+    assert benchmark.compare_results(results, baseline) == []
+    metrics["steps_per_second"], metrics["reset_seconds"] = 70.0, 1.3
+    regressions = benchmark.compare_results(results, baseline, threshold=0.25)
+    assert len(regressions) == 2
+    assert "steps_per_second is 30% worse" in regressions[0]
+
+    # Cases the baseline does not have are skipped
+    results["results"][0]["case"]["batch_size"] = 4
+    assert benchmark.compare_results(results, baseline) == []
+    with pytest.raises(ValueError):
+        benchmark.compare_results(results, {"version": 0, "results": []})
+
+
+def test_main(tmp_path):
+    """
+    Make sure that the command line saves results and fails on regressions.
+    """
+    output = str(tmp_path / "results.json")
+    args = ["--grid-sizes", "8", "--populated-areas", "3", "--paths", "1"]
+    args += ["--winds", "none", "--batch-sizes", "1", "--steps", "2"]
+    assert benchmark.main(args + ["--repeats", "1", "--output", output]) == 0
+    with open(output, "r") as f:
+        results = json.load(f)
+    assert len(results["results"]) == 1
+
+    # A baseline that was far faster makes the run regress
+    for metric in results["results"][0]["metrics"]:
+        results["results"][0]["metrics"][metric] *= 1000
+    results["results"][0]["metrics"]["steps_per_second"] = 1e12
+    with open(output, "w") as f:
+        json.dump(results, f)
+    assert benchmark.main(args + ["--repeats", "1", "--baseline", output]) == 1
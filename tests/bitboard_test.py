@@ -0,0 +1,118 @@
+"""
+Unit tests for bit-packed fire propagation in bitboard.py
+"""
+
+import numpy as np
+import pytest
+import torch
+from pyrorl.envs.environment.bitboard import (
+    BitboardPropagator,
+    pack_fire,
+    shift_board,
+)
+from pyrorl.envs.environment.environment import FireWorld, FIRE_INDEX
+from pyrorl.envs.environment.environment_constant import (
+    set_fire_mask,
+    linear_wind_transform,
+)
+from pyrorl.envs.environment.propagation import ignition_probability
+
+
+def unpack(board, num_cols):
+    """
+    Unpack a packed board back into a grid of 0s and 1s.
+    """
+    bits = np.unpackbits(board.view(np.uint8), axis=-1, bitorder="little")
+    return bits[..., :num_cols]
+
+
+def test_shift_board():
+    """
+    Make sure that shifting a packed board moves every cell, including across
+    word boundaries, and drops cells that leave the grid.
+    """
+    fire = (np.random.default_rng(0).random((2, 7, 150)) < 0.3).astype(float)
+    board = pack_fire(fire)
+    assert board.shape == (2, 7, 3)
+    assert np.array_equal(unpack(board, 150), fire)
+
+    padded = np.pad(fire, ((0, 0), (3, 3), (3, 3)))
+    for row_offset in range(-3, 4):
+        for col_offset in range(-3, 4):
+            expected = padded[
+                :, 3 + row_offset : 10 + row_offset, 3 + col_offset : 153 + col_offset
+            ]
+            shifted = shift_board(board, row_offset, col_offset)
+            assert np.array_equal(unpack(shifted, 150), expected)
+
+
+def test_matches_dense_propagation():
+    """
+    Make sure that the ignition probabilities match the dense kernel, with and
+    without wind and for wider kernels.
+    """
+    fire = (np.random.default_rng(1).random((3, 20, 70)) < 0.2).astype(float)
+    masks = [
+        torch.from_numpy(set_fire_mask()),
+        linear_wind_transform(20, 0.7),
+        torch.from_numpy(set_fire_mask(0.2, 9)),
+    ]
+    for mask in masks:
+        propagator = BitboardPropagator(mask)
+        dense = ignition_probability(torch.from_numpy(fire), mask).numpy()
+        assert np.allclose(propagator.ignition_probability(fire), dense, atol=1e-9)
+
+    # Without wind the neighbors fall into the five distance classes
+    assert len(BitboardPropagator(masks[0]).groups) == 5
+    with pytest.raises(ValueError):
+        BitboardPropagator(torch.ones((25, 10)))
+
+
+def test_bitboard_engine():
+    """
+    Make sure that the bitboard engine ignites cells as often as their
+    ignition probability, and can be used by FireWorld.
+    """
+    torch.manual_seed(0)
+    mask = torch.from_numpy(set_fire_mask(0.3))
+    propagator = BitboardPropagator(mask)
+    fire = np.zeros((2000, 9, 9))
+    fire[:, 4, 4] = 1
+    propagator.ignite(fire)
+    single = np.zeros((9, 9))
+    single[4, 4] = 1
+    expected = propagator.ignition_probability(single)
+    assert np.abs(fire.mean(axis=0) - np.maximum(expected, single)).max() < 0.05
+    assert np.all(fire[:, 0, :] == 0)
+
+    populated_areas = np.array([[1, 2]])
+    paths = [[[1, 1], [1, 0]]]
+    paths_to_pops = {0: [[1, 2]]}
+    world = FireWorld(
+        20,
+        20,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        custom_fire_locations=np.array([[10, 10]]),
+        fuel_map=np.full((20, 20), 10.0),
+        propagation_engine="bitboard",
+    )
+    for _ in range(3):
+        world.advance_to_next_timestep()
+    assert world.state_space[FIRE_INDEX].sum() > 1
+    result = world.rollout(None, 3, n=4, summaries=("final_state",))
+    assert result["final_state"].shape == (4, 5, 20, 20)
+
+    with pytest.raises(ValueError):
+        FireWorld(
+            20,
+            20,
+            populated_areas,
+            paths,
+            paths_to_pops,
+            elevation=np.zeros((20, 20)),
+            propagation_engine="bitboard",
+        )
+    with pytest.raises(ValueError):
+        FireWorld(20, 20, populated_areas, paths, paths_to_pops, propagation_engine="x")
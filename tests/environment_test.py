@@ -5,18 +5,23 @@ Unit tests for each of the functions in environment.py
 import numpy as np
 from pyrorl.envs.environment.environment import (
     FireWorld,
+    FuelType,
     FIRE_INDEX,
+    FUEL_INDEX,
     POPULATED_INDEX,
     EVACUATING_INDEX,
     PATHS_INDEX,
 )
 import pytest
 import random
+import torch
+from pyrorl.envs.environment import propagation, strategy
 
 
-def dummy_environment():
+def dummy_environment(**kwargs):
     """
-    Set up environment for the grid world.
+    Set up environment for the grid world, passing any keyword arguments on to
+    FireWorld.
     """
     # Define hardcoded paramaters of the gridworld -- populated areas, paths,
     # and which areas can use whicn paths.
@@ -44,7 +49,7 @@ def dummy_environment():
     }
 
     # Initialize fire world
-    test_world = FireWorld(10, 10, populated_areas, paths, paths_to_pops)
+    test_world = FireWorld(10, 10, populated_areas, paths, paths_to_pops, **kwargs)
     return test_world
 
 
@@ -820,3 +825,542 @@ def test_wind_bias():
     assert (windless_mask[:, 0] < wind_mask[:, 0]).all().item()
     assert (windless_mask[:, 4] > wind_mask[:, 4]).all().item()
     assert (windless_mask[:, 2] == wind_mask[:, 2]).all().item()
+
+
+def test_snapshot_and_restore():
+    """
+    Test that restoring a snapshot brings back the state, bookkeeping, and
+    random number generator of the simulation.
+    """
+    test_world = dummy_environment()
+    test_world.state_space[FIRE_INDEX] = 0
+    test_world.state_space[FIRE_INDEX, 9, 0] = 1
+    test_world.set_action(0)
+    test_world.advance_to_next_timestep()
+    snapshot = test_world.snapshot()
+    expected_state = test_world.get_state()
+
+    # Advance and record what happened after the snapshot
+    for _ in range(5):
+        test_world.set_action(2)
+        test_world.advance_to_next_timestep()
+    first_state = test_world.get_state()
+    first_reward = test_world.get_state_utility()
+
+    # Restoring brings the world back to the snapshot
+    test_world.restore(snapshot)
+    assert np.array_equal(test_world.get_state(), expected_state)
+    assert test_world.get_timestep() == 1
+    assert test_world.evacuating_paths == {0: [[1, 2]]}
+
+    # The same fire spreads again, since the random state was captured too
+    for _ in range(5):
+        test_world.set_action(2)
+        test_world.advance_to_next_timestep()
+    assert np.array_equal(test_world.get_state(), first_state)
+    assert test_world.get_state_utility() == first_reward
+
+
+def test_clone_is_independent():
+    """
+    Test that a cloned world shares static map data but not its mutable state.
+    """
+    test_world = dummy_environment()
+    cloned_world = test_world.clone()
+
+    # Path masks are shared rather than copied
+    for path, cloned_path in zip(test_world.paths, cloned_world.paths):
+        assert path[0] is cloned_path[0]
+
+    # Mutating the clone leaves the original untouched
+    original_state = test_world.get_state()
+    cloned_world.state_space[FIRE_INDEX] = 1
+    cloned_world.update_paths_and_evactuations()
+    cloned_world.set_action(0)
+    assert np.array_equal(test_world.get_state(), original_state)
+    assert all(path[1] for path in test_world.paths)
+    assert not any(path[1] for path in cloned_world.paths)
+    assert test_world.evacuating_paths == {}
+
+
+@pytest.mark.parametrize("engine", ["incremental", "auto"])
+def test_clone_has_own_propagator(engine, monkeypatch):
+    """
+    Test that a cloned world samples fire with its own copy of the propagator.
+    """
+    monkeypatch.setattr(strategy, "MIN_SPARSE_CELLS", 0)
+    torch.manual_seed(0)
+    test_world = dummy_environment(
+        propagation_engine=engine, custom_fire_locations=np.array([[5, 5]])
+    )
+    test_world.advance_to_next_timestep()
+    cloned_world = test_world.clone()
+    assert cloned_world.propagator is not test_world.propagator
+
+    # The fields of the incremental propagator are copied
+    original = test_world.propagator
+    if engine == "auto":
+        original = original.frontier
+        assert cloned_world.propagator.ignition.__self__ is cloned_world
+    field = original.log_survival.copy()
+
+    # Stepping the clone leaves the original's propagator untouched
+    cloned_world.state_space[FIRE_INDEX, :, :5] = 1
+    cloned_world.advance_to_next_timestep()
+    assert np.array_equal(original.log_survival, field)
+    if engine == "auto":
+        assert sum(test_world.propagator.strategy_steps.values()) == 1
+        assert sum(cloned_world.propagator.strategy_steps.values()) == 2
+
+
+def test_rollout_matches_stepping():
+    """
+    Test that a single rollout reproduces stepping the world one action at a time.
+    """
+    test_world = dummy_environment()
+    actions = [random.choice(test_world.get_actions()) for _ in range(40)]
+    snapshot = test_world.snapshot()
+    results = test_world.rollout(
+        lambda states, timestep: [actions[timestep]],
+        40,
+        summaries=("returns", "burned_populations", "evacuated", "final_state"),
+    )
+
+    # The rollout does not modify the world itself
+    assert np.array_equal(test_world.state_space, snapshot.state_space)
+    assert test_world.get_timestep() == 0
+
+    # Stepping from the same random state gives the same outcome
+    test_world.restore(snapshot)
+    total_reward = 0
+    for action in actions:
+        test_world.set_action(action)
+        test_world.advance_to_next_timestep()
+        total_reward += test_world.get_state_utility()
+    assert np.array_equal(results["final_state"][0], test_world.state_space)
+    assert results["returns"][0] == total_reward
+    assert results["evacuated"][0] == len(test_world.get_finished_evacuating())
+
+
+def test_rollout_batch():
+    """
+    Test that rollouts of many copies stop at the end of the episode and only
+    return the requested summaries.
+    """
+    test_world = dummy_environment()
+    num_pops = np.sum(test_world.state_space[POPULATED_INDEX])
+    results = test_world.rollout(None, 500, n=8, summaries=("burned_populations",))
+    assert list(results.keys()) == ["burned_populations"]
+    assert results["burned_populations"].shape == (8,)
+    assert np.all(results["burned_populations"] <= num_pops)
+
+    # Without evacuations every reward is +1 per safe area or -100 per burned one
+    returns = test_world.rollout(None, 500, n=8)["returns"]
+    assert np.all(returns <= 100 * num_pops)
+
+    with pytest.raises(ValueError):
+        test_world.rollout(None, 10, summaries=("unknown",))
+
+
+def test_burn_probability():
+    """
+    Test that burn probability maps start at the fire and spread at most two
+    cells per step.
+    """
+    populated_areas = np.array([[1, 2]])
+    paths = np.array([[[1, 0], [1, 1]]])
+    paths_to_pops = {0: [[1, 2]]}
+    test_world = FireWorld(
+        15,
+        15,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        custom_fire_locations=np.array([[7, 7]]),
+    )
+    test_world.state_space[FUEL_INDEX, 7, 7] = 10
+    original_state = np.copy(test_world.state_space)
+
+    # With no steps, only the fire itself is burning
+    probability, arrival = test_world.burn_probability(0, num_samples=4)
+    assert probability[7, 7] == 1 and arrival[7, 7] == 0
+    assert np.sum(probability) == 1
+    assert np.all(arrival[probability == 0] == np.inf)
+
+    # Fire can only have travelled two cells per step
+    probability, arrival = test_world.burn_probability(3, num_samples=50, batch_size=16)
+    rows, cols = np.indices(probability.shape)
+    distance = np.maximum(np.abs(rows - 7), np.abs(cols - 7))
+    assert np.all(probability[distance > 6] == 0)
+    assert np.all(probability[distance <= 1] > 0)
+    assert np.all((probability >= 0) & (probability <= 1))
+    burned = probability > 0
+    assert np.all(arrival[burned] >= np.ceil(distance[burned] / 2))
+    assert np.all(arrival[burned] <= 3)
+
+    # Sampling futures leaves the world untouched
+    assert np.array_equal(test_world.state_space, original_state)
+
+
+def test_slope_spread():
+    """
+    Test that fire is more likely to spread uphill than downhill.
+    """
+    populated_areas = np.array([[1, 2]])
+    paths = [[[1, 1], [1, 0]]]
+    paths_to_pops = {0: [[1, 2]]}
+    fire = np.array([[5, 5]])
+
+    # Flat ground spreads just like no elevation at all
+    flat = FireWorld(
+        10, 10, populated_areas, paths, paths_to_pops, custom_fire_locations=fire
+    )
+    level = FireWorld(
+        10,
+        10,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        custom_fire_locations=fire,
+        elevation=np.zeros((10, 10)),
+    )
+    flat_probability = flat.get_ignition_probability(
+        torch.from_numpy(flat.state_space[FIRE_INDEX])
+    )
+    level_probability = level.get_ignition_probability(
+        torch.from_numpy(level.state_space[FIRE_INDEX])
+    )
+    assert torch.allclose(flat_probability, level_probability, atol=1e-6)
+
+    # The ground rises towards higher column numbers
+    hill = FireWorld(
+        10,
+        10,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        custom_fire_locations=fire,
+        elevation=np.tile(np.arange(10) * 20.0, (10, 1)),
+        cell_size=30,
+    )
+    assert hill.fire_mask.shape == (25, 100)
+    probability = hill.get_ignition_probability(
+        torch.from_numpy(hill.state_space[FIRE_INDEX])
+    )
+    assert probability[5, 6] > flat_probability[5, 6] > probability[5, 4]
+    assert probability[5, 7] > probability[5, 3]
+
+    # Batched propagation uses the same per-cell mask
+    result = hill.rollout(None, 5, n=3, summaries=("final_state",))
+    assert result["final_state"].shape == (3, 5, 10, 10)
+    with pytest.raises(ValueError):
+        FireWorld(
+            10, 10, populated_areas, paths, paths_to_pops, elevation=np.zeros((5, 5))
+        )
+
+
+def test_fuel_types():
+    """
+    Test that each fuel type spreads fire at its own rate and burns for its own
+    number of steps.
+    """
+    populated_areas = np.array([[1, 2]])
+    paths = [[[1, 1], [1, 0]]]
+    paths_to_pops = {0: [[1, 2]]}
+    fire = np.array([[5, 5]])
+
+    # A single fuel type spreads just like the homogeneous model
+    homogeneous = FireWorld(
+        10, 10, populated_areas, paths, paths_to_pops, custom_fire_locations=fire
+    )
+    single_type = FireWorld(
+        10,
+        10,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        custom_fire_locations=fire,
+        fuel_types=np.zeros((10, 10), dtype=int),
+        fuel_type_params=[FuelType(0.094, 8.5, 3)],
+    )
+    fire_layer = torch.from_numpy(homogeneous.state_space[FIRE_INDEX])
+    assert torch.allclose(
+        homogeneous.get_ignition_probability(fire_layer).double(),
+        single_type.get_ignition_probability(fire_layer),
+        atol=1e-6,
+    )
+    neighbor_mask = single_type.get_neighbor_mask()
+    assert neighbor_mask.shape == (25, 100)
+    assert torch.allclose(
+        neighbor_mask, homogeneous.fire_mask.double().expand(25, 100), atol=1e-6
+    )
+
+    # The right half of the grid is grass, which catches fire faster and burns
+    # out sooner than the timber on the left
+    fuel_types = np.zeros((10, 10), dtype=int)
+    fuel_types[:, 5:] = 1
+    fuel_type_params = [FuelType(0.05, 20, 0), FuelType(0.3, 2, 0)]
+    mixed = FireWorld(
+        10,
+        10,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        custom_fire_locations=fire,
+        fuel_types=fuel_types,
+        fuel_type_params=fuel_type_params,
+    )
+    assert np.all(mixed.state_space[FUEL_INDEX][:, :5] == 20)
+    assert np.all(mixed.state_space[FUEL_INDEX][:, 5:] == 2)
+    probability = mixed.get_ignition_probability(fire_layer)
+    assert probability[5, 6] > probability[5, 4]
+    assert torch.isclose(probability[5, 6], torch.tensor(0.3, dtype=torch.float64))
+
+    # With wind, every cell gets the fused mask of its type
+    windy = FireWorld(
+        10,
+        10,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        custom_fire_locations=fire,
+        wind_speed=10,
+        wind_angle=0,
+        fuel_types=fuel_types,
+        fuel_type_params=fuel_type_params,
+    )
+    assert windy.fire_mask.shape == (25, 100)
+    result = mixed.rollout(None, 5, n=3, summaries=("final_state",))
+    assert result["final_state"].shape == (3, 5, 10, 10)
+
+    with pytest.raises(ValueError):
+        FireWorld(
+            10,
+            10,
+            populated_areas,
+            paths,
+            paths_to_pops,
+            fuel_types=fuel_types,
+            fuel_type_params=fuel_type_params[:1],
+        )
+    with pytest.raises(ValueError):
+        FireWorld(
+            10,
+            10,
+            populated_areas,
+            paths,
+            paths_to_pops,
+            fuel_types=fuel_types,
+            fuel_type_params=[FuelType(1.5, 8.5, 3)] * 2,
+        )
+
+
+def test_kernel_size(monkeypatch):
+    """
+    Test that wider kernels let fire spread further, and that the FFT
+    convolution used for them matches unfolding the neighborhoods.
+    """
+    populated_areas = np.array([[1, 2]])
+    paths = [[[1, 1], [1, 0]]]
+    paths_to_pops = {0: [[1, 2]]}
+    fire = np.array([[10, 10], [12, 4]])
+
+    narrow = FireWorld(
+        20, 20, populated_areas, paths, paths_to_pops, custom_fire_locations=fire
+    )
+    wide = FireWorld(
+        20,
+        20,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        custom_fire_locations=fire,
+        wind_speed=20,
+        wind_angle=0.5,
+        kernel_size=9,
+    )
+    assert wide.fire_mask.shape == (81, 1)
+    fire_layer = torch.from_numpy(wide.state_space[FIRE_INDEX])
+    assert narrow.get_ignition_probability(fire_layer)[10, 14] == 0
+    probability = wide.get_ignition_probability(fire_layer)
+    assert probability[10, 14] > 0
+
+    monkeypatch.setattr(propagation, "FFT_KERNEL_SIZE", 100)
+    direct = wide.get_ignition_probability(fire_layer)
+    assert torch.allclose(probability.double(), direct.double(), atol=1e-6)
+    assert torch.all(probability[direct == 0] == 0)
+
+    # Per-cell masks and rollouts work with any kernel
+    hill = FireWorld(
+        20,
+        20,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        custom_fire_locations=fire,
+        elevation=np.tile(np.arange(20) * 5.0, (20, 1)),
+        kernel_size=7,
+    )
+    assert hill.fire_mask.shape == (49, 400)
+    result = wide.rollout(None, 5, n=2, summaries=("final_state",))
+    assert result["final_state"].shape == (2, 5, 20, 20)
+
+    for kernel_size in [1, 4]:
+        with pytest.raises(ValueError):
+            FireWorld(
+                20, 20, populated_areas, paths, paths_to_pops, kernel_size=kernel_size
+            )
+
+
+def test_expected_rollout():
+    """
+    Test that the mean-field rollout gives exact probabilities for a single
+    step, stays close to sampled futures over short horizons, and follows
+    planned evacuations.
+    """
+    populated_areas = np.array([[2, 2]])
+    paths = [[[2, 1], [2, 0]]]
+    paths_to_pops = {0: [[2, 2]]}
+    torch.manual_seed(0)
+    test_world = FireWorld(
+        30,
+        30,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        custom_fire_locations=np.array([[25, 25], [25, 26]]),
+        fuel_map=np.full((30, 30), 10.0),
+    )
+    state = test_world.get_state()
+
+    # After one step, burning cells keep burning and others ignite with the
+    # probability given by the fire mask
+    result = test_world.expected_rollout(1)
+    fire_layer = torch.from_numpy(test_world.state_space[FIRE_INDEX])
+    ignition = test_world.get_ignition_probability(fire_layer).numpy()
+    fire = test_world.state_space[FIRE_INDEX]
+    assert np.allclose(result["burning"][0], fire + (1 - fire) * ignition)
+    assert np.array_equal(test_world.get_state(), state)
+
+    # Over a few steps it is close to the sampled burn probability
+    result = test_world.expected_rollout(3)
+    probability, _ = test_world.burn_probability(3, num_samples=2000, batch_size=500)
+    assert np.abs(result["burned"] - probability).max() < 0.06
+    assert np.allclose(result["fuel"][25, 25:27], 7)
+
+    # The fire is too far away to reach the populated area, so the planned
+    # evacuation finishes after ten steps
+    result = test_world.expected_rollout(12, actions=[0])
+    assert result["evacuated"] == pytest.approx(1)
+    assert result["burned_populations"] == pytest.approx(0, abs=1e-6)
+    assert result["path_survival"][0] == pytest.approx(1, abs=1e-6)
+    assert result["returns"] == pytest.approx(0, abs=1e-6)
+    assert result["burning"].shape == (12, 30, 30)
+    with pytest.raises(ValueError):
+        test_world.expected_rollout(-1)
+
+
+def test_fast_forward():
+    """
+    Test that once the fire is out, fast forwarding gives the same reward and
+    final state as stepping to the end of the episode.
+    """
+    populated_areas = np.array([[1, 2], [6, 4]])
+    paths = [[[1, 1], [1, 0]], [[6, 3], [6, 2]]]
+    paths_to_pops = {0: [[1, 2]], 1: [[6, 4]]}
+    worlds = []
+    for fast_forward in [False, True]:
+        world = FireWorld(
+            10,
+            10,
+            populated_areas,
+            paths,
+            paths_to_pops,
+            custom_fire_locations=np.array([[9, 9]]),
+            fuel_map=np.full((10, 10), 5.0),
+            max_timesteps=20,
+            fast_forward=fast_forward,
+        )
+        world.state_space[FIRE_INDEX] = 0
+        world.set_action(0)
+        worlds.append(world)
+    stepped, skipped = worlds
+
+    # The same world rolled out without a policy skips ahead as well
+    result = stepped.rollout(
+        None, 30, summaries=("returns", "evacuated", "final_state")
+    )
+
+    total = 0
+    while not stepped.get_terminated():
+        stepped.advance_to_next_timestep()
+        total += stepped.get_state_utility()
+    assert stepped.get_timestep() == 20
+
+    skipped.advance_to_next_timestep()
+    assert skipped.get_terminated()
+    assert skipped.get_state_utility() == total == 20
+    assert np.array_equal(skipped.get_state(), stepped.get_state())
+    assert skipped.get_finished_evacuating() == stepped.get_finished_evacuating()
+    assert skipped.evacuating_paths == stepped.evacuating_paths == {}
+    assert result["returns"][0] == total
+    assert result["evacuated"][0] == 1
+    assert np.array_equal(result["final_state"][0], stepped.state_space)
+
+    with pytest.raises(ValueError):
+        FireWorld(10, 10, populated_areas, paths, paths_to_pops, max_timesteps=0)
+
+
+def test_step_instrumentation():
+    """
+    Test that an instrumented world times every phase of a step and counts its
+    work, without changing the simulation.
+    """
+    populated_areas = np.array([[1, 2], [6, 4]])
+    paths = [[[1, 1], [1, 0]], [[6, 3], [6, 2]]]
+    paths_to_pops = {0: [[1, 2]], 1: [[6, 4]]}
+    worlds = []
+    for instrument in [False, True]:
+        world = FireWorld(
+            10,
+            10,
+            populated_areas,
+            paths,
+            paths_to_pops,
+            custom_fire_locations=np.array([[5, 7]]),
+            fuel_map=np.full((10, 10), 5.0),
+            instrument=instrument,
+        )
+        worlds.append(world)
+    plain, instrumented = worlds
+    assert plain.get_step_stats() is None and plain.get_aggregate_stats() is None
+    assert instrumented.get_aggregate_stats()["totals"] == {"steps": 0}
+
+    for step in range(5):
+        for world in worlds:
+            torch.manual_seed(step)
+            world.set_action(step)
+            world.advance_to_next_timestep()
+        assert np.array_equal(plain.state_space, instrumented.state_space)
+        stats = instrumented.get_step_stats()
+        assert stats["burning_cells"] == np.count_nonzero(
+            instrumented.state_space[FIRE_INDEX]
+        )
+        assert stats["paths_checked"] <= len(instrumented.paths)
+        for phase in ["propagation", "paths", "reward"]:
+            assert stats[phase + "_seconds"] >= 0
+    assert plain.get_state_utility() == instrumented.get_state_utility()
+
+    # Evacuations were started, so they were processed on later steps
+    summary = instrumented.get_aggregate_stats()
+    assert summary["totals"]["steps"] == 5
+    assert summary["totals"]["evacuations_processed"] > 0
+    assert summary["means"]["paths_checked"] == pytest.approx(
+        summary["totals"]["paths_checked"] / 5
+    )
+
+    # Clones keep their own stats
+    clone = instrumented.clone()
+    clone.advance_to_next_timestep()
+    assert clone.get_aggregate_stats()["totals"]["steps"] == 1
+    assert instrumented.get_aggregate_stats()["totals"]["steps"] == 5
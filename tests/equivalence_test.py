@@ -0,0 +1,266 @@
+"""
+Statistical equivalence tests between the propagation engines and the
+reference (dense) FireWorld
+"""
+
+import numpy as np
+import pytest
+import torch
+from scipy import stats
+from pyrorl.envs.environment import strategy
+from pyrorl.envs.environment.environment import (
+    FireWorld,
+    FIRE_INDEX,
+    POPULATED_INDEX,
+    EVACUATING_INDEX,
+    PATHS_INDEX,
+)
+from pyrorl.map_helpers.create_map_info import generate_map_info
+
+NUM_ROWS, NUM_COLS = 20, 20
+NUM_STEPS = 25
+NUM_SEEDS = 150
+# Family-wise significance level of every comparison
+ALPHA = 1e-3
+
+# Maps with shared (calm, windy) and per-cell (sloped) fire masks
+MAPS = {
+    "calm": {},
+    "windy": {"wind_speed": 10, "wind_angle": np.pi / 4},
+    "sloped": {
+        "elevation": np.add.outer(np.arange(NUM_ROWS), np.arange(NUM_COLS)) * 3.0
+    },
+}
+ENGINES = {
+    "calm": ["bitboard", "incremental", "auto"],
+    "windy": ["bitboard", "incremental", "auto"],
+    "sloped": ["incremental", "auto"],
+}
+
+
+@pytest.fixture(autouse=True)
+def sparse_small_grids(monkeypatch):
+    """
+    Let the auto engine use every strategy on the small test grids.
+    """
+    monkeypatch.setattr(strategy, "MIN_SPARSE_CELLS", 0)
+
+
+def make_world(map_name: str, engine: str, **kwargs) -> FireWorld:
+    """
+    Set up a world on a fixed map, so that episodes only differ by ignitions.
+    """
+    map_seed = list(MAPS).index(map_name)
+    populated_areas, paths, paths_to_pops = generate_map_info(
+        NUM_ROWS, NUM_COLS, 6, save_map=False, seed=map_seed
+    )
+    fuel = np.random.default_rng(map_seed).uniform(4, 12, (NUM_ROWS, NUM_COLS))
+    return FireWorld(
+        NUM_ROWS,
+        NUM_COLS,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        custom_fire_locations=np.array([[3, 3]]),
+        fuel_map=fuel,
+        fire_propagation_rate=kwargs.pop("fire_propagation_rate", 0.1),
+        propagation_engine=engine,
+        **MAPS[map_name],
+        **kwargs,
+    )
+
+
+def run_episode(world: FireWorld) -> dict:
+    """
+    Step a world with a fixed sequence of actions, and record what the
+    comparisons need: burned area over time, path destruction times, the
+    reward, which cells ever burned, and the path and evacuation bookkeeping.
+    """
+    num_paths = len(world.paths)
+    burned = world.state_space[FIRE_INDEX] == 1
+    burned_area, trace = [], []
+    destroyed = np.full(num_paths, NUM_STEPS + 1)
+    reward = 0
+    for step in range(NUM_STEPS):
+        world.set_action(step % len(world.get_actions()))
+        world.advance_to_next_timestep()
+        reward += world.get_state_utility()
+        burned |= world.state_space[FIRE_INDEX] == 1
+        burned_area.append(np.count_nonzero(burned))
+        for i in range(num_paths):
+            if not world.paths[i][1] and destroyed[i] > NUM_STEPS:
+                destroyed[i] = step + 1
+        trace.append(
+            (
+                world.state_space[
+                    [FIRE_INDEX, POPULATED_INDEX, EVACUATING_INDEX, PATHS_INDEX]
+                ].copy(),
+                world.evacuating_timestamps.copy(),
+                reward,
+                [list(map(int, cell)) for cell in world.finished_evacuating_cells],
+            )
+        )
+    return {
+        "burned_area": np.array(burned_area),
+        "destroyed": destroyed,
+        "reward": reward,
+        "burned": burned,
+        "trace": trace,
+    }
+
+
+def sample_episodes(map_name: str, engine: str, seed: int, **kwargs) -> dict:
+    """
+    Run NUM_SEEDS episodes on a map and stack what they recorded.
+    """
+    episodes = []
+    for i in range(NUM_SEEDS):
+        torch.manual_seed(seed * NUM_SEEDS + i)
+        episodes.append(run_episode(make_world(map_name, engine, **kwargs)))
+    return {
+        key: np.array([episode[key] for episode in episodes])
+        for key in ["burned_area", "destroyed", "reward", "burned"]
+    }
+
+
+def comparison_p_value(reference: dict, candidate: dict) -> float:
+    """
+    Compare two samples of episodes and return the smallest p-value of all
+    the tests, Bonferroni corrected for the number of tests. Burned area (at
+    every step), path destruction times and rewards are compared with
+    two-sample Kolmogorov-Smirnov tests, and the frequency with which each
+    cell burns with a two-proportion z-test.
+    """
+    p_values = []
+    for key in ["burned_area", "destroyed"]:
+        for column in range(reference[key].shape[1]):
+            a, b = reference[key][:, column], candidate[key][:, column]
+            # Columns with one value in both samples carry no information
+            if np.ptp(np.concatenate([a, b])) > 0:
+                p_values.append(stats.ks_2samp(a, b).pvalue)
+    p_values.append(stats.ks_2samp(reference["reward"], candidate["reward"]).pvalue)
+
+    # Cells that always or never burn in both samples carry no information
+    a, b = reference["burned"].mean(axis=0), candidate["burned"].mean(axis=0)
+    pooled = (a + b) / 2
+    informative = (pooled > 0) & (pooled < 1)
+    z = (a - b)[informative] / np.sqrt(
+        pooled[informative] * (1 - pooled[informative]) * 2 / NUM_SEEDS
+    )
+    p_values.extend(2 * stats.norm.sf(np.abs(z)))
+    return min(1, min(p_values) * len(p_values))
+
+
+class SharedDraws:
+    """
+    Stands in for a world's propagator so that every engine ignites cells from
+    the same uniform draws: a cell ignites when its draw is below the ignition
+    probability the engine computes. Engines that agree on the probabilities
+    then produce the same fires, so everything else can be compared exactly.
+    """
+
+    def __init__(self, world: FireWorld, seed: int):
+        """
+        Wrap the world's engine, or its dense kernel for the reference.
+        """
+        self.world = world
+        self.engine = world.propagator
+        self.generator = torch.Generator().manual_seed(seed)
+
+    def ignite(self, fire: np.ndarray):
+        """
+        Ignite the cells whose shared draw is below their probability.
+        """
+        if self.engine is None:
+            z = self.world.get_ignition_probability(torch.from_numpy(fire)).numpy()
+        else:
+            z = self.engine.ignition_probability(fire)
+        draws = torch.rand(fire.shape, generator=self.generator, dtype=torch.float64)
+        fire[draws.numpy() < z] = 1
+
+
+@pytest.mark.parametrize(
+    "map_name,engine",
+    [(map_name, engine) for map_name in MAPS for engine in ENGINES[map_name]],
+)
+def test_engines_match_reference_distribution(map_name, engine):
+    """
+    Make sure that every engine spreads fire like the dense reference, over
+    many seeds.
+    """
+    reference = sample_episodes(map_name, "dense", 0)
+    candidate = sample_episodes(map_name, engine, 1)
+    assert comparison_p_value(reference, candidate) > ALPHA
+
+
+def test_comparison_detects_differences():
+    """
+    Make sure that the comparison has the power to tell apart fires that
+    spread at slightly different rates.
+    """
+    reference = sample_episodes("calm", "dense", 0)
+    candidate = sample_episodes("calm", "dense", 1, fire_propagation_rate=0.12)
+    assert comparison_p_value(reference, candidate) < ALPHA
+
+
+@pytest.mark.parametrize(
+    "map_name,engine",
+    [(map_name, engine) for map_name in MAPS for engine in ENGINES[map_name]],
+)
+def test_engines_match_reference_bookkeeping(map_name, engine):
+    """
+    Make sure that, under shared ignition draws, every engine burns the same
+    cells and keeps exactly the same path and evacuation bookkeeping as the
+    dense reference.
+    """
+    for seed in range(5):
+        episodes = []
+        for name in ["dense", engine]:
+            world = make_world(map_name, name)
+            world.propagator = SharedDraws(world, seed)
+            episodes.append(run_episode(world))
+        reference, candidate = episodes
+        np.testing.assert_array_equal(reference["destroyed"], candidate["destroyed"])
+        for expected, actual in zip(reference["trace"], candidate["trace"]):
+            np.testing.assert_array_equal(expected[0], actual[0])
+            np.testing.assert_array_equal(expected[1], actual[1])
+            assert expected[2:] == actual[2:]
+
+
+@pytest.mark.parametrize(
+    "map_name,engine",
+    [(map_name, engine) for map_name in MAPS for engine in ENGINES[map_name]],
+)
+def test_engine_ignite_matches_reference_probabilities(map_name, engine):
+    """
+    Make sure that each engine's own ignite() sampler ignites every cell as
+    often as the dense reference probability says, for a small, a medium and a
+    large fire (which the auto engine samples with different strategies).
+    """
+    reference = make_world(map_name, "dense")
+    world = make_world(map_name, engine)
+    assert type(world.propagator).__name__ != "SharedDraws"
+    num_samples = 2000
+    rng = np.random.default_rng(0)
+    torch.manual_seed(0)
+    for num_burning in [1, 20, 120]:
+        fire = np.zeros((NUM_ROWS, NUM_COLS))
+        fire.reshape(-1)[rng.choice(fire.size, num_burning, replace=False)] = 1
+        expected = reference.get_ignition_probability(torch.from_numpy(fire))
+        expected = expected.numpy()
+
+        samples = np.repeat(fire[np.newaxis], num_samples, axis=0)
+        world.propagator.ignite(samples)
+        frequency = samples.mean(axis=0)
+
+        # Cells that cannot ignite never do, and burning cells keep burning
+        unlit = fire == 0
+        assert np.all(frequency[unlit & (expected == 0)] == 0)
+        assert np.all(frequency[~unlit] == 1)
+
+        # Every other cell ignites at its reference rate
+        tested = unlit & (expected > 0) & (expected < 1)
+        p = expected[tested]
+        z = (frequency[tested] - p) / np.sqrt(p * (1 - p) / num_samples)
+        p_value = 2 * stats.norm.sf(np.abs(z)).min() * np.count_nonzero(tested)
+        assert p_value > ALPHA
@@ -0,0 +1,185 @@
+"""
+Unit tests for incremental fire propagation in incremental.py
+"""
+
+import numpy as np
+import pytest
+import torch
+from pyrorl.envs.environment import strategy
+from pyrorl.envs.environment.environment import FireWorld, FuelType, FIRE_INDEX
+from pyrorl.envs.environment.environment_constant import (
+    set_fire_mask,
+    slope_fire_mask,
+)
+from pyrorl.envs.environment.incremental import IncrementalPropagator
+from pyrorl.envs.environment.propagation import ignition_probability
+from pyrorl.envs.environment.spotting import SpottingModel
+
+
+def test_field_follows_fire_changes():
+    """
+    Make sure that the field matches the dense kernel after fires start and
+    stop, for shared and per-cell masks and for batches.
+    """
+    rng = np.random.default_rng(0)
+    shared = torch.from_numpy(set_fire_mask(0.2))
+    per_cell = slope_fire_mask(shared, rng.random((20, 30)) * 50, 30)
+    for mask in [shared, per_cell]:
+        propagator = IncrementalPropagator(mask, 20, 30)
+        fire = (rng.random((20, 30)) < 0.1).astype(float)
+        for _ in range(4):
+            expected = ignition_probability(torch.from_numpy(fire), mask).numpy()
+            assert np.allclose(propagator.ignition_probability(fire), expected)
+
+            # A few cells start and stop burning
+            flips = rng.random((20, 30)) < 0.05
+            fire[flips] = 1 - fire[flips]
+
+        batch = (rng.random((3, 20, 30)) < 0.1).astype(float)
+        expected = ignition_probability(torch.from_numpy(batch), mask).numpy()
+        assert np.allclose(propagator.ignition_probability(batch), expected)
+
+    # Cells without burning neighbors cannot ignite
+    fire = np.zeros((20, 30))
+    fire[0, 0] = 1
+    probability = propagator.ignition_probability(fire)
+    assert np.count_nonzero(probability) == 8
+    assert propagator.ignition_probability(np.zeros((20, 30))).max() == 0
+
+
+def test_incremental_engine():
+    """
+    Make sure that FireWorld can step and roll out with the incremental engine,
+    including with fuel types, and that a restored world is handled.
+    """
+    populated_areas = np.array([[1, 2]])
+    paths = [[[1, 1], [1, 0]]]
+    paths_to_pops = {0: [[1, 2]]}
+    fuel_types = np.zeros((20, 20), dtype=int)
+    fuel_types[:, 10:] = 1
+    torch.manual_seed(0)
+    world = FireWorld(
+        20,
+        20,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        custom_fire_locations=np.array([[10, 10]]),
+        fuel_types=fuel_types,
+        fuel_type_params=[FuelType(0.1, 10, 0), FuelType(0.4, 10, 0)],
+        propagation_engine="incremental",
+    )
+    snapshot = world.snapshot()
+    for _ in range(4):
+        world.advance_to_next_timestep()
+    burned = world.state_space[FIRE_INDEX].copy()
+    assert burned.sum() > 1
+
+    # Restoring goes back to a layer the field has to catch up with
+    world.restore(snapshot)
+    for _ in range(4):
+        world.advance_to_next_timestep()
+    assert np.array_equal(world.state_space[FIRE_INDEX], burned)
+
+    result = world.rollout(None, 3, n=4, summaries=("final_state",))
+    assert result["final_state"].shape == (4, 5, 20, 20)
+
+
+def assert_follows(propagator: IncrementalPropagator, world: FireWorld):
+    """
+    Check that a propagator's fields match those rebuilt from a world's fire.
+    """
+    fire = world.state_space[FIRE_INDEX]
+    expected = IncrementalPropagator(world.get_neighbor_mask(), *fire.shape)
+    expected.update(fire)
+    assert propagator.num_burning == expected.num_burning
+    assert np.array_equal(propagator.burning, expected.burning)
+    assert np.array_equal(propagator.exposure, expected.exposure)
+    assert np.allclose(propagator.log_survival, expected.log_survival)
+    assert np.array_equal(propagator.candidates, expected.candidates)
+
+
+@pytest.mark.parametrize("engine", ["incremental", "auto"])
+def test_steps_follow_changed_cells(engine, monkeypatch):
+    """
+    Make sure that the fields stay exact when a world's steps only pass on the
+    cells that burned out, were ignited or were spotted, including after a
+    restore and across switches between strategies.
+    """
+    monkeypatch.setattr(strategy, "MIN_SPARSE_CELLS", 0)
+    populated_areas = np.array([[1, 2]])
+    paths = [[[1, 1], [1, 0]]]
+    paths_to_pops = {0: [[1, 2]]}
+    torch.manual_seed(0)
+    world = FireWorld(
+        40,
+        40,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        custom_fire_locations=np.array([[20, 20]]),
+        fuel_map=np.random.default_rng(0).uniform(1, 4, (40, 40)),
+        fire_propagation_rate=0.3,
+        spotting=SpottingModel(0.2, 6, 1, 1),
+        propagation_engine=engine,
+    )
+    snapshot = world.snapshot()
+    frontier = world.propagator
+    if engine == "auto":
+        frontier = frontier.frontier
+    strategies = set()
+    for step in range(30):
+        if step == 15:
+            world.restore(snapshot)
+        world.advance_to_next_timestep()
+        strategies.add(world.get_propagation_strategy())
+        if world.get_propagation_strategy() in ["frontier", "incremental"]:
+            assert_follows(frontier, world)
+    if engine == "auto":
+        assert len(strategies) > 1
+
+
+def test_work_scales_with_changed_cells(monkeypatch):
+    """
+    Make sure that, after the first step, a world's steps only stamp the cells
+    that changed and only sample cells next to the fire, without ever
+    comparing whole fire layers.
+    """
+    populated_areas = np.array([[1, 2]])
+    paths = [[[1, 1], [1, 0]]]
+    paths_to_pops = {0: [[1, 2]]}
+    torch.manual_seed(0)
+    world = FireWorld(
+        1000,
+        1000,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        custom_fire_locations=np.array([[500, 500]]),
+        fuel_map=np.full((1000, 1000), 100.0),
+        fire_propagation_rate=0.2,
+        propagation_engine="incremental",
+    )
+    world.advance_to_next_timestep()
+    propagator = world.propagator
+
+    def compare_layers(fire):
+        raise AssertionError("The whole fire layer was compared!")
+
+    stamped = []
+    stamp = propagator.stamp
+
+    def count_stamps(cells, sign):
+        stamped.append(len(cells[-1]))
+        return stamp(cells, sign)
+
+    monkeypatch.setattr(propagator, "update", compare_layers)
+    monkeypatch.setattr(propagator, "stamp", count_stamps)
+    for _ in range(10):
+        before = world.state_space[FIRE_INDEX].copy()
+        stamped.clear()
+        world.advance_to_next_timestep()
+        changed = np.count_nonzero(world.state_space[FIRE_INDEX] != before)
+        assert sum(stamped) == changed
+        assert len(propagator.candidates) <= 8 * propagator.num_burning
+    assert_follows(propagator, world)
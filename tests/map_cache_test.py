@@ -0,0 +1,73 @@
+"""
+Unit tests for the map cache in map_cache.py
+"""
+
+import numpy as np
+import os
+import pytest
+from pyrorl.map_helpers.map_cache import MapCache, map_cache_key
+from pyrorl.map_helpers.create_map_info import generate_map_info
+
+
+def test_cache_hits_and_misses(tmp_path):
+    """
+    Make sure that a cached map matches the generated one and is only
+    generated once.
+    """
+    cache = MapCache(os.path.join(tmp_path, "cache"))
+    populated_areas, paths, paths_to_pops = cache.get_map(15, 20, 4, seed=3)
+    cached_areas, cached_paths, cached_paths_to_pops = cache.get_map(15, 20, 4, seed=3)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    expected = generate_map_info(15, 20, 4, save_map=False, seed=3)
+    assert np.array_equal(cached_areas, expected[0])
+    assert [np.asarray(path).tolist() for path in cached_paths] == [
+        list(path) for path in expected[1]
+    ]
+    assert cached_paths_to_pops == expected[2] == paths_to_pops
+
+    # Any change to the parameters or seed is a different map
+    cache.get_map(15, 20, 4, seed=4)
+    cache.get_map(15, 20, 4, seed=3, num_paths_mean=2)
+    assert cache.misses == 3
+    with pytest.raises(ValueError):
+        cache.get_map(15, 20, 4, seed=None)
+
+    # Passing a default value is the same map as leaving it out
+    cache.get_map(15, 20, 4, seed=3, num_paths_mean=3, path_method="random_walk")
+    assert (cache.hits, cache.misses) == (2, 3)
+    assert map_cache_key(3, {"num_rows": 15}) == map_cache_key(
+        3, {"num_rows": 15, "percent_go_straight": 50}
+    )
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    """
+    Make sure that the cache stays under its size cap by deleting the maps that
+    were used least recently.
+    """
+    cache = MapCache(os.path.join(tmp_path, "cache"))
+    cache.get_map(10, 10, 2, seed=0)
+    map_size = cache.size()
+    cache.max_bytes = int(2.5 * map_size)
+
+    cache.get_map(10, 10, 2, seed=1)
+    for seed, age in [(0, 30), (1, 20)]:
+        file_path = cache.path(cache_key_of(seed))
+        os.utime(file_path, (0, os.path.getmtime(file_path) - age))
+    # Using the oldest map makes the other one the least recently used
+    cache.get_map(10, 10, 2, seed=0)
+    cache.get_map(10, 10, 2, seed=2)
+
+    assert cache.size() <= cache.max_bytes
+    assert os.path.exists(cache.path(cache_key_of(0)))
+    assert not os.path.exists(cache.path(cache_key_of(1)))
+
+
+def cache_key_of(seed):
+    """
+    Get the key of one of the 10x10 test maps.
+    """
+    return map_cache_key(
+        seed, {"num_rows": 10, "num_cols": 10, "num_populated_areas": 2}
+    )
@@ -0,0 +1,92 @@
+"""
+Unit tests for generating map datasets in generate_dataset.py
+"""
+
+import json
+import numpy as np
+import os
+import pytest
+from pyrorl.map_helpers.generate_dataset import (
+    generate_dataset,
+    main,
+    MapDataset,
+    INDEX_FILENAME,
+)
+from pyrorl.envs.environment.environment import FireWorld
+
+PARAMS = {"num_rows": 12, "num_cols": 14, "num_populated_areas": 3}
+
+
+def test_dataset_is_deterministic(tmp_path):
+    """
+    Make sure that maps do not depend on how the work was split up.
+    """
+    serial = generate_dataset(
+        os.path.join(tmp_path, "serial"), 7, PARAMS, seed=3, maps_per_shard=2, workers=1
+    )
+    parallel = generate_dataset(
+        os.path.join(tmp_path, "parallel"), 7, PARAMS, seed=3, maps_per_shard=2
+    )
+    assert [entry["index"] for entry in serial] == list(range(7))
+    assert [entry["sha256"] for entry in serial] == [
+        entry["sha256"] for entry in parallel
+    ]
+    assert len({entry["sha256"] for entry in serial}) == 7
+
+    # Every map can be loaded into an environment
+    dataset = MapDataset(os.path.join(tmp_path, "parallel"))
+    assert len(dataset) == 7
+    for i in range(len(dataset)):
+        num_rows, num_cols, populated_areas, paths, paths_to_pops, _ = dataset[i]
+        FireWorld(num_rows, num_cols, populated_areas, paths, paths_to_pops)
+    dataset.close()
+
+
+def test_dataset_resumes(tmp_path):
+    """
+    Make sure that an interrupted run only regenerates missing shards.
+    """
+    directory = os.path.join(tmp_path, "maps")
+    index = generate_dataset(directory, 5, PARAMS, seed=1, maps_per_shard=2, workers=1)
+    finished_time = os.path.getmtime(os.path.join(directory, "shard-00000.npz"))
+
+    # Interrupt the last shard before its manifest was written
+    os.remove(os.path.join(directory, "shard-00002.json"))
+    os.remove(os.path.join(directory, INDEX_FILENAME))
+    resumed = generate_dataset(
+        directory, 5, PARAMS, seed=1, maps_per_shard=2, workers=1
+    )
+    assert resumed == index
+    assert os.path.getmtime(os.path.join(directory, "shard-00000.npz")) == (
+        finished_time
+    )
+    with pytest.raises(ValueError):
+        generate_dataset(directory, 5, PARAMS, seed=2, maps_per_shard=2, workers=1)
+
+
+def test_dataset_command_line(tmp_path):
+    """
+    Make sure that the command line entry point writes an index.
+    """
+    directory = os.path.join(tmp_path, "cli")
+    main(
+        [
+            directory,
+            "--num-maps",
+            "3",
+            "--num-rows",
+            "10",
+            "--num-cols",
+            "10",
+            "--num-populated-areas",
+            "2",
+            "--path-method",
+            "shortest_path",
+            "--workers",
+            "1",
+        ]
+    )
+    with open(os.path.join(directory, INDEX_FILENAME)) as f:
+        index = json.load(f)
+    assert len(index) == 3
+    assert np.all([entry["params"]["num_rows"] == 10 for entry in index])
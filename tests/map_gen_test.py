@@ -4,12 +4,19 @@ Unit tests for each of the functions in create_map_info.py
 
 import numpy as np
 from pyrorl.map_helpers.create_map_info import (
+    clustered_density,
     generate_map_info,
+    generate_pop_locations,
     MAP_DIRECTORY,
     load_map_info,
+    save_map_info,
+    save_map_info_pickle,
 )
+from pyrorl.map_helpers.generate_routes import generate_routes
 from pyrorl.envs.environment.environment import FireWorld, PATHS_INDEX, POPULATED_INDEX
 import os
+import pytest
+import random
 import shutil
 
 
@@ -128,7 +135,7 @@ def test_map_loading_and_saving():
         loaded_paths_to_pops,
         loaded_num_populated_areas,
     ) = load_map_info(map_info_path)
-    shutil.rmtree(map_info_path)
+    os.remove(map_info_path)
     if len(os.listdir(map_info_root)) == 0:
         shutil.rmtree(map_info_root)
     loaded_fireworld = FireWorld(
@@ -150,3 +157,200 @@ def test_map_loading_and_saving():
         original_fireworld.state_space[PATHS_INDEX],
         loaded_fireworld.state_space[PATHS_INDEX],
     ).all()
+
+
+def test_pop_locations_unique_and_interior():
+    """
+    Make sure that populated areas are distinct and never on the edge, even when
+    the whole interior of the map is populated.
+    """
+    num_rows, num_cols = 30, 40
+    num_interior = (num_rows - 2) * (num_cols - 2)
+    populated_areas = generate_pop_locations(num_rows, num_cols, num_interior, seed=0)
+    assert len({tuple(cell) for cell in populated_areas}) == num_interior
+    assert populated_areas[:, 0].min() == 1 and populated_areas[:, 0].max() == 28
+    assert populated_areas[:, 1].min() == 1 and populated_areas[:, 1].max() == 38
+
+    with pytest.raises(ValueError):
+        generate_pop_locations(num_rows, num_cols, num_interior + 1)
+
+
+def test_pop_locations_seed_and_density():
+    """
+    Make sure that seeded draws are reproducible and respect a density raster.
+    """
+    first = generate_pop_locations(100, 100, 50, seed=7)
+    second = generate_pop_locations(100, 100, 50, seed=7)
+    assert np.array_equal(first, second)
+
+    # Only cells with positive density can be populated
+    density = np.zeros((100, 100))
+    density[10:20, 30:40] = 1
+    density[50, 50] = 5
+    populated_areas = generate_pop_locations(100, 100, 101, seed=1, density=density)
+    assert np.all(density[populated_areas[:, 0], populated_areas[:, 1]] > 0)
+    with pytest.raises(ValueError):
+        generate_pop_locations(100, 100, 102, density=density)
+
+    # Clustered towns put populated areas near the cluster centers
+    density = clustered_density(200, 200, 3, 4, seed=2)
+    populated_areas = generate_pop_locations(200, 200, 100, seed=3, density=density)
+    assert np.all(density[populated_areas[:, 0], populated_areas[:, 1]] > 0)
+
+
+def test_seeded_map_generation():
+    """
+    Make sure that generating a map with the same seed gives the same map.
+    """
+    first = generate_map_info(40, 40, 10, save_map=False, seed=11)
+    second = generate_map_info(40, 40, 10, save_map=False, seed=11)
+    assert np.array_equal(first[0], second[0])
+    assert [list(path) for path in first[1]] == [list(path) for path in second[1]]
+    assert first[2] == second[2]
+
+
+def test_globally_seeded_map_generation():
+    """
+    Make sure that without a seed, seeding the global random and numpy random
+    states still gives the same map.
+    """
+    maps = []
+    for _ in range(2):
+        random.seed(5)
+        np.random.seed(5)
+        maps.append(generate_map_info(40, 40, 10, save_map=False))
+    first, second = maps
+    assert np.array_equal(first[0], second[0])
+    assert [list(path) for path in first[1]] == [list(path) for path in second[1]]
+    assert first[2] == second[2]
+
+    # Either global state changes the map
+    random.seed(5)
+    np.random.seed(6)
+    third = generate_map_info(40, 40, 10, save_map=False)
+    assert not np.array_equal(first[0], third[0])
+
+
+def test_shortest_path_routes():
+    """
+    Make sure that shortest path routes are contiguous, distinct, end at the
+    edge of the map, and cover every populated area.
+    """
+    num_rows, num_cols = 60, 80
+    populated_areas, paths, paths_to_pops = generate_map_info(
+        num_rows, num_cols, 20, save_map=False, seed=5, path_method="shortest_path"
+    )
+    assert len({tuple(map(tuple, path)) for path in paths}) == len(paths)
+    for path_num, path in enumerate(paths):
+        path = np.array(path)
+        pop = np.array(paths_to_pops[path_num][0])
+
+        # Each step moves to a neighboring cell, starting next to the populated area
+        steps = np.abs(np.diff(np.vstack([pop, path]), axis=0)).sum(axis=1)
+        assert np.all(steps == 1)
+        assert len({tuple(cell) for cell in path}) == len(path)
+        row, col = path[-1]
+        assert row in (0, num_rows - 1) or col in (0, num_cols - 1)
+    pops_with_paths = {tuple(pops[0]) for pops in paths_to_pops.values()}
+    assert pops_with_paths == {tuple(pop) for pop in populated_areas}
+
+    with pytest.raises(ValueError):
+        generate_map_info(10, 10, 2, save_map=False, path_method="teleport")
+
+
+def test_routes_avoid_obstacles():
+    """
+    Make sure that routes never cross obstacles, and that an enclosed populated
+    area raises an error.
+    """
+    obstacles = np.zeros((30, 30), dtype=bool)
+    obstacles[10, 5:25] = True
+    paths, _ = generate_routes(
+        30, 30, [[5, 15], [20, 20]], 3, seed=0, obstacles=obstacles
+    )
+    for path in paths:
+        path = np.array(path)
+        assert not np.any(obstacles[path[:, 0], path[:, 1]])
+
+    obstacles[4:7, 14:17] = True
+    obstacles[5, 15] = False
+    with pytest.raises(ValueError):
+        generate_routes(30, 30, [[5, 15]], 1, obstacles=obstacles)
+
+
+def test_routes_scale():
+    """
+    Make sure that routes for a large map are generated quickly.
+    """
+    populated_areas = generate_pop_locations(500, 500, 200, seed=0)
+    paths, paths_to_pops = generate_routes(500, 500, populated_areas, 3, seed=0)
+    assert len(paths) >= 200
+    assert len(paths_to_pops) == len(paths)
+
+
+def test_map_file_is_memory_mapped(tmp_path, monkeypatch):
+    """
+    Make sure that maps saved in the same second get their own file, and that
+    loading a map file maps it instead of reading it.
+    """
+    populated_areas, paths, paths_to_pops = generate_map_info(
+        20, 30, 5, save_map=False, seed=4
+    )
+    monkeypatch.chdir(tmp_path)
+    first = save_map_info(20, 30, 5, populated_areas, paths, paths_to_pops)
+    second = save_map_info(20, 30, 5, populated_areas, paths, paths_to_pops)
+    assert first != second
+
+    num_rows, num_cols, loaded_areas, loaded_paths, loaded_links, num_pops = (
+        load_map_info(first)
+    )
+    assert (num_rows, num_cols, num_pops) == (20, 30, 5)
+    assert isinstance(loaded_areas.base, np.memmap)
+    assert np.array_equal(loaded_areas, populated_areas)
+    assert [np.asarray(path).tolist() for path in loaded_paths] == [
+        list(path) for path in paths
+    ]
+    assert loaded_links == paths_to_pops
+
+
+def test_saved_map_path_has_extension(tmp_path):
+    """
+    Make sure that saving a map to a path without the map file extension
+    returns the path of the file that was actually written.
+    """
+    populated_areas, paths, paths_to_pops = generate_map_info(
+        15, 15, 4, save_map=False, seed=5
+    )
+    file_path = os.path.join(tmp_path, "map")
+    saved_path = save_map_info(
+        15, 15, 4, populated_areas, paths, paths_to_pops, file_path
+    )
+    assert saved_path == file_path + ".npy"
+    assert os.path.isfile(saved_path)
+    assert not os.path.exists(file_path)
+    assert load_map_info(saved_path)[:2] == (15, 15)
+
+    # Paths that already have the extension are kept as they are
+    assert (
+        save_map_info(15, 15, 4, populated_areas, paths, paths_to_pops, saved_path)
+        == saved_path
+    )
+
+
+def test_legacy_map_loading(tmp_path):
+    """
+    Make sure that maps saved as a directory of pickle files still load.
+    """
+    populated_areas, paths, paths_to_pops = generate_map_info(
+        15, 15, 4, save_map=False, seed=6
+    )
+    map_directory = os.path.join(tmp_path, "legacy")
+    save_map_info_pickle(
+        15, 15, 4, populated_areas, paths, paths_to_pops, map_directory
+    )
+    num_rows, num_cols, loaded_areas, loaded_paths, loaded_links, num_pops = (
+        load_map_info(map_directory)
+    )
+    assert (num_rows, num_cols, num_pops) == (15, 15, 4)
+    assert np.array_equal(loaded_areas, populated_areas)
+    assert loaded_links == paths_to_pops
@@ -0,0 +1,118 @@
+"""
+Unit tests for the background map pool in map_pool.py
+"""
+
+import gymnasium
+import numpy as np
+import pytest
+import time
+import pyrorl  # noqa: F401
+from pyrorl.map_helpers.map_pool import MapPool, staged_curriculum
+
+SMALL = {"num_rows": 10, "num_cols": 12, "num_populated_areas": 2}
+LARGE = {"num_rows": 20, "num_cols": 25, "num_populated_areas": 5}
+
+
+def test_pool_is_seeded_and_bounded():
+    """
+    Make sure that pools with the same seed serve the same maps, and that a pool
+    stops generating once its queue is full.
+    """
+    with MapPool(SMALL, capacity=3, seed=7) as first, MapPool(
+        SMALL, capacity=3, seed=7
+    ) as second:
+        for _ in range(5):
+            first_map, second_map = first.get(), second.get()
+            assert first_map[:2] == (10, 12)
+            assert np.array_equal(first_map[2], second_map[2])
+            assert first_map[4] == second_map[4]
+
+        # Nobody takes maps, so the pool fills up and waits
+        time.sleep(0.5)
+        assert first.maps.full()
+        assert first.num_generated <= first.num_served + 3 + 1
+
+
+def test_pool_curriculum():
+    """
+    Make sure that a staged curriculum switches map sizes after each stage.
+    """
+    schedule = staged_curriculum([(2, SMALL), (1, LARGE)])
+    with MapPool(schedule, capacity=2, seed=0) as pool:
+        sizes = [pool.get()[:2] for _ in range(5)]
+    assert sizes == [(10, 12), (10, 12), (20, 25), (20, 25), (20, 25)]
+
+
+def test_pool_reports_errors():
+    """
+    Make sure that a failure in the background is raised to the caller.
+    """
+    pool = MapPool({"num_rows": 3, "num_cols": 3, "num_populated_areas": 5})
+    with pytest.raises(RuntimeError):
+        pool.get()
+    pool.close()
+
+
+def test_pool_serves_finished_maps_before_errors():
+    """
+    Make sure that maps finished before a failure are still served, and the
+    failure is only raised once they are used up.
+    """
+    schedule = staged_curriculum(
+        [(2, SMALL), (1, {"num_rows": 3, "num_cols": 3, "num_populated_areas": 5})]
+    )
+    pool = MapPool(schedule, capacity=4, seed=0)
+    while pool.error is None:
+        time.sleep(0.01)
+    assert pool.get()[:2] == (10, 12)
+    assert pool.get()[:2] == (10, 12)
+    with pytest.raises(RuntimeError):
+        pool.get()
+    pool.close()
+
+
+def test_env_resets_from_pool():
+    """
+    Make sure that resetting the environment moves it to the next map.
+    """
+    schedule = staged_curriculum([(1, SMALL), (1, LARGE)])
+    with MapPool(schedule, capacity=2, seed=1) as pool:
+        num_rows, num_cols, populated_areas, paths, paths_to_pops, _ = pool.get()
+        env = gymnasium.make(
+            "pyrorl/PyroRL-v0",
+            num_rows=num_rows,
+            num_cols=num_cols,
+            populated_areas=populated_areas,
+            paths=paths,
+            paths_to_pops=paths_to_pops,
+            map_pool=pool,
+        )
+        observation, _ = env.reset()
+        assert observation.shape == (5, 20, 25)
+        assert env.observation_space.shape == (5, 20, 25)
+        assert env.action_space.n == len(env.unwrapped.fire_env.get_actions())
+        env.step(env.action_space.sample())
+
+        # Grids of a fixed size cannot follow the pool's maps
+        with pytest.raises(ValueError):
+            gymnasium.make(
+                "pyrorl/PyroRL-v0",
+                num_rows=num_rows,
+                num_cols=num_cols,
+                populated_areas=populated_areas,
+                paths=paths,
+                paths_to_pops=paths_to_pops,
+                map_pool=pool,
+                fuel_map=np.full((num_rows, num_cols), 5.0),
+            )
+
+
+def test_pool_with_processes():
+    """
+    Make sure that generating in worker processes serves the same maps.
+    """
+    with MapPool(SMALL, seed=4) as threaded, MapPool(
+        SMALL, seed=4, processes=2
+    ) as processes:
+        for _ in range(3):
+            assert threaded.get()[4] == processes.get()[4]
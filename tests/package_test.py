@@ -184,6 +184,9 @@ def test_render(mocker):
     num_drawn_rects = pygame.draw.rect.call_count
     assert num_drawn_rects == num_rows * num_cols + 6
 
+    # Closing the window releases the viewer
+    assert env.unwrapped.viewer is None
+
 
 def test_generate_gif(mocker):
     """
@@ -245,3 +248,111 @@ def test_generate_gif(mocker):
     env.unwrapped.generate_gif()
     assert os.path.exists("training.gif")
     os.remove("training.gif")
+
+
+def test_render_only_redraws_changed_squares(mocker):
+    """
+    Test that the persistent viewer only redraws squares that changed between renders.
+    """
+    # Set up parameters
+    num_rows, num_cols = 10, 10
+    populated_areas = np.array([[1, 2], [4, 8]])
+    paths = np.array([[[1, 0], [1, 1]], [[2, 9], [2, 8], [3, 8]]], dtype=object)
+    paths_to_pops = {0: [[1, 2]], 1: [[4, 8]]}
+
+    # Create environment
+    kwargs = {
+        "num_rows": num_rows,
+        "num_cols": num_cols,
+        "populated_areas": populated_areas,
+        "paths": paths,
+        "paths_to_pops": paths_to_pops,
+        "skip": True,
+    }
+    env = gymnasium.make("pyrorl/PyroRL-v0", **kwargs)
+    env.reset()
+
+    # Mock all of the Pygame elements
+    mocker.patch("pygame.display")
+    mocker.patch("pygame.draw")
+    mocker.patch("pygame.image")
+
+    # The first render draws every square and the legend
+    env.render()
+    assert pygame.draw.rect.call_count == num_rows * num_cols + 6
+    pygame.display.flip.assert_called_once()
+
+    # Rendering the same state again does not draw any squares
+    pygame.draw.rect.reset_mock()
+    env.render()
+    assert pygame.draw.rect.call_count == 0
+
+    # Only the square that changed gets redrawn
+    env.unwrapped.fire_env.state_space[0, 5, 5] = 1 - (
+        env.unwrapped.fire_env.state_space[0, 5, 5]
+    )
+    env.render()
+    assert pygame.draw.rect.call_count == 1
+    pygame.display.update.assert_called()
+    env.close()
+
+
+def test_viewer_downsamples_large_grids():
+    """
+    Test that grids with more cells than pixels are blitted as a downsampled image.
+    """
+    from pyrorl.envs.viewer import GridViewer, FIRE_COLOR
+
+    num_rows, num_cols = 2000, 3000
+    state_space = np.zeros((5, num_rows, num_cols))
+    viewer = GridViewer(num_rows, num_cols)
+
+    # The first frame covers the whole grid
+    rects = viewer.draw(state_space, [], 0)
+    assert viewer.square_dim < 1
+    assert rects[-1].size == (viewer.grid_width, viewer.grid_height)
+
+    # Setting a block on fire only updates the pixels it covers
+    state_space[0, :200, :300] = 1
+    rects = viewer.draw(state_space, [], 1)
+    assert len(rects) == 2
+    assert rects[-1].width < viewer.grid_width
+    assert rects[-1].height < viewer.grid_height
+    assert viewer.screen.get_at(rects[-1].topleft) == FIRE_COLOR
+
+    # Nothing changed, so only the timestep is redrawn
+    rects = viewer.draw(state_space, [], 2)
+    assert len(rects) == 1
+    viewer.close()
+
+
+def test_step_instrumentation():
+    """
+    Test that an instrumented environment reports step stats through info and
+    adds them up over the episode.
+    """
+    populated_areas = np.array([[1, 2], [4, 8]])
+    paths = np.array([[[1, 0], [1, 1]], [[5, 8], [6, 8], [6, 9]]], dtype=object)
+    paths_to_pops = {0: [[1, 2]], 1: [[4, 8]]}
+    kwargs = {
+        "num_rows": 10,
+        "num_cols": 10,
+        "populated_areas": populated_areas,
+        "paths": paths,
+        "paths_to_pops": paths_to_pops,
+    }
+    env = gymnasium.make("pyrorl/PyroRL-v0", **kwargs)
+    env.reset()
+    assert env.step(0)[4] == {"": ""}
+    assert env.unwrapped.get_aggregate_stats() is None
+
+    env = gymnasium.make("pyrorl/PyroRL-v0", instrument=True, **kwargs)
+    env.reset()
+    for _ in range(3):
+        observation, _, _, _, info = env.step(0)
+        assert info["stats"]["observation_bytes"] == observation.nbytes
+        assert info["stats"]["observation_seconds"] >= 0
+        assert info["stats"]["propagation_seconds"] >= 0
+    summary = env.unwrapped.get_aggregate_stats()
+    assert summary["totals"]["steps"] == 3
+    assert summary["means"]["observation_bytes"] == observation.nbytes
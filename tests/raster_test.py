@@ -0,0 +1,91 @@
+"""
+Unit tests for the raster sources in raster.py
+"""
+
+import numpy as np
+import os
+import pytest
+from pyrorl.map_helpers.raster import AsciiGridRaster, NpyRaster, RasterSource, Window
+from pyrorl.envs.environment.environment import FireWorld, FUEL_INDEX
+
+
+def write_ascii_grid(file_path, values, nodata=-9999):
+    """
+    Write values as an ESRI ASCII grid.
+    """
+    with open(file_path, "w") as f:
+        f.write("ncols " + str(values.shape[1]) + "\n")
+        f.write("nrows " + str(values.shape[0]) + "\n")
+        f.write("xllcorner 0.0\nyllcorner 0.0\ncellsize 30\n")
+        f.write("NODATA_value " + str(nodata) + "\n")
+        for row in values:
+            f.write(" ".join(str(value) for value in row) + "\n")
+
+
+def test_windowed_reads_match(tmp_path):
+    """
+    Make sure that both raster formats read the same windows.
+    """
+    values = np.arange(40 * 30, dtype=np.float64).reshape((40, 30))
+    values[5, 7] = -9999
+    npy_path = os.path.join(tmp_path, "fuel.npy")
+    np.save(npy_path, values)
+    ascii_path = os.path.join(tmp_path, "fuel.asc")
+    write_ascii_grid(ascii_path, values.astype(int))
+
+    npy, ascii_grid = NpyRaster(npy_path, nodata=-9999), AsciiGridRaster(ascii_path)
+    assert npy.shape == ascii_grid.shape == (40, 30)
+    assert ascii_grid.nodata == -9999
+
+    # Search for line breaks in small chunks, as if the file were huge
+    ascii_grid.INDEX_CHUNK = 64
+
+    window = Window(3, 4, 10, 12)
+    expected = values[3:13, 4:16]
+    for raster in [npy, ascii_grid]:
+        assert np.array_equal(raster.read(window), expected)
+        filled = raster.read(window, fill_value=0)
+        assert filled[2, 3] == 0
+        with pytest.raises(ValueError):
+            raster.read(Window(35, 0, 10, 10))
+
+    # Only the rows near the window were indexed
+    assert len(ascii_grid._line_starts) < 20
+
+
+def test_resampling(tmp_path):
+    """
+    Make sure that resampling to the simulation grid works for both methods.
+    """
+    values = np.repeat(np.repeat(np.arange(6.0).reshape((2, 3)), 4, 0), 4, 1)
+    values[0, 0] = np.nan
+    np.save(os.path.join(tmp_path, "fuel.npy"), values)
+    raster = NpyRaster(os.path.join(tmp_path, "fuel.npy"))
+
+    assert np.array_equal(raster.resample((2, 3), method="mean"), values[::4, 1::4])
+    assert np.array_equal(raster.resample((2, 3)), values[2::4, 2::4])
+    upsampled = raster.resample((16, 24), fill_value=1)
+    assert upsampled.shape == (16, 24) and upsampled[0, 0] == 1
+    with pytest.raises(ValueError):
+        raster.resample((16, 24), method="mean")
+
+    # The resampled fuel can be used directly by the simulation
+    fuel = raster.resample((4, 6), window=Window(0, 0, 8, 12), method="mean")
+    world = FireWorld(
+        4, 6, np.array([[1, 1]]), [[[0, 1]]], {0: [[1, 1]]}, fuel_map=fuel
+    )
+    assert np.array_equal(world.state_space[FUEL_INDEX], fuel)
+    with pytest.raises(ValueError):
+        FireWorld(5, 6, np.array([[1, 1]]), [[[0, 1]]], {0: [[1, 1]]}, fuel_map=fuel)
+
+
+def test_raster_sources_must_read_cells():
+    """
+    Make sure that a raster source without read_cells cannot be created.
+    """
+
+    class Incomplete(RasterSource):
+        shape = (2, 2)
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,68 @@
+"""
+Unit tests for recording and replaying episodes in recorder.py
+"""
+
+from environment_test import dummy_environment
+import numpy as np
+import os
+from pyrorl.envs.environment.environment import FIRE_INDEX
+from pyrorl.envs.environment.recorder import EpisodeRecorder, EpisodeReplay
+import pytest
+import random
+
+
+def test_replay_matches_episode(tmp_path):
+    """
+    Test that replaying a recording reproduces the state at every timestep.
+    """
+    file_path = os.path.join(tmp_path, "episode.bin")
+    test_world = dummy_environment(num_fire_cells=4)
+    states, actions, rewards = [test_world.get_state()], [], []
+
+    # Record an episode of random actions
+    with EpisodeRecorder(test_world, file_path) as recorder:
+        for _ in range(30):
+            action = random.choice(test_world.get_actions())
+            test_world.set_action(action)
+            test_world.advance_to_next_timestep()
+            reward = test_world.get_state_utility()
+            recorder.record(action, reward)
+            states.append(test_world.get_state())
+            actions.append(action)
+            rewards.append(reward)
+
+    # Seeking to each timestep, in any order, rebuilds the recorded state
+    replay = EpisodeReplay(file_path, checkpoint_interval=8)
+    assert len(replay) == 30
+    for t in [30, 3, 17, 0, 29, 8]:
+        state = replay.state_at(t)
+        state[4] = np.clip(state[4], 0, 1)
+        assert np.array_equal(state, states[t])
+
+    # Each record holds the step's action, reward and fire changes
+    for t in range(30):
+        record = replay[t]
+        assert record.timestep == t + 1
+        assert record.action == actions[t]
+        assert record.reward == rewards[t]
+        ignitions = (states[t + 1][FIRE_INDEX] == 1) & (states[t][FIRE_INDEX] == 0)
+        assert np.array_equal(record.ignitions, np.flatnonzero(ignitions))
+
+
+def test_replay_ignores_partial_record(tmp_path):
+    """
+    Test that a record cut off mid-write (e.g. by a crash) is skipped.
+    """
+    file_path = os.path.join(tmp_path, "episode.bin")
+    test_world = dummy_environment(num_fire_cells=4)
+    with EpisodeRecorder(test_world, file_path) as recorder:
+        for _ in range(3):
+            test_world.advance_to_next_timestep()
+            recorder.record(test_world.get_actions()[-1])
+
+    with open(file_path, "r+b") as f:
+        f.truncate(os.path.getsize(file_path) - 4)
+    replay = EpisodeReplay(file_path)
+    assert len(replay) == 2
+    with pytest.raises(IndexError):
+        replay[2]
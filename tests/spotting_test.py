@@ -0,0 +1,90 @@
+"""
+Unit tests for ember spotting in spotting.py
+"""
+
+import numpy as np
+import pytest
+import torch
+from pyrorl.envs.environment.environment import FireWorld, FIRE_INDEX
+from pyrorl.envs.environment.spotting import (
+    SpottingModel,
+    check_spotting_model,
+    sample_embers,
+)
+
+
+def test_embers_follow_the_wind():
+    """
+    Make sure that embers land downwind of the burning cells, far beyond the
+    fire kernel, and never off the grid.
+    """
+    torch.manual_seed(0)
+    fire = np.zeros((4, 60, 60))
+    fire[:, 30, 10] = 1
+    model = SpottingModel(
+        ember_rate=50, mean_distance=20, scatter=1, ignition_probability=1
+    )
+
+    # An angle of 0 blows towards higher column numbers
+    batch, rows, cols = sample_embers(fire, model, wind_angle=0)
+    assert len(cols) > 100
+    assert set(batch.tolist()) == {0, 1, 2, 3}
+    assert np.mean(cols) > 20 and np.max(cols) > 30
+    assert np.all(np.abs(rows - 30) < 10)
+    assert np.all((cols >= 0) & (cols < 60))
+
+    # An angle of pi / 2 blows towards lower row numbers
+    rows, cols = sample_embers(fire[0], model, wind_angle=np.pi / 2)
+    assert np.mean(rows) < 20
+    assert np.all(np.abs(cols - 10) < 10)
+
+
+def test_no_embers_without_burning_cells():
+    """
+    Make sure that nothing is ignited when nothing burns or no embers are
+    thrown.
+    """
+    model = SpottingModel()
+    rows, cols = sample_embers(np.zeros((10, 10)), model)
+    assert len(rows) == len(cols) == 0
+
+    fire = np.ones((10, 10))
+    rows, cols = sample_embers(fire, model._replace(ember_rate=0))
+    assert len(rows) == 0
+
+    for invalid in [
+        model._replace(ember_rate=-1),
+        model._replace(mean_distance=0),
+        model._replace(ignition_probability=2),
+    ]:
+        with pytest.raises(ValueError):
+            check_spotting_model(invalid)
+
+
+def test_spotting_in_fire_world():
+    """
+    Make sure that spotting ignites cells out of reach of the fire kernel, in
+    both stepped and batched simulations.
+    """
+    populated_areas = np.array([[1, 2]])
+    paths = [[[1, 1], [1, 0]]]
+    paths_to_pops = {0: [[1, 2]]}
+    torch.manual_seed(1)
+    world = FireWorld(
+        40,
+        40,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        custom_fire_locations=np.array([[20, 5]]),
+        wind_speed=10,
+        wind_angle=0,
+        fire_propagation_rate=0,
+        spotting=SpottingModel(5, 15, 1, 1),
+    )
+    world.sample_fire_propogation()
+    burning = np.argwhere(world.state_space[FIRE_INDEX] == 1)
+    assert np.max(burning[:, 1]) > 7
+
+    result = world.rollout(None, 3, n=2, summaries=("final_state",))
+    assert np.any(result["final_state"][:, FIRE_INDEX, :, 8:] == 1)
@@ -0,0 +1,150 @@
+"""
+Unit tests for switching between propagation strategies in strategy.py
+"""
+
+import numpy as np
+import pytest
+import torch
+from pyrorl.envs.environment.environment import FireWorld, FIRE_INDEX
+from pyrorl.envs.environment.environment_constant import set_fire_mask
+from pyrorl.envs.environment.propagation import ignition_probability
+from pyrorl.envs.environment.strategy import AutoPropagator
+
+
+def make_propagator(num_rows=100, num_cols=100, **kwargs):
+    """
+    Set up a propagator with the default shared fire mask.
+    """
+    mask = torch.from_numpy(set_fire_mask(0.3))
+    return AutoPropagator(
+        mask,
+        lambda fire: ignition_probability(fire, mask),
+        num_rows,
+        num_cols,
+        **kwargs
+    )
+
+
+def test_strategy_follows_fire_size():
+    """
+    Make sure that the strategy changes with the fraction of burning cells, and
+    only switches back once the fraction is clearly past the bound.
+    """
+    propagator = make_propagator()
+    assert propagator.choose(0.001) == "frontier"
+    assert propagator.choose(0.022) == "frontier"
+    assert propagator.choose(0.03) == "bitboard"
+    assert propagator.choose(0.018) == "bitboard"
+    assert propagator.choose(0.5) == "dense"
+    assert propagator.choose(0.13) == "dense"
+    assert propagator.choose(0.001) == "frontier"
+    assert propagator.num_switches == 0
+
+    # Small grids are always dense, and per-cell masks have no bitboard
+    assert make_propagator(10, 10).choose(0.001) == "dense"
+    per_cell = AutoPropagator(
+        torch.from_numpy(set_fire_mask()).expand(25, 10000), None, 100, 100
+    )
+    assert per_cell.strategies == ["frontier", "dense"]
+    with pytest.raises(ValueError):
+        make_propagator(sparse_fraction=0.5, dense_fraction=0.1)
+
+
+def test_strategies_share_a_distribution():
+    """
+    Make sure that every strategy ignites cells as often as the dense kernel
+    says they should.
+    """
+    torch.manual_seed(0)
+    fire = np.zeros((300, 100, 100))
+    fire[:, 50, 50] = 1
+    mask = make_propagator().fire_mask
+    expected = ignition_probability(torch.from_numpy(fire[0]), mask).numpy()
+    expected = np.maximum(expected, fire[0])
+
+    # Bounds that make a single burning cell pick each strategy in turn
+    for strategy, sparse_fraction, dense_fraction in [
+        ("frontier", 0.02, 0.15),
+        ("bitboard", 0, 1),
+        ("dense", 0, 0),
+    ]:
+        propagator = make_propagator(
+            sparse_fraction=sparse_fraction, dense_fraction=dense_fraction
+        )
+        result = fire.copy()
+        propagator.ignite(result)
+        assert propagator.last_strategy == strategy
+        assert np.abs(result.mean(axis=0) - expected).max() < 0.1
+
+
+def test_auto_engine_reports_strategy():
+    """
+    Make sure that FireWorld reports which strategy sampled each step.
+    """
+    populated_areas = np.array([[1, 2]])
+    paths = [[[1, 1], [1, 0]]]
+    paths_to_pops = {0: [[1, 2]]}
+    torch.manual_seed(0)
+    world = FireWorld(
+        100,
+        100,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        custom_fire_locations=np.array([[50, 50]]),
+        fuel_map=np.full((100, 100), 100.0),
+        fire_propagation_rate=0.5,
+        propagation_engine="auto",
+    )
+    assert world.get_propagation_strategy() is None
+    strategies = []
+    for _ in range(40):
+        world.advance_to_next_timestep()
+        strategies.append(world.get_propagation_strategy())
+    assert strategies[0] == "frontier"
+    assert strategies[-1] == "dense"
+    assert world.propagator.num_switches >= 2
+    assert sum(world.propagator.strategy_steps.values()) == 40
+    assert world.state_space[FIRE_INDEX].mean() > 0.15
+
+
+def test_batched_runs_keep_world_strategy():
+    """
+    Make sure that rollouts and burn probabilities use their own propagator, so
+    the strategy a world reports and its switching state only follow its own
+    steps, and that instrumented steps count the strategies.
+    """
+    populated_areas = np.array([[1, 2]])
+    paths = [[[1, 1], [1, 0]]]
+    paths_to_pops = {0: [[1, 2]]}
+    torch.manual_seed(0)
+    world = FireWorld(
+        100,
+        100,
+        populated_areas,
+        paths,
+        paths_to_pops,
+        custom_fire_locations=np.array([[50, 50]]),
+        fuel_map=np.full((100, 100), 100.0),
+        fire_propagation_rate=0.5,
+        propagation_engine="auto",
+        instrument=True,
+    )
+    for _ in range(3):
+        world.advance_to_next_timestep()
+    assert world.get_propagation_strategy() == "frontier"
+    assert world.get_step_stats()["strategy_frontier"] == 1
+
+    # Batched runs long enough to reach the dense strategy
+    propagator = world.propagator
+    steps, current = dict(propagator.strategy_steps), propagator.current
+    world.rollout(None, 40, n=2)
+    world.burn_probability(40, num_samples=2)
+    assert world._batch_propagator.strategy_steps["dense"] > 0
+    assert world.propagator is propagator
+    assert propagator.strategy_steps == steps
+    assert propagator.current == current
+    assert world.get_propagation_strategy() == "frontier"
+
+    world.advance_to_next_timestep()
+    assert world.get_aggregate_stats()["totals"]["strategy_frontier"] == 4
@@ -0,0 +1,92 @@
+"""
+Unit tests for procedural terrain in terrain.py and lazily loaded fuel
+"""
+
+import numpy as np
+import pytest
+from pyrorl.map_helpers.raster import Window, WindowedRaster
+from pyrorl.map_helpers.terrain import ProceduralTerrain
+from pyrorl.envs.environment.environment import FireWorld, FIRE_INDEX, FUEL_INDEX
+
+
+def test_tiles_are_deterministic_and_seamless():
+    """
+    Make sure that any part of the field can be generated on its own and agrees
+    with the tiles around it.
+    """
+    terrain = ProceduralTerrain((10**9, 10**9), seed=3, tile_size=32)
+    window = Window(10**8 + 20, 5 * 10**7 + 50, 40, 70)
+    values = terrain.read(window)
+    assert values.shape == (40, 70)
+    assert terrain.num_generated_tiles == 2 * 3
+
+    # The same cells straight from the noise, and from a new field
+    rows = np.arange(window.row_off, window.row_off + 40)
+    cols = np.arange(window.col_off, window.col_off + 70)
+    assert np.array_equal(values, terrain.noise(rows, cols))
+    other = ProceduralTerrain((10**9, 10**9), seed=3, tile_size=50)
+    assert np.allclose(values, other.read(window))
+    different = ProceduralTerrain((10**9, 10**9), seed=4, tile_size=32)
+    assert not np.allclose(values, different.read(window))
+
+
+def test_terrain_statistics_and_cache():
+    """
+    Make sure that the field has about the requested mean and standard
+    deviation, is spatially correlated, and keeps a bounded number of tiles.
+    """
+    terrain = ProceduralTerrain(
+        (2048, 2048), seed=0, mean=5, stdev=2, scale=32, max_cached_tiles=4
+    )
+    values = terrain.read()
+    assert abs(values.mean() - 5) < 0.5
+    assert abs(values.std() - 2) < 0.5
+    neighbors = np.corrcoef(values[:, :-1].ravel(), values[:, 1:].ravel())[0, 1]
+    assert neighbors > 0.9
+    assert len(terrain.tiles) == 4
+
+    with pytest.raises(ValueError):
+        ProceduralTerrain((0, 10))
+
+
+def test_fuel_loads_as_fire_spreads():
+    """
+    Make sure that the simulation only reads the fuel of tiles the fire reaches.
+    """
+    terrain = ProceduralTerrain((10**6, 10**6), seed=1, mean=20, stdev=1)
+    fuel_map = WindowedRaster(terrain, Window(5000, 5000, 256, 256))
+    world = FireWorld(
+        256,
+        256,
+        np.array([[10, 10]]),
+        [[[10, 9], [10, 8]]],
+        {0: [[10, 10]]},
+        custom_fire_locations=np.array([[130, 130]]),
+        fuel_map=fuel_map,
+    )
+    assert world.fuel_loaded.sum() == 1
+    assert world.state_space[FUEL_INDEX, 130, 130] == terrain.read(
+        Window(5130, 5130, 1, 1)
+    )
+    assert np.all(world.state_space[FUEL_INDEX, :128, :128] == 0)
+    snapshot = world.snapshot()
+
+    # Burning cells always have their fuel
+    for _ in range(15):
+        world.advance_to_next_timestep()
+        fire_rows, fire_cols = np.nonzero(world.state_space[FIRE_INDEX])
+        assert np.all(world.fuel_loaded[fire_rows // 128, fire_cols // 128])
+    assert world.fuel_loaded.sum() > 1
+
+    # Restoring forgets fuel read since the snapshot
+    world.restore(snapshot)
+    assert world.fuel_loaded.sum() == 1
+
+    # Rollouts and burn probabilities load fuel into their own copies only
+    state = world.state_space.copy()
+    result = world.rollout(None, 20, n=2, summaries=("final_state",))
+    assert np.any(result["final_state"][:, FUEL_INDEX, :128, :128] > 0)
+    probability, _ = world.burn_probability(20, num_samples=4)
+    assert np.any(probability[:128, :128] > 0)
+    assert world.fuel_loaded.sum() == 1
+    assert np.array_equal(world.state_space, state)